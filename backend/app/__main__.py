@@ -0,0 +1,23 @@
+"""生产启动入口：python -m app
+
+worker 数、端口、日志级别都取自 Settings（环境变量 / .env），与 app.config 中按 WORKERS
+平分 DuckDB 预算用的是同一份配置，不会出现启动参数与配置不一致。
+"""
+
+import uvicorn
+
+from app.config import settings
+
+
+def main() -> None:
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.WORKERS,
+        log_level=settings.LOG_LEVEL.lower(),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,38 @@
 """管理面板 API 端点"""
 
+import asyncio
+import hashlib
+import hmac
 import logging
+import time
 import uuid
 
 from fastapi import APIRouter, Depends, Header, HTTPException
 
 from app.config import settings
 from app.services.cache_service import search_cache
-from app.services.search_service import search_service
+from app.services.search_service import DatasetReloadError, search_service
 from app.services.stats_service import stats_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 内存 token 存储（重启失效）
-_active_tokens: set[str] = set()
+
+def _sign(payload: str) -> str:
+    return hmac.new(
+        settings.ADMIN_PASSWORD.encode(), payload.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def _issue_token() -> str:
+    """签发 token：{过期时间戳}.{随机串}.{HMAC}
+
+    以 ADMIN_PASSWORD 为密钥签名、不落地存储，任一 worker 签发的 token 在所有 worker 上有效；
+    修改密码后旧 token 全部失效。
+    """
+    payload = f"{int(time.time()) + settings.ADMIN_TOKEN_TTL}.{uuid.uuid4().hex}"
+    return f"{payload}.{_sign(payload)}"
 
 
 def _require_admin(authorization: str | None = Header(default=None)) -> str:
@@ -23,7 +40,14 @@ def _require_admin(authorization: str | None = Header(default=None)) -> str:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="未提供认证信息")
     token = authorization.removeprefix("Bearer ").strip()
-    if token not in _active_tokens:
+    payload, _, signature = token.rpartition(".")
+    expires_at = payload.partition(".")[0]
+    if (
+        not settings.ADMIN_PASSWORD
+        or not expires_at.isdigit()
+        or not hmac.compare_digest(signature, _sign(payload))
+        or int(expires_at) < time.time()
+    ):
         raise HTTPException(status_code=401, detail="无效或过期的 token")
     return token
 
@@ -39,16 +63,15 @@ async def admin_login(body: dict):
         logger.warning("管理面板登录失败: 密码错误")
         raise HTTPException(status_code=401, detail="密码错误")
 
-    token = uuid.uuid4().hex
-    _active_tokens.add(token)
+    token = _issue_token()
     logger.info("管理面板登录成功")
     return {"token": token}
 
 
 @router.get("/stats")
 async def get_stats(_: str = Depends(_require_admin)):
-    """获取搜索统计 + 访问量统计"""
-    return stats_service.get_stats()
+    """获取搜索统计 + 访问量统计（需读取其他 worker 的快照文件，在线程中执行）"""
+    return await asyncio.to_thread(stats_service.get_stats)
 
 
 @router.get("/system")
@@ -59,14 +82,22 @@ async def get_system_status(_: str = Depends(_require_admin)):
 
     process = psutil.Process(os.getpid())
     mem_info = process.memory_info()
+    # 共享缓存后端的统计需访问 SQLite / Redis，在线程中执行
+    cache_stats = await asyncio.to_thread(search_cache.stats)
 
     return {
         "duckdb": {
             "initialized": search_service._initialized,
             "mode": "remote_obs" if search_service._use_remote else "local",
             "parquet_path": search_service.parquet_path,
+            "pool": search_service.pool_stats(),
+            "executor": search_service.executor_stats(),
+            "materialized": search_service.materialized_stats(),
+            "index": search_service.index_stats(),
+            "remote_cache": search_service.remote_cache_stats(),
         },
-        "cache": search_cache.stats(),
+        "dataset": search_service.dataset_stats(),
+        "cache": cache_stats,
         "memory": {
             "rss_mb": round(mem_info.rss / 1024 / 1024, 1),
             "vms_mb": round(mem_info.vms / 1024 / 1024, 1),
@@ -76,13 +107,46 @@ async def get_system_status(_: str = Depends(_require_admin)):
 
 @router.get("/cache")
 async def get_cache_stats(_: str = Depends(_require_admin)):
-    """获取缓存统计"""
-    return search_cache.stats()
+    """获取缓存统计（共享后端有 IO，在线程中执行）"""
+    return await asyncio.to_thread(search_cache.stats)
 
 
 @router.delete("/cache")
 async def clear_cache(_: str = Depends(_require_admin)):
-    """清空搜索缓存"""
-    search_cache.clear()
+    """清空搜索缓存（共享后端有 IO，在线程中执行）"""
+    await asyncio.to_thread(search_cache.clear)
     logger.info("管理员清空了搜索缓存")
     return {"message": "缓存已清空"}
+
+
+@router.post("/dataset/reload")
+async def reload_dataset(force: bool = False, _: str = Depends(_require_admin)):
+    """热重载 Parquet 数据集（本 worker 立即切换，其他 worker 由文件轮询跟进）"""
+    try:
+        result = await search_service.reload(force=force)
+    except DatasetReloadError as e:
+        logger.warning("数据集热重载被拒绝: %s", e)
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    logger.info("管理员触发数据集热重载: changed=%s", result["changed"])
+    return result
+
+
+@router.get("/slow-queries")
+async def list_slow_queries(_: str = Depends(_require_admin)):
+    """慢查询记录（本 worker，最新的在前），含分阶段耗时与 EXPLAIN ANALYZE 概要"""
+    return {
+        "threshold": settings.SLOW_QUERY_THRESHOLD,
+        "capacity": search_service.slow_queries.capacity,
+        "profile": settings.SLOW_QUERY_PROFILE,
+        "entries": search_service.slow_queries.entries(),
+    }
+
+
+@router.post("/slow-queries/{entry_id}/profile")
+async def reprofile_slow_query(entry_id: int, _: str = Depends(_require_admin)):
+    """按需重新跑一次慢查询的 EXPLAIN ANALYZE，返回更新后的记录"""
+    entry = await search_service.reprofile_slow_query(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="慢查询记录不存在（可能已被挤出或属于其他 worker）")
+    logger.info("管理员重新分析慢查询: id=%d, status=%s", entry_id, entry["profile_status"])
+    return entry
@@ -0,0 +1,19 @@
+"""Prometheus 指标端点（挂在根路径 /metrics，不带 /api 前缀）"""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Response
+
+from app.config import settings
+from app.services.metrics import CONTENT_TYPE, metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """汇总所有 worker 的指标，输出 Prometheus 文本格式"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    body = await asyncio.to_thread(metrics.collect, settings.METRICS_FILE_PATH)
+    return Response(content=body, media_type=CONTENT_TYPE)
@@ -1,10 +1,17 @@
+import asyncio
 import logging
 import time
+from typing import Awaitable, TypeVar
 
 from fastapi import APIRouter, HTTPException, Query, Request
 
+from app.config import settings
+from app.core.timing import collect_stages, stage
 from app.schemas.search import BookFormat, BookResult, SearchResponse
 from app.services.cache_service import search_cache
+from app.services.query_executor import QueryCancelled, QueryOverloaded
+from app.services.result_set import can_refine, refine, slice_page
+from app.services.search_cursor import decode_cursor, encode_cursor
 from app.services.search_service import search_service
 from app.services.stats_service import stats_service
 
@@ -12,6 +19,58 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+T = TypeVar("T")
+
+# 等待查询期间检查客户端是否断开的间隔（秒）
+_DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def _cancel_on_disconnect(request: Request, coro: Awaitable[T]) -> T:
+    """等待 coro，客户端中途断开时取消它（进而中断正在执行的 DuckDB 查询）"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("客户端已断开，取消搜索: url=%s", request.url)
+                raise HTTPException(status_code=499, detail="客户端已断开")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _build_response(result: dict, page: int, page_size: int, query: dict) -> SearchResponse:
+    results = [
+        BookResult(
+            id=book["id"],
+            title=book["title"],
+            author=book["author"],
+            formats=[
+                BookFormat(
+                    extension=fmt["extension"],
+                    filesize=fmt["filesize"] or None,
+                    download_url="",
+                    md5=fmt["md5"],
+                )
+                for fmt in book["formats"]
+            ],
+        )
+        for book in result["books"]
+    ]
+    return SearchResponse(
+        total=result["total_hits"],
+        page=page,
+        page_size=page_size,
+        results=results,
+        total_books=result["total_books"],
+        next_cursor=(
+            encode_cursor(result["next_key"], **query)
+            if result["next_key"] else None
+        ),
+    )
+
 
 @router.get("/search", response_model=SearchResponse)
 async def search_books(
@@ -21,6 +80,7 @@ async def search_books(
     author: str | None = Query(None, max_length=200, description="作者搜索"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页条数"),
+    cursor: str | None = Query(None, max_length=512, description="上一页返回的 next_cursor，给出时忽略 page"),
 ):
     """搜索电子书：支持 title/author 分字段搜索（AND 关系），兼容旧版 q 参数"""
     # 至少需要提供一个搜索条件
@@ -35,111 +95,111 @@ async def search_books(
         search_q = q.strip() if q else None
 
     logger.info(
-        "收到搜索请求: q=%s, title=%s, author=%s, page=%d, page_size=%d",
-        search_q, search_title, search_author, page, page_size,
+        "收到搜索请求: q=%s, title=%s, author=%s, page=%d, page_size=%d, cursor=%s",
+        search_q, search_title, search_author, page, page_size, cursor,
     )
     start_time = time.time()
     client_ip = request.client.host if request.client else "unknown"
 
-    # 缓存 key 使用 title/author（旧版 q 统一映射到 title）
-    cache_title = search_title or (search_q or "")
-    cache_author = search_author
-
-    # 检查缓存
-    cached = search_cache.get(cache_title, cache_author, page, page_size)
-    if cached is not None:
-        elapsed = time.time() - start_time
-        stats_label = " | ".join(filter(None, [search_title, search_author, search_q or ""]))
-        stats_service.record_search(stats_label, elapsed, client_ip)
-        logger.info("搜索缓存命中: title=%s, author=%s, elapsed=%.3fs", cache_title, cache_author, elapsed)
-        return cached
-
-    # 未命中，查询 DuckDB
-    try:
-        result = await search_service.search(
-            search_q, page, page_size,
-            title=search_title or None,
-            author=search_author or None,
+    # 游标指纹区分旧版 q 与 title/author 分字段搜索，与结果集缓存 key 一致
+    cursor_query = {"query": search_q or "", "title": search_title, "author": search_author}
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, **cursor_query)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor 无效或与当前搜索条件不匹配")
+
+    async def guarded(coro: Awaitable[dict]) -> dict:
+        """DuckDB 查询的异常统一映射为 HTTP 错误"""
+        try:
+            return await coro
+        except QueryCancelled:
+            raise HTTPException(status_code=504, detail="搜索超时，请尝试更具体的关键词")
+        except QueryOverloaded as e:
+            raise HTTPException(
+                status_code=503,
+                detail="搜索请求过多，请稍后重试",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except (RuntimeError, OSError) as e:
+            logger.error(
+                "搜索服务不可用: title=%s, author=%s, q=%s, error=%s: %s",
+                search_title, search_author, search_q, type(e).__name__, e,
+            )
+            raise HTTPException(status_code=503, detail="搜索服务暂时不可用，请稍后重试")
+        except Exception:
+            logger.exception(
+                "搜索时发生未预期错误: title=%s, author=%s, q=%s", search_title, search_author, search_q
+            )
+            raise HTTPException(status_code=500, detail="Internal search error")
+
+    # 各阶段耗时（缓存查找、DuckDB 查询、内存排序切片、响应构建）按命中与否、本地/远程分别统计
+    with collect_stages() as timings:
+        version = await search_service.dataset_version()
+        terms = search_service.refinable_terms(
+            search_q, search_title or None, search_author or None
         )
-    except (RuntimeError, OSError) as e:
-        logger.error(
-            "搜索服务不可用: title=%s, author=%s, q=%s, error=%s: %s",
-            search_title, search_author, search_q, type(e).__name__, e,
+        refined = False
+
+        async def load_result_set() -> dict:
+            nonlocal refined
+            # 新查询词是某个已缓存完整结果集的延长时，直接在内存中过滤
+            if terms is not None:
+                parent = await search_cache.find(version, lambda meta: can_refine(meta, terms))
+                if parent is not None:
+                    refined = True
+                    with stage("rank"):
+                        return refine(parent, terms)
+            return await guarded(search_service.search_ranked(
+                search_q,
+                title=search_title or None,
+                author=search_author or None,
+                limit=settings.CACHE_RESULT_SET_BOOKS,
+            ))
+
+        # 每个查询只缓存一份排序结果集，所有页从中切片；未命中时合并相同查询的并发请求
+        # （key 带数据集版本，替换 Parquet 后自动失效）
+        cache_key = search_cache.make_key(
+            version=version,
+            query=search_q or "",
+            title=search_title,
+            author=search_author,
         )
-        raise HTTPException(status_code=503, detail="搜索服务暂时不可用，请稍后重试")
-    except Exception:
-        logger.exception("搜索时发生未预期错误: title=%s, author=%s, q=%s", search_title, search_author, search_q)
-        raise HTTPException(status_code=500, detail="Internal search error")
-
-    hits = result["hits"]
-
-    # 按 title+author 合并多格式
-    merged: dict[str, dict] = {}
-    for hit in hits:
-        hit_title = (hit.get("title") or "").strip()
-        hit_author = (hit.get("author") or "").strip()
-        merge_key = (hit_title.lower(), hit_author.lower())
-
-        extension = hit.get("extension", "")
-        filesize = hit.get("filesize")
-
-        fmt = BookFormat(
-            extension=extension,
-            filesize=filesize if filesize else None,
-            download_url="",
-            md5=hit.get("id", ""),
+        result_set, source = await _cancel_on_disconnect(
+            request, search_cache.get_or_compute(cache_key, load_result_set)
         )
-
-        if merge_key not in merged:
-            merged[merge_key] = {
-                "id": hit.get("id", ""),
-                "title": hit_title,
-                "author": hit_author or None,
-                "formats": [fmt],
-            }
-        else:
-            merged[merge_key]["formats"].append(fmt)
-
-    # 相关性排序：基于 title 字段（分字段搜索用 search_title，旧版用 q）
-    sort_term = (search_title or search_q or "").strip().lower()
-
-    def relevance_key(item: dict) -> tuple:
-        t = (item.get("title") or "").lower()
-        if t == sort_term:
-            rank = 0
-        elif t.startswith(sort_term):
-            rank = 1
-        elif sort_term in t:
-            rank = 2
-        else:
-            rank = 3
-        return (rank, len(t))
-
-    sorted_items = sorted(merged.values(), key=relevance_key)
-
-    # 在 Python 层分页（因为 SQL 获取了较大批次用于排序）
-    start = (page - 1) * page_size
-    page_items = sorted_items[start:start + page_size]
-    results = [BookResult(**item) for item in page_items]
-
-    response = SearchResponse(
-        total=result["total_hits"],
-        page=page,
-        page_size=page_size,
-        results=results,
-        total_books=len(results),
-    )
-
-    # 写入缓存
-    response_dict = response.model_dump()
-    search_cache.put(cache_title, cache_author, page, page_size, response_dict)
+        if source == "miss" and refined:
+            source = "refined"
+        with stage("rank"):
+            result = slice_page(result_set, page, page_size, after)
+        if result is None:
+            # 超出缓存前缀的深翻页：直接分页查询，不进缓存
+            source = "deep"
+            result = await _cancel_on_disconnect(request, guarded(search_service.search(
+                search_q, page, page_size,
+                title=search_title or None,
+                author=search_author or None,
+                after=after,
+            )))
+
+        with stage("serialize"):
+            response = _build_response(result, page, page_size, cursor_query)
 
     elapsed = time.time() - start_time
     stats_label = " | ".join(filter(None, [search_title, search_author, search_q or ""]))
-    stats_service.record_search(stats_label, elapsed, client_ip)
+    stats_service.record_search(
+        stats_label, elapsed, client_ip,
+        stages=timings,
+        cache="hit" if source in ("hit", "refined") else "miss",
+        mode="remote" if search_service._use_remote else "local",
+    )
 
     logger.info(
-        "搜索响应: title=%s, author=%s, q=%s, total=%d, total_books=%d, page=%d, elapsed=%.2fs",
-        search_title, search_author, search_q, response.total, response.total_books, response.page, elapsed,
+        "搜索响应: title=%s, author=%s, q=%s, total=%d, total_books=%d, page=%d, "
+        "source=%s, elapsed=%.3fs",
+        search_title, search_author, search_q, response.total, response.total_books,
+        response.page, source, elapsed,
     )
     return response
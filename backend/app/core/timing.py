@@ -0,0 +1,60 @@
+"""请求内分阶段计时：搜索路由开启收集，缓存、DuckDB 等各处用 stage() 标记耗时
+
+计时结果放在 contextvar 中，asyncio Task 与查询线程池会复制上下文，
+因此在后台 Task 或线程中执行的阶段也计入发起请求的那一份。
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+_stages: ContextVar[dict[str, float] | None] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stages() -> Iterator[dict[str, float]]:
+    """开启本请求的阶段计时，产出 {阶段: 累计秒数}"""
+    timings: dict[str, float] = {}
+    token = _stages.set(timings)
+    try:
+        yield timings
+    finally:
+        _stages.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录一个阶段的耗时（同名阶段累加）；未开启收集时不做任何事"""
+    timings = _stages.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def measure_stages() -> Iterator[dict[str, float]]:
+    """单独统计代码块内各阶段的耗时，退出时填入产出的 dict；外层已在收集时照常累计到外层"""
+    outer = _stages.get()
+    measured: dict[str, float] = {}
+    if outer is None:
+        try:
+            with collect_stages() as timings:
+                yield measured
+        finally:
+            measured.update(timings)
+        return
+    before = dict(outer)
+    try:
+        yield measured
+    finally:
+        measured.update(
+            (name, seconds - before.get(name, 0.0))
+            for name, seconds in outer.items()
+            if seconds != before.get(name, 0.0)
+        )
@@ -0,0 +1,19 @@
+"""worker 进程标识：多 worker 共用 ./data 下的文件时，用来区分文件属于哪个进程、该进程是否还在运行"""
+
+import os
+
+import psutil
+
+
+def worker_id(pid: int | None = None) -> str:
+    """pid + 进程启动时间（毫秒），避免容器重启后 pid 复用把旧文件误认为属于存活进程"""
+    pid = os.getpid() if pid is None else pid
+    return f"{pid}-{int(psutil.Process(pid).create_time() * 1000)}"
+
+
+def is_worker_alive(wid: str) -> bool:
+    pid, _, _ = wid.partition("-")
+    try:
+        return worker_id(int(pid)) == wid
+    except (ValueError, psutil.Error):
+        return False
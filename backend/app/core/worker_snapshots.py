@@ -0,0 +1,115 @@
+"""多 worker 快照存储：每个 worker 的累计值写在 {path}.workers/{worker_id}.json，
+已退出 worker 的快照合并进 path（基线）后删除；读取方汇总 基线 + 各 worker 快照
+
+快照是可合并的累计值（计数、草图、直方图），大小固定，写入开销与运行时长无关。
+写入先写临时文件并 fsync 再原子替换，进程崩溃或断电不会留下写了一半的文件。
+合并是幂等的：基线记录最近一次并入的快照文件名（folded），写入基线后、删除快照前崩溃时，
+下次合并只删除这些文件而不会重复计入。所有方法都有文件 IO，调用方需持有 locked() 的锁，
+并放在线程中执行，不要阻塞事件循环。
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import orjson
+
+from app.core.file_lock import FileLock
+from app.core.worker import is_worker_alive
+
+logger = logging.getLogger(__name__)
+
+
+def read_json(path: Path) -> dict:
+    """读取快照，不存在或损坏时返回空 dict（损坏时记录日志）"""
+    try:
+        return orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.exception("快照读取失败: path=%s", path)
+        return {}
+
+
+def write_json(path: Path, data: dict) -> None:
+    """先写临时文件并 fsync，再原子替换"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(orjson.dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class WorkerSnapshots:
+    """path 对应的基线文件与各 worker 快照；merge 把多份快照合并为一份"""
+
+    def __init__(self, path: str | Path, merge: Callable[[list[dict]], dict], worker: str):
+        self.path = Path(path)
+        self.workers_dir = self.path.with_name(self.path.name + ".workers")
+        self.own_file = self.workers_dir / f"{worker}.json"
+        self._merge = merge
+
+    def locked(self) -> FileLock:
+        return FileLock(self.path.with_name(self.path.name + ".lock"))
+
+    def worker_files(self) -> list[Path]:
+        return sorted(self.workers_dir.glob("*.json")) if self.workers_dir.is_dir() else []
+
+    def write(self, snapshot: dict) -> None:
+        """写出本进程的快照"""
+        write_json(self.own_file, snapshot)
+
+    def read(self) -> list[dict]:
+        """基线与其他 worker 的快照（不含本进程，调用方使用内存中的实时数据）"""
+        return [
+            self._read_baseline(),
+            *(read_json(f) for f in self.worker_files() if f != self.own_file),
+        ]
+
+    def compact(self, own: dict | None = None) -> int:
+        """把已退出 worker 的快照并入基线并删除；给出 own（本进程最终的累计值）时一并并入
+
+        返回并入的快照数。
+        """
+        baseline = self._read_baseline()
+        folded = set(baseline.get("folded", []))
+        done: list[Path] = []
+        snapshots: list[dict] = []
+        for f in self.worker_files():
+            if f == self.own_file or is_worker_alive(f.stem):
+                continue
+            if f.name in folded:
+                # 上次已并入基线、删除前进程退出
+                f.unlink(missing_ok=True)
+                continue
+            done.append(f)
+            snapshots.append(read_json(f))
+        if own is not None:
+            done.append(self.own_file)
+            snapshots.append(own)
+        if not snapshots:
+            return 0
+        merged = self._merge([baseline, *snapshots])
+        merged["folded"] = [f.name for f in done]
+        write_json(self.path, merged)
+        for f in done:
+            f.unlink(missing_ok=True)
+        logger.info("快照已合并: %s, 快照数=%d", self.path, len(snapshots))
+        return len(snapshots)
+
+    def _read_baseline(self) -> dict:
+        """读取基线；文件损坏时改名保留现场并从空基线继续，避免合并时把它覆盖掉"""
+        try:
+            return orjson.loads(self.path.read_bytes())
+        except FileNotFoundError:
+            return {}
+        except orjson.JSONDecodeError:
+            broken = self.path.with_name(f"{self.path.name}.corrupt-{int(time.time())}")
+            os.replace(self.path, broken)
+            logger.error("基线文件损坏，已改名为 %s，从空基线继续", broken)
+            return {}
@@ -20,11 +20,13 @@ try:
     from slowapi.middleware import SlowAPIMiddleware
     from slowapi.util import get_remote_address
 
+    from app.api.v1 import metrics as metrics_api
     from app.api.v1.router import api_router
     from app.config import settings
     from app.core.logging_config import setup_logging
     from app.database import close_db, init_db
     from app.services.cache_service import search_cache
+    from app.services.metrics import metrics, route_template
     from app.services.search_service import search_service
     from app.services.stats_service import stats_service
 
@@ -38,16 +40,29 @@ logger = logging.getLogger(__name__)
 print(f"[BOOT] 模块加载完成，耗时: {time.time() - _start_time:.2f}s", flush=True)
 # === Boot 阶段结束 ===
 
-# 后台统计保存任务引用
+# 后台统计保存 / 请求聚合任务引用
 _stats_save_task: asyncio.Task | None = None
+_request_flush_task: asyncio.Task | None = None
+
+
+async def _periodic_request_flush():
+    """定期把请求缓冲聚合计入 PV / UV，在线程中执行，请求路径上不加锁"""
+    while True:
+        await asyncio.sleep(settings.STATS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(stats_service.flush_requests)
+        except Exception:
+            logger.exception("请求统计聚合失败")
 
 
 async def _periodic_stats_save():
-    """每 5 分钟保存一次统计数据"""
+    """定期写出本 worker 的统计快照，供其他 worker 汇总；文件 IO 在线程中执行，不阻塞事件循环"""
     while True:
-        await asyncio.sleep(300)
+        await asyncio.sleep(settings.STATS_SYNC_INTERVAL)
         try:
-            stats_service.save_to_file(settings.STATS_FILE_PATH)
+            await asyncio.to_thread(stats_service.save_to_file, settings.STATS_FILE_PATH)
+            if settings.METRICS_ENABLED:
+                await asyncio.to_thread(metrics.save_to_file, settings.METRICS_FILE_PATH)
         except Exception:
             logger.exception("定时保存统计数据失败")
 
@@ -55,7 +70,7 @@ async def _periodic_stats_save():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理：启动和关闭时的资源初始化/清理"""
-    global _stats_save_task
+    global _stats_save_task, _request_flush_task
 
     # 1. 初始化日志系统
     try:
@@ -81,44 +96,49 @@ async def lifespan(app: FastAPI):
     except Exception:
         logger.exception("DuckDB 搜索服务初始化失败")
 
-    # 4. 初始化缓存大小
-    if settings.CACHE_MAX_SIZE != search_cache._max_size:
-        search_cache._max_size = settings.CACHE_MAX_SIZE
-        logger.info("缓存大小设置为: %d", settings.CACHE_MAX_SIZE)
-
-    # 5. 加载统计数据
+    # 4. 加载统计数据
     try:
-        stats_service.load_from_file(settings.STATS_FILE_PATH)
+        await asyncio.to_thread(stats_service.load_from_file, settings.STATS_FILE_PATH)
     except Exception:
         logger.exception("加载统计数据失败")
 
-    # 6. 启动定时保存任务
+    # 5. 启动定时保存与请求聚合任务
     _stats_save_task = asyncio.create_task(_periodic_stats_save())
+    _request_flush_task = asyncio.create_task(_periodic_request_flush())
 
     total_startup = time.time() - _start_time
-    logger.info("EasyBook API 启动完成！总耗时: %.2fs，监听端口: %s",
-                total_startup, os.environ.get("PORT", "8080"))
+    logger.info("EasyBook API 启动完成！总耗时: %.2fs，监听端口: %s，worker: pid=%d/%d",
+                total_startup, settings.PORT, os.getpid(), settings.WORKERS)
 
     yield
 
     # === 关闭阶段 ===
     logger.info("开始关闭 EasyBook API...")
 
-    # 取消定时保存任务
-    if _stats_save_task:
-        _stats_save_task.cancel()
-        try:
-            await _stats_save_task
-        except asyncio.CancelledError:
-            pass
+    # 取消定时保存与请求聚合任务（最终保存时会聚合剩余的请求）
+    for task in (_stats_save_task, _request_flush_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
-    # 最终保存统计数据
+    # 最终保存统计数据：本 worker 的数据并入基线文件
     try:
-        stats_service.save_to_file(settings.STATS_FILE_PATH)
+        await asyncio.to_thread(stats_service.save_to_file, settings.STATS_FILE_PATH, final=True)
         logger.info("统计数据最终保存完成")
     except Exception:
         logger.exception("统计数据最终保存失败")
 
+    if settings.METRICS_ENABLED:
+        await asyncio.to_thread(metrics.save_to_file, settings.METRICS_FILE_PATH, final=True)
+
+    try:
+        search_cache.close()
+    except Exception:
+        logger.exception("搜索缓存关闭失败")
+
     try:
         await search_service.close()
         logger.info("DuckDB 搜索服务已关闭")
@@ -159,12 +179,24 @@ app.add_middleware(SlowAPIMiddleware)
 
 @app.middleware("http")
 async def stats_middleware(request: Request, call_next):
-    """记录每次请求的 PV/UV 统计"""
+    """记录每次请求的 PV/UV 统计与按路由的请求数、耗时指标"""
     client_ip = request.client.host if request.client else "unknown"
     stats_service.record_request(client_ip)
-    response = await call_next(request)
-    return response
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        path = route_template(request.scope)
+        metrics.inc("easybook_http_requests_total", request.method, path, str(status))
+        metrics.observe(
+            "easybook_http_request_duration_seconds",
+            time.perf_counter() - start, request.method, path,
+        )
 
 
 # 路由
 app.include_router(api_router, prefix="/api")
+app.include_router(metrics_api.router, tags=["Metrics"])
@@ -22,7 +22,8 @@ class SearchResponse(BaseModel):
     page: int
     page_size: int
     results: list[BookResult]
-    total_books: int  # 合并后的书籍数（同 title+author 合并多格式）
+    total_books: int  # 合并后的书籍总数（同 title+author 合并多格式），分页以此为准
+    next_cursor: str | None = None  # 下一页游标，作为 cursor 参数传回；None 表示已无更多结果
 
 
 class HealthResponse(BaseModel):
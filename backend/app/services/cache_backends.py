@@ -0,0 +1,567 @@
+"""搜索结果缓存的存储后端：进程内 LRU、单机多 worker 共享的 SQLite、Redis 协议服务
+
+SearchCache（见 cache_service）负责 key 规则、single-flight 与命中统计，后端只负责存取和淘汰：
+条目数（max_size）、估算字节数（max_bytes）双重上限按 LRU 淘汰，每个条目 ttl 秒后过期。
+统计计数器也存放在后端中，共享后端下所有 worker 看到同一份计数，清空缓存同样作用于所有 worker。
+计数同时记入本进程的 Prometheus 指标（不随清空归零，跨 worker 由 metrics 汇总）。
+
+每个条目除结果本身外还带一份很小的 meta（结果集的 complete / terms），
+scan 只返回 meta，供结果集细化在不读取完整结果的情况下挑选可复用的旧条目。
+"""
+
+import logging
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+from urllib.parse import unquote, urlparse
+
+import orjson
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """缓存后端接口
+
+    shared 为 True 的后端跨进程共享、读写有 IO，由 SearchCache 放到线程中调用。
+    """
+
+    name = ""
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        """读取条目并刷新 LRU 位置；不存在或已过期时返回 None（过期计入 expired）"""
+        ...
+
+    @abstractmethod
+    def peek(self, key: str) -> dict | None:
+        """读取条目，不改变 LRU 顺序"""
+        ...
+
+    @abstractmethod
+    def put(self, key: str, value: dict, payload: bytes, meta: dict) -> None:
+        """写入条目（payload 为 value 的 JSON 序列化结果），超出上限时淘汰最久未使用的条目"""
+        ...
+
+    @abstractmethod
+    def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        """返回 key 以 prefix 开头的未过期条目的 (key, meta)，最近使用的在前"""
+        ...
+
+    @abstractmethod
+    def incr(self, name: str, amount: int = 1) -> None:
+        ...
+
+    @abstractmethod
+    def counters(self) -> dict[str, int]:
+        ...
+
+    @abstractmethod
+    def usage(self) -> tuple[int, int]:
+        """返回 (条目数, 字节数)"""
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        """清空全部条目与计数器"""
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class _Entry(NamedTuple):
+    value: dict
+    meta: dict
+    size: int
+    expires_at: float
+
+
+class MemoryBackend(CacheBackend):
+    """基于 OrderedDict 的进程内 LRU，多 worker 时每个进程各有一份"""
+
+    name = "memory"
+
+    def __init__(self, max_size: int, max_bytes: int, ttl: float):
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._bytes = 0
+        self._counters: dict[str, int] = {}
+        self._lock = Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._incr("expired")
+                return None
+            self._cache.move_to_end(key)
+            return entry.value
+
+    def peek(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                return None
+            return entry.value
+
+    def put(self, key: str, value: dict, payload: bytes, meta: dict) -> None:
+        size = len(key) + len(payload)
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            self._cache[key] = _Entry(value, meta, size, time.monotonic() + self._ttl)
+            self._bytes += size
+            while len(self._cache) > self._max_size or self._bytes > self._max_bytes:
+                evicted_key = next(iter(self._cache))
+                self._remove(evicted_key)
+                self._incr("evicted")
+                logger.debug("缓存淘汰: key=%s", evicted_key)
+
+    def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, entry.meta) for key, entry in reversed(self._cache.items())
+                if key.startswith(prefix) and entry.expires_at > now
+            ]
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._incr(name, amount)
+
+    def _incr(self, name: str, amount: int = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + amount
+        metrics.inc("easybook_search_cache_events_total", name, amount=amount)
+
+    def counters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def usage(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._cache), self._bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+            self._counters.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key)
+        self._bytes -= entry.size
+
+
+class SqliteBackend(CacheBackend):
+    """单机多 worker 共享的 SQLite 文件（WAL 模式），LRU 按最近访问时间淘汰
+
+    过期与访问时间使用墙钟时间，各进程之间可比较。
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str, max_size: int, max_bytes: int, ttl: float):
+        self.path = path
+        self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                meta BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", [key]
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", [key])
+                self._incr("expired")
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", [now, key])
+        return orjson.loads(row[0])
+
+    def peek(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", [key, time.time()]
+            ).fetchone()
+        return orjson.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, value: dict, payload: bytes, meta: dict) -> None:
+        now = time.time()
+        size = len(key) + len(payload)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    [key, payload, orjson.dumps(meta), size, now + self._ttl, now],
+                )
+                expired = self._conn.execute(
+                    "DELETE FROM entries WHERE expires_at <= ?", [now]
+                ).rowcount
+                if expired:
+                    self._incr("expired", expired)
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self._max_size and total <= self._max_bytes:
+            return
+        victims: list[str] = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at"
+        ):
+            if count <= self._max_size and total <= self._max_bytes:
+                break
+            victims.append(key)
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [[k] for k in victims])
+        self._incr("evicted", len(victims))
+        logger.debug("缓存淘汰: %d 条", len(victims))
+
+    def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, meta FROM entries "
+                "WHERE substr(key, 1, ?) = ? AND expires_at > ? ORDER BY accessed_at DESC",
+                [len(prefix), prefix, time.time()],
+            ).fetchall()
+        return [(key, orjson.loads(meta)) for key, meta in rows]
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._incr(name, amount)
+
+    def _incr(self, name: str, amount: int = 1) -> None:
+        metrics.inc("easybook_search_cache_events_total", name, amount=amount)
+        self._conn.execute(
+            "INSERT INTO counters VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            [name, amount],
+        )
+
+    def counters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+
+    def usage(self) -> tuple[int, int]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires_at > ?",
+                [time.time()],
+            ).fetchone()
+        return count, total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM counters")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisError(Exception):
+    """Redis 服务返回的错误回复"""
+
+
+class RedisClient:
+    """最小的 RESP2 同步客户端：单连接、线程安全，断线后下一条命令自动重连
+
+    只用到字符串、哈希、有序集合的基本命令，Redis / Valkey / KeyDB 等兼容服务均可。
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"不支持的 Redis URL: {url}")
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._timeout = timeout
+        self._sock: socket.socket | None = None
+        self._reader = None
+        self._lock = Lock()
+
+    def execute(self, *args: str | bytes | int | float) -> object:
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                self._send(args)
+                return self._read_reply()
+            except (OSError, ConnectionError):
+                self._disconnect()
+                raise
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self._host, self._port), timeout=self._timeout)
+        self._reader = self._sock.makefile("rb")
+        try:
+            if self._password:
+                self._send(("AUTH", self._password))
+                self._read_reply()
+            if self._db:
+                self._send(("SELECT", self._db))
+                self._read_reply()
+        except BaseException:
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+        self._sock = None
+        self._reader = None
+
+    def _send(self, args: tuple) -> None:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+
+    def _read_reply(self) -> object:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis 连接已断开")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"无法解析的 Redis 回复: {line!r}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+class RedisBackend(CacheBackend):
+    """Redis 协议后端，可跨主机共享
+
+    键布局（均带 prefix）：e:{key} 存结果（PX 过期），idx 哈希存每个条目的大小、过期时间与 meta，
+    lru 有序集合按最近访问时间排序，exp 有序集合按过期时间排序，usage 哈希以 HINCRBY 维护
+    条目数与总字节数，stats 哈希存计数器。写入与淘汰只读取计数和被移除的条目，不随条目总数增长。
+    多个 worker 的写入不做事务，淘汰时字节数可能短暂超出上限，下一次写入时修正。
+    """
+
+    name = "redis"
+    shared = True
+    # 淘汰时每次从 lru 取出的候选条目数
+    _EVICT_BATCH = 32
+
+    def __init__(self, url: str, prefix: str, max_size: int, max_bytes: int, ttl: float):
+        self._client = RedisClient(url)
+        self._prefix = prefix
+        self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._idx = f"{prefix}idx"
+        self._lru = f"{prefix}lru"
+        self._exp = f"{prefix}exp"
+        self._usage = f"{prefix}usage"
+        self._stats = f"{prefix}stats"
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self._prefix}e:{key}"
+
+    def get(self, key: str) -> dict | None:
+        payload = self._client.execute("GET", self._entry_key(key))
+        if payload is None:
+            if self._client.execute("HEXISTS", self._idx, key):
+                # 条目已由 Redis 过期删除，索引中还留着
+                self._drop([key])
+                self.incr("expired")
+            return None
+        self._client.execute("ZADD", self._lru, time.time(), key)
+        return orjson.loads(payload)
+
+    def peek(self, key: str) -> dict | None:
+        payload = self._client.execute("GET", self._entry_key(key))
+        return orjson.loads(payload) if payload is not None else None
+
+    def put(self, key: str, value: dict, payload: bytes, meta: dict) -> None:
+        now = time.time()
+        size = len(key) + len(payload)
+        info = {"size": size, "expires_at": now + self._ttl, "meta": meta}
+        previous = self._client.execute("HGET", self._idx, key)
+        self._client.execute(
+            "SET", self._entry_key(key), payload, "PX", int(self._ttl * 1000)
+        )
+        added = self._client.execute("HSET", self._idx, key, orjson.dumps(info))
+        self._client.execute("ZADD", self._lru, now, key)
+        self._client.execute("ZADD", self._exp, info["expires_at"], key)
+        if added:
+            self._client.execute("HINCRBY", self._usage, "count", 1)
+        elif previous is not None:
+            size -= orjson.loads(previous)["size"]
+        self._client.execute("HINCRBY", self._usage, "bytes", size)
+        self._evict(now)
+
+    def _counts(self) -> tuple[int, int]:
+        """usage 哈希中的 (条目数, 总字节数)，含已过期但尚未清理的条目"""
+        count, total = self._client.execute("HMGET", self._usage, "count", "bytes")
+        return int(count or 0), int(total or 0)
+
+    def _expired(self, now: float) -> list[str]:
+        return [
+            raw.decode()
+            for raw in self._client.execute("ZRANGEBYSCORE", self._exp, "-inf", now)
+        ]
+
+    def _evict(self, now: float) -> None:
+        expired = self._expired(now)
+        if expired:
+            self._drop(expired)
+            self.incr("expired", len(expired))
+        count, total = self._counts()
+        victims: list[str] = []
+        while count > self._max_size or total > self._max_bytes:
+            start = len(victims)
+            keys = [
+                raw.decode() for raw in self._client.execute(
+                    "ZRANGE", self._lru, start, start + self._EVICT_BATCH - 1
+                )
+            ]
+            if not keys:
+                break
+            for key, raw in zip(keys, self._client.execute("HMGET", self._idx, *keys)):
+                if count <= self._max_size and total <= self._max_bytes:
+                    break
+                victims.append(key)
+                if raw is not None:
+                    count -= 1
+                    total -= orjson.loads(raw)["size"]
+        if not victims:
+            return
+        self._drop(victims)
+        self.incr("evicted", len(victims))
+        logger.debug("缓存淘汰: %d 条", len(victims))
+
+    def _drop(self, keys: list[str]) -> None:
+        """删除条目并扣减 usage；逐个 HDEL，只有真正删掉索引项的 worker 扣减，并发删除不会重复扣"""
+        if not keys:
+            return
+        infos = self._client.execute("HMGET", self._idx, *keys)
+        count = total = 0
+        for key, raw in zip(keys, infos):
+            if raw is not None and self._client.execute("HDEL", self._idx, key):
+                count += 1
+                total += orjson.loads(raw)["size"]
+        self._client.execute("DEL", *[self._entry_key(key) for key in keys])
+        self._client.execute("ZREM", self._lru, *keys)
+        self._client.execute("ZREM", self._exp, *keys)
+        if count:
+            self._client.execute("HINCRBY", self._usage, "count", -count)
+            self._client.execute("HINCRBY", self._usage, "bytes", -total)
+
+    def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        # 只看最近使用的 max_size 个条目：超出部分下一次写入时就会被淘汰，不必读整个 lru
+        keys = [
+            raw.decode()
+            for raw in self._client.execute("ZREVRANGE", self._lru, 0, self._max_size - 1)
+            if raw.decode().startswith(prefix)
+        ]
+        if not keys:
+            return []
+        now = time.time()
+        infos = self._client.execute("HMGET", self._idx, *keys)
+        result: list[tuple[str, dict]] = []
+        for key, raw in zip(keys, infos):
+            if raw is None:
+                continue
+            info = orjson.loads(raw)
+            if info["expires_at"] > now:
+                result.append((key, info["meta"]))
+        return result
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        metrics.inc("easybook_search_cache_events_total", name, amount=amount)
+        self._client.execute("HINCRBY", self._stats, name, amount)
+
+    def counters(self) -> dict[str, int]:
+        reply = self._client.execute("HGETALL", self._stats) or []
+        return {reply[i].decode(): int(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+    def usage(self) -> tuple[int, int]:
+        count, total = self._counts()
+        expired = self._expired(time.time())
+        if expired:
+            # 扣除已过期但尚未清理的条目
+            for raw in self._client.execute("HMGET", self._idx, *expired):
+                if raw is not None:
+                    count -= 1
+                    total -= orjson.loads(raw)["size"]
+        return count, total
+
+    def clear(self) -> None:
+        keys = [raw.decode() for raw in self._client.execute("HKEYS", self._idx)]
+        if keys:
+            self._client.execute("DEL", *[self._entry_key(key) for key in keys])
+        self._client.execute("DEL", self._idx, self._lru, self._exp, self._usage, self._stats)
+
+    def close(self) -> None:
+        self._client.close()
@@ -1,64 +1,205 @@
-"""LRU 搜索缓存服务"""
+"""搜索结果集缓存服务"""
 
+import asyncio
 import logging
-from collections import OrderedDict
-from threading import Lock
+from typing import Awaitable, Callable, Literal
+
+import orjson
+
+from app.config import settings
+from app.core.timing import stage
+from app.services.cache_backends import (
+    CacheBackend,
+    MemoryBackend,
+    RedisBackend,
+    SqliteBackend,
+)
+from app.services.text_normalize import normalize
 
 logger = logging.getLogger(__name__)
 
+# 随条目单独保存的结果集字段，find 只凭这些字段筛选，不读取完整结果
+_META_FIELDS = ("complete", "terms")
+
 
 class SearchCache:
-    """基于 OrderedDict 的 LRU 搜索缓存"""
+    """搜索缓存，缓存的是每个查询合并排序后的结果集（见 result_set）
 
-    def __init__(self, max_size: int = 500):
-        self._cache: OrderedDict[str, dict] = OrderedDict()
+    存储与淘汰由后端负责（见 cache_backends）：同时受条目数（max_size）和估算字节数
+    （max_bytes，按 JSON 序列化长度计）约束，每个条目在 ttl 秒后过期。key 中带有数据集版本
+    （Parquet 的 size/mtime 或 ETag），替换数据文件后旧条目不再命中，随 LRU 或过期自然淘汰。
+    共享后端（SQLite / Redis）下各 worker 共用条目与统计计数，清空也对所有 worker 生效。
+
+    get_or_compute 对未命中的 key 做 single-flight：同一 key 同时只有一次计算在进行，
+    并发到达的相同请求等待同一个 Task，避免热门查询击穿缓存时挤满 DuckDB 线程。
+    single-flight 只在本进程内生效，不同 worker 的同一查询各自计算一次。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 500,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 600.0,
+        *,
+        backend: CacheBackend | None = None,
+    ):
         self._max_size = max_size
-        self._lock = Lock()
-        self.hits = 0
-        self.misses = 0
-
-    def _make_key(self, title: str, author: str, page: int, page_size: int) -> str:
-        return f"t:{title.lower().strip()}|a:{author.lower().strip()}:{page}:{page_size}"
-
-    def get(self, title: str, author: str, page: int, page_size: int) -> dict | None:
-        key = self._make_key(title, author, page, page_size)
-        with self._lock:
-            if key in self._cache:
-                self._cache.move_to_end(key)
-                self.hits += 1
-                logger.debug("缓存命中: key=%s", key)
-                return self._cache[key]
-            self.misses += 1
-            return None
-
-    def put(self, title: str, author: str, page: int, page_size: int, result: dict) -> None:
-        key = self._make_key(title, author, page, page_size)
-        with self._lock:
-            if key in self._cache:
-                self._cache.move_to_end(key)
-            else:
-                if len(self._cache) >= self._max_size:
-                    evicted_key, _ = self._cache.popitem(last=False)
-                    logger.debug("缓存淘汰: key=%s", evicted_key)
-                self._cache[key] = result
-            logger.debug("缓存写入: key=%s, size=%d", key, len(self._cache))
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._backend = backend if backend is not None else MemoryBackend(max_size, max_bytes, ttl)
+        # 进行中的计算及其等待者数量，只在事件循环线程内访问
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+
+    async def _call(self, fn: Callable, *args):
+        """共享后端有 IO，放到线程中执行，避免阻塞事件循环"""
+        if self._backend.shared:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    @staticmethod
+    def make_key(*, version: str, query: str = "", title: str = "", author: str = "") -> str:
+        """结果集缓存 key：数据集版本 + 归一化后的查询词（归一化为空时退回原词）
+
+        分页参数不进入 key，同一查询的所有页、所有 page_size 共用一份结果集；
+        旧版 q（title OR author）与分字段搜索语义不同，分开缓存。
+        """
+        def norm(term: str) -> str:
+            return normalize(term) or term.lower().strip()
+
+        if query:
+            return f"v:{version}|q:{norm(query)}"
+        return f"v:{version}|t:{norm(title)}|a:{norm(author)}"
+
+    def get(self, key: str) -> dict | None:
+        value = self._backend.get(key)
+        self._backend.incr("hits" if value is not None else "misses")
+        if value is not None:
+            logger.debug("缓存命中: key=%s", key)
+        return value
+
+    def put(self, key: str, result: dict) -> None:
+        payload = orjson.dumps(result)
+        size = len(key) + len(payload)
+        if size > self._max_bytes:
+            logger.debug("结果过大，不缓存: key=%s, size=%d", key, size)
+            return
+        meta = {field: result.get(field) for field in _META_FIELDS}
+        self._backend.put(key, result, payload, meta)
+        logger.debug("缓存写入: key=%s, size=%d", key, size)
+
+    def _find(self, version: str, predicate: Callable[[dict], bool]) -> dict | None:
+        for key, meta in self._backend.scan(f"v:{version}|"):
+            if not predicate(meta):
+                continue
+            value = self._backend.peek(key)
+            if value is not None:
+                self._backend.incr("refined")
+                return value
+        return None
+
+    async def find(self, version: str, predicate: Callable[[dict], bool]) -> dict | None:
+        """在同一数据集版本的未过期条目中，按最近使用顺序找第一个 meta 满足 predicate 的结果集
+
+        predicate 只能看到 _META_FIELDS 中的字段。不计入命中统计，也不改变 LRU 顺序；
+        供结果集细化（result_set.refine）查找可复用的旧结果，找到时计入 refined。
+        """
+        with stage("cache"):
+            return await self._call(self._find, version, predicate)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[dict]]
+    ) -> tuple[dict, Literal["hit", "coalesced", "miss"]]:
+        """读缓存，未命中时执行 compute 并写入缓存；返回 (结果, 来源)
+
+        compute 在独立 Task 中运行并被 shield：发起请求的客户端断开不会取消其他等待者的结果；
+        所有等待者都取消后才取消 compute（进而中断 DuckDB 查询）。
+        compute 抛出的异常会传给所有等待者，且不写入缓存。
+        """
+        with stage("cache"):
+            cached = await self._call(self.get, key)
+        if cached is not None:
+            return cached, "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._backend.incr("coalesced")
+            logger.debug("合并进行中的查询: key=%s", key)
+            return await self._wait(key, task), "coalesced"
+
+        task = asyncio.ensure_future(self._compute_and_store(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return await self._wait(key, task), "miss"
+
+    async def _wait(self, key: str, task: asyncio.Task) -> dict:
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                logger.debug("等待者已全部取消，取消查询: key=%s", key)
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        result = await compute()
+        await self._call(self.put, key, result)
+        return result
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 所有等待者都已取消时，避免 "exception was never retrieved" 告警
+        if not task.cancelled():
+            task.exception()
 
     def clear(self) -> None:
-        with self._lock:
-            self._cache.clear()
-            self.hits = 0
-            self.misses = 0
-        logger.info("缓存已清空")
+        """清空条目与统计计数；共享后端下对所有 worker 生效"""
+        self._backend.clear()
+        logger.info("缓存已清空: backend=%s", self._backend.name)
+
+    def close(self) -> None:
+        self._backend.close()
 
     def stats(self) -> dict:
-        total = self.hits + self.misses
+        counters = self._backend.counters()
+        size, used = self._backend.usage()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        total = hits + misses
         return {
-            "size": len(self._cache),
+            "backend": self._backend.name,
+            "size": size,
             "max_size": self._max_size,
-            "hits": self.hits,
-            "misses": self.misses,
-            "hit_rate": round(self.hits / total, 4) if total > 0 else 0,
+            "bytes": used,
+            "max_bytes": self._max_bytes,
+            "ttl": self._ttl,
+            "hits": hits,
+            "misses": misses,
+            "expired": counters.get("expired", 0),
+            "evicted": counters.get("evicted", 0),
+            # 进行中的查询只统计本 worker
+            "inflight": len(self._inflight),
+            "coalesced": counters.get("coalesced", 0),
+            "refined": counters.get("refined", 0),
+            "hit_rate": round(hits / total, 4) if total > 0 else 0,
         }
 
 
-search_cache = SearchCache()
+def create_backend() -> CacheBackend:
+    """按 CACHE_BACKEND 配置创建缓存后端"""
+    limits = (settings.CACHE_MAX_SIZE, settings.CACHE_MAX_BYTES, settings.CACHE_TTL)
+    if settings.CACHE_BACKEND == "sqlite":
+        return SqliteBackend(settings.CACHE_SQLITE_PATH, *limits)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.CACHE_REDIS_URL, settings.CACHE_REDIS_PREFIX, *limits)
+    return MemoryBackend(*limits)
+
+
+search_cache = SearchCache(
+    settings.CACHE_MAX_SIZE, settings.CACHE_MAX_BYTES, settings.CACHE_TTL,
+    backend=create_backend(),
+)
@@ -0,0 +1,108 @@
+"""由 Parquet 派生的 DuckDB 文件（倒排索引、物化库）：来源指纹、过期判断与物化构建"""
+
+import logging
+import os
+import time
+from pathlib import Path
+
+import duckdb
+
+from app.services.text_normalize import TITLE_NORM, normalized_select_sql
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZED_ALIAS = "books_db"
+MATERIALIZED_VERSION = "2"
+
+
+def source_fingerprint(parquet_path: str) -> dict[str, str]:
+    """Parquet 来源指纹：本地文件用 size + mtime，远程路径只记录路径本身"""
+    fingerprint = {"source_path": parquet_path}
+    p = Path(parquet_path)
+    if p.exists():
+        st = p.stat()
+        fingerprint["source_size"] = str(st.st_size)
+        fingerprint["source_mtime"] = str(int(st.st_mtime))
+    return fingerprint
+
+
+def is_derived_fresh(
+    meta: dict[str, str],
+    parquet_path: str,
+    record_count: int,
+    *,
+    version: str,
+    label: str,
+) -> bool:
+    """派生文件与当前 Parquet 是否一致（格式版本、行数，本地模式下再比较 size/mtime）"""
+    if meta.get("version") != version:
+        logger.warning("%s版本不匹配: file=%s, expected=%s", label, meta.get("version"), version)
+        return False
+    if meta.get("source_rows") != str(record_count):
+        logger.warning(
+            "%s行数与 Parquet 不一致: file=%s, parquet=%d",
+            label, meta.get("source_rows"), record_count,
+        )
+        return False
+    current = source_fingerprint(parquet_path)
+    for key in ("source_size", "source_mtime"):
+        if key in current and meta.get(key) != current[key]:
+            logger.warning("%s已过期: %s file=%s, parquet=%s", label, key, meta.get(key), current[key])
+            return False
+    return True
+
+
+def parquet_columns(conn: duckdb.DuckDBPyConnection, parquet_path: str) -> list[str]:
+    """Parquet 的列名（只读取文件尾部的 schema）"""
+    rows = conn.execute("DESCRIBE SELECT * FROM read_parquet(?)", [parquet_path]).fetchall()
+    return [row[0] for row in rows]
+
+
+def read_meta(db_path: str) -> dict[str, str]:
+    """只读打开派生文件并读取 meta 表"""
+    with duckdb.connect(db_path, read_only=True) as conn:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+def materialize(parquet_path: str, output_path: str) -> int:
+    """将 Parquet 物化为本地 DuckDB 文件，返回记录数
+
+    books 表带有归一化的 title_norm / author_norm / title_len 列（旧版 Parquet 缺失时现场计算），
+    按 title_norm 排序写入，使 DuckDB 的行组 min/max 统计对前缀/精确匹配有效。
+    先写临时文件再原子替换。
+    """
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_output = output.with_name(output.name + ".tmp")
+    tmp_output.unlink(missing_ok=True)
+
+    start = time.time()
+    logger.info("开始物化 DuckDB 数据库: %s → %s", parquet_path, output_path)
+    with duckdb.connect(str(tmp_output)) as conn:
+        normalized = normalized_select_sql(parquet_columns(conn, parquet_path))
+        conn.execute(f"""
+            CREATE TABLE books AS
+            SELECT md5, title, author, extension, filesize,
+                   language, year, publisher,
+                   {normalized}
+            FROM read_parquet(?)
+            ORDER BY {TITLE_NORM}
+        """, [parquet_path])
+        count = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+        meta = {
+            "version": MATERIALIZED_VERSION,
+            "source_rows": str(count),
+            "built_at": str(int(time.time())),
+            **source_fingerprint(parquet_path),
+        }
+        conn.execute("CREATE TABLE meta (key VARCHAR, value VARCHAR)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", list(meta.items()))
+        conn.execute("CHECKPOINT")
+
+    os.replace(tmp_output, output)
+    logger.info(
+        "DuckDB 数据库物化完成: %d 条记录, 耗时 %.1f 秒, 文件: %s",
+        count, time.time() - start, output_path,
+    )
+    return count
@@ -0,0 +1,160 @@
+"""DuckDB 连接池：复用预配置的连接，避免每次查询重复建连和加载 httpfs"""
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import duckdb
+from fsspec import AbstractFileSystem
+
+logger = logging.getLogger(__name__)
+
+
+class DuckDBPool:
+    """有界 DuckDB 连接池
+
+    所有连接都是同一个内存数据库上的 cursor：threads / memory_limit 预算由
+    整个池共享，httpfs 扩展加载和 S3 配置只在建池时执行一次。
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        threads: int,
+        memory_limit: str,
+        acquire_timeout: float = 10.0,
+        health_check_interval: float = 60.0,
+        s3_settings: dict[str, str] | None = None,
+    ):
+        self._size = max(size, 1)
+        self._acquire_timeout = acquire_timeout
+        self._health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._db = duckdb.connect(config={
+            "threads": str(threads),
+            "memory_limit": memory_limit,
+        })
+        if s3_settings is not None:
+            self._db.install_extension("httpfs")
+            self._db.load_extension("httpfs")
+            for key, value in s3_settings.items():
+                self._db.execute(f"SET GLOBAL {key}='{value}'")
+
+        # LIFO：优先复用最近归还的连接，冷连接自然闲置到健康检查
+        self._idle: queue.LifoQueue[tuple[duckdb.DuckDBPyConnection, float]] = queue.LifoQueue()
+        for _ in range(self._size):
+            self._idle.put((self._db.cursor(), time.monotonic()))
+
+        self.acquired = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.recycled = 0
+        logger.info(
+            "DuckDB 连接池已创建: size=%d, threads=%d, memory_limit=%s, remote=%s",
+            self._size, threads, memory_limit, s3_settings is not None,
+        )
+
+    @contextmanager
+    def connection(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """借出一个连接，用完自动归还；池耗尽时最多等待 acquire_timeout 秒"""
+        conn = self._acquire()
+        failed = False
+        try:
+            yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._release(conn, check=failed)
+
+    def _acquire(self) -> duckdb.DuckDBPyConnection:
+        if self._closed:
+            raise RuntimeError("DuckDB connection pool is closed")
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.waits += 1
+            try:
+                conn, last_used = self._idle.get(timeout=self._acquire_timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts += 1
+                logger.warning("DuckDB 连接池耗尽: 等待 %.1fs 超时", self._acquire_timeout)
+                raise RuntimeError("DuckDB connection pool exhausted") from None
+
+        if time.monotonic() - last_used > self._health_check_interval:
+            conn = self._ensure_healthy(conn)
+        with self._lock:
+            self.acquired += 1
+        return conn
+
+    def _release(self, conn: duckdb.DuckDBPyConnection, *, check: bool) -> None:
+        if self._closed:
+            conn.close()
+            return
+        if check:
+            conn = self._ensure_healthy(conn)
+        self._idle.put((conn, time.monotonic()))
+
+    def _ensure_healthy(self, conn: duckdb.DuckDBPyConnection) -> duckdb.DuckDBPyConnection:
+        """执行探活查询，失败则丢弃并以新 cursor 替换"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return conn
+        except Exception as e:
+            logger.warning("DuckDB 连接探活失败，重建连接: %s", e)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self.recycled += 1
+            return self._db.cursor()
+
+    def attach(self, alias: str, path: str) -> None:
+        """只读挂载数据库文件，对池内所有连接立即可见"""
+        self._db.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+        logger.info("DuckDB 已挂载: %s → %s", alias, path)
+
+    def register_filesystem(self, filesystem: AbstractFileSystem) -> None:
+        """注册 fsspec 文件系统（如远程块缓存），对池内所有连接生效"""
+        self._db.register_filesystem(filesystem)
+        logger.info("DuckDB 已注册文件系统: %s", filesystem.protocol)
+
+    def close(self, drain_timeout: float = 0.0) -> None:
+        """关闭空闲连接和底层数据库；借出中的连接在归还时关闭
+
+        drain_timeout > 0 时先等待借出的连接归还（最多该秒数），用于热重载后
+        让旧连接池上进行中的查询正常跑完。
+        """
+        deadline = time.monotonic() + drain_timeout
+        while self._idle.qsize() < self._size and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        self._db.close()
+        logger.info("DuckDB 连接池已关闭")
+
+    def stats(self) -> dict:
+        available = self._idle.qsize()
+        return {
+            "size": self._size,
+            "available": available,
+            "in_use": self._size - available,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+        }
@@ -0,0 +1,78 @@
+"""HyperLogLog 基数估计：固定大小的去重计数，用于 UV 统计
+
+2^p 个寄存器（每个一个字节），p=12 时 4 KiB，标准误差约 1.04/sqrt(2^p) ≈ 1.6%。
+同精度的草图可以无损合并（逐寄存器取最大值），多个小时 / 多个 worker 的 UV 合并后再估计。
+"""
+
+import base64
+import hashlib
+import math
+
+# 小于 2.5m 时改用线性计数（Flajolet et al. 2007）
+_LINEAR_COUNTING_FACTOR = 2.5
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    """HyperLogLog 草图，64 位哈希（blake2b），不需要大基数修正"""
+
+    __slots__ = ("p", "_registers")
+
+    def __init__(self, p: int = 12, registers: bytes | None = None):
+        if not 4 <= p <= 16:
+            raise ValueError(f"HyperLogLog precision must be in [4, 16], got {p}")
+        self.p = p
+        m = 1 << p
+        if registers is not None and len(registers) != m:
+            raise ValueError(f"expected {m} registers, got {len(registers)}")
+        self._registers = bytearray(registers) if registers is not None else bytearray(m)
+
+    def add(self, value: str) -> None:
+        x = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        bits = 64 - self.p
+        index = x >> bits
+        # 剩余位中第一个 1 的位置（从 1 开始）
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def update(self, other: "HyperLogLog") -> None:
+        """并入另一个同精度草图"""
+        if other.p != self.p:
+            raise ValueError(f"cannot merge HyperLogLog p={other.p} into p={self.p}")
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self) -> int:
+        m = len(self._registers)
+        estimate = _alpha(m) * m * m / math.fsum(2.0 ** -r for r in self._registers)
+        if estimate <= _LINEAR_COUNTING_FACTOR * m:
+            zeros = self._registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_str(self) -> str:
+        """序列化为 "{p}:{base64 寄存器}"，写入 JSON 快照"""
+        return f"{self.p}:{base64.b64encode(self._registers).decode()}"
+
+    @classmethod
+    def from_str(cls, data: str) -> "HyperLogLog":
+        p, _, registers = data.partition(":")
+        return cls(int(p), base64.b64decode(registers))
+
+    @classmethod
+    def merged(cls, sketches: "list[HyperLogLog]", p: int = 12) -> "HyperLogLog":
+        """合并多个草图为新草图（列表为空时返回空草图）"""
+        result = cls(sketches[0].p if sketches else p)
+        for sketch in sketches:
+            result.update(sketch)
+        return result
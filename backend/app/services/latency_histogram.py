@@ -0,0 +1,78 @@
+"""固定分桶的延迟直方图（HDR 风格）
+
+每个 2 倍区间均分为 8 个对数桶，相对误差约 9%，覆盖 10µs ~ 100s，超出范围的计入两端的桶。
+桶计数以稀疏 dict 存储，同一分桶方案的直方图直接相加即可合并（跨时间窗口 / 跨 worker）。
+"""
+
+import math
+
+_MIN_SECONDS = 1e-5
+_SUB_BUCKETS = 8
+_BUCKETS = math.ceil(math.log2(100 / _MIN_SECONDS) * _SUB_BUCKETS) + 1
+
+
+def _bucket(seconds: float) -> int:
+    if seconds <= _MIN_SECONDS:
+        return 0
+    return min(math.ceil(math.log2(seconds / _MIN_SECONDS) * _SUB_BUCKETS), _BUCKETS - 1)
+
+
+def _upper_bound(index: int) -> float:
+    return _MIN_SECONDS * 2 ** (index / _SUB_BUCKETS)
+
+
+class LatencyHistogram:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        index = _bucket(seconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def update(self, other: "LatencyHistogram") -> None:
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """第 q 分位（0~100）所在桶的上界（秒），不超过记录到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * q / 100) or 1
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_upper_bound(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": {str(index): n for index, n in self.buckets.items()},
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.buckets = {int(index): n for index, n in data.get("buckets", {}).items()}
+        histogram.count = data.get("count", 0)
+        histogram.sum = data.get("sum", 0.0)
+        histogram.max = data.get("max", 0.0)
+        return histogram
@@ -0,0 +1,298 @@
+"""Prometheus 指标：进程内计数器 / 直方图，以文本格式（0.0.4）暴露在 /metrics
+
+埋点只在本进程内存中累加（一次加锁的 dict 更新，直方图多一次二分查找），每个请求都可以记录。
+多 worker 时各进程把自己的累计值写到 {METRICS_FILE_PATH}.workers/ 下的快照文件，
+处理抓取的 worker 先写出自己的快照再汇总其他 worker 的快照，计数器因此不会因为
+抓取落到不同 worker 而回退；已退出进程的计数并入 METRICS_FILE_PATH（基线）后删除快照，
+计数器跨重启保持单调。gauge 按 worker 标签分别输出，只保留存活的 worker。
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple
+
+import psutil
+
+from app.core.worker import worker_id
+from app.core.worker_snapshots import WorkerSnapshots
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+_ROWS_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class _Family(NamedTuple):
+    kind: str
+    help: str
+    labels: tuple[str, ...] = ()
+    buckets: tuple[float, ...] = ()
+
+
+_FAMILIES = {
+    "easybook_http_requests_total": _Family(
+        "counter", "HTTP 请求数（route 为路由模板）", ("method", "route", "status")
+    ),
+    "easybook_http_request_duration_seconds": _Family(
+        "histogram", "HTTP 请求耗时", ("method", "route"), _LATENCY_BUCKETS
+    ),
+    "easybook_search_cache_events_total": _Family(
+        "counter",
+        "搜索缓存事件数（hits / misses / coalesced / refined / expired / evicted）",
+        ("event",),
+    ),
+    "easybook_duckdb_query_duration_seconds": _Family(
+        "histogram", "DuckDB 查询耗时（fetch 取结果页，count 单独计数）", ("query",),
+        _LATENCY_BUCKETS,
+    ),
+    "easybook_duckdb_rows_returned": _Family(
+        "histogram", "DuckDB 每次查询返回的书籍数", ("query",), _ROWS_BUCKETS
+    ),
+    "easybook_remote_bytes_read_total": _Family("counter", "从远程对象存储读取的字节数"),
+    "easybook_query_executor_queued": _Family("gauge", "查询线程池排队数", ("worker",)),
+    "easybook_query_executor_running": _Family("gauge", "查询线程池执行中的查询数", ("worker",)),
+    "process_resident_memory_bytes": _Family("gauge", "进程常驻内存（RSS）", ("worker",)),
+}
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # 每个桶（非累计）的计数，最后一个是 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def update(self, counts: list[int], total: float) -> None:
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum += total
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def route_template(scope: dict) -> str:
+    """请求匹配到的路由模板（如 /api/v1/search），作为标签不随路径参数增长；未匹配时为 <unmatched>
+
+    较新的 FastAPI 嵌套挂载 include_router，route.path 不含前缀，按实际路径补回。
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    if template is None:
+        return "<unmatched>"
+    path = scope.get("path", "")
+    try:
+        concrete = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    if concrete != path and path.endswith(concrete):
+        return path[: len(path) - len(concrete)] + template
+    return template
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    """合并多个快照：计数器与直方图逐标签相加，gauge 原样拼接（各自带 worker 标签）"""
+    counters: dict[tuple[str, tuple[str, ...]], float] = {}
+    histograms: dict[tuple[str, tuple[str, ...]], _Histogram] = {}
+    gauges: list[list] = []
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("counters", []):
+            if name not in _FAMILIES:
+                continue
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot.get("histograms", []):
+            family = _FAMILIES.get(name)
+            # 分桶方案变了的旧快照无法相加，丢弃
+            if family is None or len(counts) != len(family.buckets) + 1:
+                continue
+            key = (name, tuple(labels))
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = _Histogram(family.buckets)
+            histogram.update(counts, total)
+        gauges.extend(g for g in snapshot.get("gauges", []) if g[0] in _FAMILIES)
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [
+            [name, list(labels), h.counts, h.sum] for (name, labels), h in histograms.items()
+        ],
+        "gauges": gauges,
+    }
+
+
+def render(snapshot: dict) -> str:
+    """把快照输出为 Prometheus 文本格式"""
+    samples: dict[str, list[str]] = {name: [] for name in _FAMILIES}
+    for name, labels, value in sorted(snapshot.get("counters", [])):
+        family = _FAMILIES[name]
+        samples[name].append(
+            f"{name}{_format_labels(family.labels, tuple(labels))} {_format_value(value)}"
+        )
+    for name, labels, counts, total in sorted(snapshot.get("histograms", [])):
+        family = _FAMILIES[name]
+        names = (*family.labels, "le")
+        cumulative = 0
+        for bound, n in zip((*family.buckets, float("inf")), counts):
+            cumulative += n
+            label_text = _format_labels(names, (*labels, _format_value(bound)))
+            samples[name].append(f"{name}_bucket{label_text} {cumulative}")
+        label_text = _format_labels(family.labels, tuple(labels))
+        samples[name].append(f"{name}_sum{label_text} {_format_value(total)}")
+        samples[name].append(f"{name}_count{label_text} {cumulative}")
+    for name, labels, value in sorted(snapshot.get("gauges", [])):
+        family = _FAMILIES[name]
+        samples[name].append(
+            f"{name}{_format_labels(family.labels, tuple(labels))} {_format_value(value)}"
+        )
+    lines: list[str] = []
+    for name, family in _FAMILIES.items():
+        lines.append(f"# HELP {name} {family.help}")
+        lines.append(f"# TYPE {name} {family.kind}")
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def _fold(snapshots: list[dict]) -> dict:
+    """并入基线时的合并：计数与直方图累加，gauge 只属于存活的 worker，丢弃"""
+    merged = merge_snapshots(snapshots)
+    merged["gauges"] = []
+    return merged
+
+
+class Metrics:
+    """进程内指标注册表；指标名与标签在 _FAMILIES 中声明"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._worker_id = worker_id()
+        self._counters: dict[tuple[str, tuple[str, ...]], float] = {}
+        self._histograms: dict[tuple[str, tuple[str, ...]], _Histogram] = {}
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._process = psutil.Process()
+        self.gauge("process_resident_memory_bytes", lambda: self._process.memory_info().rss)
+
+    def inc(self, name: str, *labels: str, amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, *labels: str) -> None:
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(_FAMILIES[name].buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, *labels: str) -> Iterator[None]:
+        """把代码块的耗时（秒）记录到直方图，异常退出时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, *labels)
+
+    def gauge(self, name: str, collect: Callable[[], float]) -> None:
+        """注册 gauge，抓取时调用 collect 取本进程的当前值"""
+        self._gauges[name] = collect
+
+    def _snapshot(self) -> dict:
+        pid = self._worker_id.partition("-")[0]
+        gauges = []
+        for name, collect in self._gauges.items():
+            try:
+                gauges.append([name, [pid], collect()])
+            except Exception:
+                logger.exception("gauge 采集失败: %s", name)
+        with self._lock:
+            return {
+                "counters": [
+                    [name, list(labels), value] for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(h.counts), h.sum]
+                    for (name, labels), h in self._histograms.items()
+                ],
+                "gauges": gauges,
+            }
+
+    def _drain(self) -> dict:
+        """取出本进程的累计值并清零（进程退出前并入基线用，gauge 不需要）"""
+        with self._lock:
+            snapshot = {
+                "counters": [
+                    [name, list(labels), value] for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(h.counts), h.sum]
+                    for (name, labels), h in self._histograms.items()
+                ],
+                "gauges": [],
+            }
+            self._counters.clear()
+            self._histograms.clear()
+        return snapshot
+
+    def _store(self, path: str) -> WorkerSnapshots:
+        return WorkerSnapshots(path, _fold, self._worker_id)
+
+    def collect(self, path: str | None = None) -> str:
+        """输出指标文本；给出 path 时先写出本进程快照，再汇总基线与其他 worker 的快照"""
+        snapshot = self._snapshot()
+        if not path:
+            return render(merge_snapshots([snapshot]))
+        store = self._store(path)
+        with store.locked():
+            store.write(snapshot)
+            store.compact()
+            snapshots = [snapshot, *store.read()]
+        return render(merge_snapshots(snapshots))
+
+    def save_to_file(self, path: str, *, final: bool = False) -> None:
+        """写出本进程快照；final（进程退出前）时把本进程的计数并入基线并删除快照
+
+        有文件 IO，在线程中调用。
+        """
+        store = self._store(path)
+        try:
+            if final:
+                with store.locked():
+                    store.compact(self._drain())
+            else:
+                snapshot = self._snapshot()
+                with store.locked():
+                    store.write(snapshot)
+                    store.compact()
+        except Exception:
+            logger.exception("指标快照保存失败: path=%s", path)
+
+
+metrics = Metrics()
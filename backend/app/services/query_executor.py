@@ -0,0 +1,198 @@
+"""DuckDB 查询专用线程池与准入控制
+
+搜索不再走 asyncio 默认线程池：默认线程池与其他 to_thread 调用共用且队列无界，突发流量时
+排队无限增长、所有请求一起变慢。这里的线程数等于连接池大小（每个查询占用一个连接，
+多开的线程只会在连接池上等待），排队数或预计等待时间超过上限时立即拒绝，由 API 返回 503。
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+import duckdb
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 服务时间 EWMA 的平滑系数
+_EWMA_ALPHA = 0.2
+# 保留最近多少次排队等待时间用于分位数统计
+_MAX_WAIT_SAMPLES = 1000
+
+
+class QueryOverloaded(Exception):
+    """查询排队过多，拒绝本次请求；retry_after 为建议的重试间隔（秒）"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class QueryCancelled(Exception):
+    """查询被中断：reason 为 "timeout"（超过查询时限）或 "cancelled"（调用方已放弃，如客户端断开）"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"query {reason}")
+        self.reason = reason
+
+
+class QueryGuard:
+    """一次查询的取消句柄：超时或调用方取消时对正在执行的 DuckDB 连接调用 interrupt()
+
+    cancel 可在任意线程调用；查询尚未拿到连接时只做标记，开始执行时立即放弃。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: duckdb.DuckDBPyConnection | None = None
+        self.reason: str | None = None
+
+    def cancel(self, reason: str) -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    @contextmanager
+    def running(self, conn: duckdb.DuckDBPyConnection) -> Iterator[None]:
+        """在 conn 上执行查询期间允许被中断；中断导致的异常转换为 QueryCancelled"""
+        with self._lock:
+            if self.reason is not None:
+                raise QueryCancelled(self.reason)
+            self._conn = conn
+        try:
+            yield
+        except duckdb.InterruptException as e:
+            if self.reason is None:
+                raise
+            raise QueryCancelled(self.reason) from e
+        finally:
+            # 归还连接前解除关联，之后的 cancel 不会中断别人的查询
+            with self._lock:
+                self._conn = None
+
+
+class QueryExecutor:
+    """有界查询线程池
+
+    - 排队（已提交未开始）的查询数达到 max_queue 时拒绝；
+    - 按近期平均执行时间估算的排队等待超过 max_wait 时拒绝；
+    - 已排队的查询开始执行时若等待已超过 max_wait，直接放弃（调用方多半已超时）。
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_wait: float):
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="duckdb-query"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._service_time = 0.0
+        self._waits: deque[float] = deque(maxlen=_MAX_WAIT_SAMPLES)
+        self.submitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def _estimated_wait(self, queued: int) -> float:
+        return self._service_time * queued / self.workers
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._estimated_wait(self._queued + 1)))
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._queued >= self.max_queue:
+                reason = f"查询排队已满 ({self._queued}/{self.max_queue})"
+            elif self._queued and self._estimated_wait(self._queued) > self.max_wait:
+                reason = f"预计排队 {self._estimated_wait(self._queued):.1f}s 超过上限"
+            else:
+                self._queued += 1
+                self.submitted += 1
+                return
+            self.rejected += 1
+            retry_after = self._retry_after()
+        logger.warning("搜索过载，拒绝请求: %s, retry_after=%ds", reason, retry_after)
+        raise QueryOverloaded(reason, retry_after)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """在查询线程池中执行 fn(*args)；过载时抛出 QueryOverloaded"""
+        self._admit()
+        enqueued = time.monotonic()
+
+        def task() -> T:
+            started = time.monotonic()
+            waited = started - enqueued
+            with self._lock:
+                self._queued -= 1
+                self._waits.append(waited)
+                if waited > self.max_wait:
+                    self.shed += 1
+                    raise QueryOverloaded(
+                        f"排队 {waited:.1f}s 超过上限", self._retry_after()
+                    )
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._running -= 1
+                    self._service_time += _EWMA_ALPHA * (elapsed - self._service_time)
+
+        # 复制调用方上下文，线程内的分阶段计时（app.core.timing）计入发起请求的那一份
+        future = self._executor.submit(contextvars.copy_context().run, task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 还在排队的任务直接撤销，释放排队名额；已开始执行的由调用方通过 QueryGuard 中断
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "max_wait": self.max_wait,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "shed": self.shed,
+                "avg_service_ms": round(self._service_time * 1000, 1),
+            }
+        stats["wait_ms"] = {
+            "p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+            "max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+        return stats
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+query_executor = QueryExecutor(
+    settings.DUCKDB_POOL_SIZE, settings.SEARCH_QUEUE_MAX, settings.SEARCH_QUEUE_MAX_WAIT
+)
+metrics.gauge("easybook_query_executor_queued", lambda: query_executor.stats()["queued"])
+metrics.gauge("easybook_query_executor_running", lambda: query_executor.stats()["running"])
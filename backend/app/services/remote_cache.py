@@ -0,0 +1,447 @@
+"""远程 Parquet 本地缓存：S3 Range 请求按块缓存到磁盘，可选后台整文件下载
+
+远程模式下 DuckDB 通过注册的 fsspec 文件系统（协议 s3cache://）读取 Parquet，
+每次读取按固定大小的块对齐，块文件以对象 ETag 分目录存放在本地磁盘，按总字节数
+LRU 淘汰。对象重新上传后 ETag 变化，旧块自然失效并被清理。
+Range 请求带 If-Match 限定为打开文件时的 ETag，读取途中对象被替换时抛出
+RemoteObjectChanged，而不是把新版本的字节拼进旧版本的文件。
+"""
+
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, NamedTuple
+from urllib.parse import quote
+
+import httpx
+from fsspec.spec import AbstractBufferedFile, AbstractFileSystem
+
+from app.core.file_lock import FileLock
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_PROTOCOL = "s3cache"
+_EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class RemoteObjectChanged(OSError):
+    """读取途中远程对象已被重新上传（ETag 与打开文件时不一致）"""
+
+
+class ObjectInfo(NamedTuple):
+    size: int
+    etag: str
+    last_modified: float  # Unix 时间戳
+
+
+class S3RangeClient:
+    """最小 S3 兼容客户端：SigV4 签名的 HEAD / Range GET（华为云 OBS / Cloudflare R2 等）"""
+
+    def __init__(
+        self,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        region: str,
+        url_style: str = "path",
+        timeout: float = 30.0,
+    ):
+        # 保留配置的协议（本地 MinIO 等常用 http），未写协议时默认 https
+        scheme, sep, host = endpoint.partition("://")
+        if not sep:
+            scheme, host = "https", endpoint
+        self._scheme = scheme
+        self._endpoint = host.rstrip("/")
+        self._access_key_id = access_key_id
+        self._secret_access_key = secret_access_key
+        self._region = region
+        self._url_style = url_style
+        self._client = httpx.Client(timeout=timeout)
+
+    def head(self, bucket: str, key: str) -> ObjectInfo:
+        resp = self._request("HEAD", bucket, key)
+        last_modified = resp.headers.get("last-modified")
+        return ObjectInfo(
+            size=int(resp.headers["content-length"]),
+            etag=resp.headers.get("etag", "").strip('"'),
+            last_modified=parsedate_to_datetime(last_modified).timestamp() if last_modified else 0.0,
+        )
+
+    def get_range(
+        self, bucket: str, key: str, start: int, end: int, etag: str | None = None
+    ) -> bytes:
+        """读取 [start, end) 字节；给出 etag 时要求对象仍是该版本，否则抛出 RemoteObjectChanged"""
+        headers = {"range": f"bytes={start}-{end - 1}"}
+        if etag is not None:
+            headers["if-match"] = f'"{etag}"'
+        try:
+            resp = self._request("GET", bucket, key, headers)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 412:
+                raise RemoteObjectChanged(f"{bucket}/{key} 已不是版本 {etag}") from e
+            raise
+        # 不支持 If-Match 的兼容存储会忽略该头，再核对一次响应的 ETag
+        got = resp.headers.get("etag", "").strip('"')
+        if etag is not None and got and got != etag:
+            raise RemoteObjectChanged(f"{bucket}/{key} 已不是版本 {etag}（当前 {got}）")
+        metrics.inc("easybook_remote_bytes_read_total", amount=len(resp.content))
+        return resp.content
+
+    def close(self) -> None:
+        self._client.close()
+
+    def _request(
+        self, method: str, bucket: str, key: str, extra_headers: dict[str, str] | None = None
+    ) -> httpx.Response:
+        if self._url_style == "vhost":
+            host, path = f"{bucket}.{self._endpoint}", f"/{quote(key)}"
+        else:
+            host, path = self._endpoint, f"/{bucket}/{quote(key)}"
+        headers = self._sign(method, host, path, extra_headers or {})
+        resp = self._client.request(method, f"{self._scheme}://{host}{path}", headers=headers)
+        resp.raise_for_status()
+        return resp
+
+    def _sign(self, method: str, host: str, path: str, extra: dict[str, str]) -> dict[str, str]:
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        headers = {
+            "host": host,
+            "x-amz-content-sha256": _EMPTY_SHA256,
+            "x-amz-date": amz_date,
+            **{k.lower(): v for k, v in extra.items()},
+        }
+        signed_headers = ";".join(sorted(headers))
+        canonical_headers = "".join(f"{k}:{headers[k]}\n" for k in sorted(headers))
+        canonical_request = "\n".join([
+            method, path, "", canonical_headers, signed_headers, _EMPTY_SHA256,
+        ])
+        scope = f"{date_stamp}/{self._region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        signing_key = f"AWS4{self._secret_access_key}".encode()
+        for part in (date_stamp, self._region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self._access_key_id}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return headers
+
+
+class BlockCache:
+    """磁盘块缓存：{cache_dir}/blocks/{etag}/{block_index}，按总字节数 LRU 淘汰"""
+
+    def __init__(self, cache_dir: str, block_size: int, max_bytes: int):
+        self._dir = Path(cache_dir) / "blocks"
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self.block_size = block_size
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self.bytes_cached = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+        self.evictions = 0
+        self._load_existing()
+
+    def _load_existing(self) -> None:
+        """启动时按 mtime 恢复已有块的 LRU 顺序"""
+        found: list[tuple[float, tuple[str, int], int]] = []
+        for etag_dir in self._dir.iterdir():
+            if not etag_dir.is_dir():
+                continue
+            for block_file in etag_dir.iterdir():
+                if not block_file.name.isdigit():
+                    block_file.unlink(missing_ok=True)  # 残留的临时文件
+                    continue
+                st = block_file.stat()
+                found.append((st.st_mtime, (etag_dir.name, int(block_file.name)), st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.bytes_cached += size
+        if found:
+            logger.info("远程块缓存已恢复: %d 块, %.1f MB", len(found), self.bytes_cached / 1024 / 1024)
+
+    def read_block(self, etag: str, index: int, fetch: Callable[[], bytes]) -> bytes:
+        """读取一个块；未缓存时调用 fetch 拉取并写入磁盘"""
+        key = (etag, index)
+        path = self._dir / etag / str(index)
+        with self._lock:
+            cached = key in self._entries
+            if cached:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached:
+            try:
+                return path.read_bytes()
+            except FileNotFoundError:
+                with self._lock:
+                    self._forget(key)
+
+        data = fetch()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{index}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.bytes_fetched += len(data)
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self.bytes_cached += len(data)
+            self._evict()
+        return data
+
+    def _forget(self, key: tuple[str, int]) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self.bytes_cached -= size
+
+    def _evict(self) -> None:
+        while self.bytes_cached > self._max_bytes and len(self._entries) > 1:
+            (etag, index), size = self._entries.popitem(last=False)
+            self.bytes_cached -= size
+            self.evictions += 1
+            (self._dir / etag / str(index)).unlink(missing_ok=True)
+
+    def drop_other_etags(self, etag: str) -> None:
+        """对象已更新：删除其他 ETag 的全部块"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] != etag]:
+                self._forget(key)
+        for etag_dir in self._dir.iterdir():
+            if etag_dir.is_dir() and etag_dir.name != etag:
+                shutil.rmtree(etag_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "blocks": len(self._entries),
+            "block_size": self.block_size,
+            "bytes_cached": self.bytes_cached,
+            "max_bytes": self._max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total > 0 else 0,
+            "bytes_fetched": self.bytes_fetched,
+            "evictions": self.evictions,
+        }
+
+
+class CachedS3FileSystem(AbstractFileSystem):
+    """供 DuckDB 注册的 fsspec 文件系统：s3cache://bucket/key 经块缓存读取远程对象"""
+
+    protocol = CACHE_PROTOCOL
+    cachable = False
+
+    def __init__(self, client: S3RangeClient, cache: BlockCache, head_ttl: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.cache = cache
+        self._head_ttl = head_ttl
+        self._head_lock = threading.Lock()
+        self._heads: dict[str, tuple[ObjectInfo, float]] = {}
+        # 读取时发现对象已更新的次数，查询据此判断失败是否因版本变化、可以重试
+        self.version_changes = 0
+
+    @staticmethod
+    def _split(path: str) -> tuple[str, str]:
+        bucket, _, key = path.removeprefix(f"{CACHE_PROTOCOL}://").partition("/")
+        return bucket, key
+
+    def head(self, path: str, *, fresh: bool = False) -> ObjectInfo:
+        """对象元信息，在 head_ttl 内复用，避免每次查询都多一次往返；fresh 时总是重新请求"""
+        path = self._strip_protocol(path)
+        now = time.monotonic()
+        with self._head_lock:
+            cached = self._heads.get(path)
+        if cached and not fresh and now - cached[1] < self._head_ttl:
+            return cached[0]
+        return self._refresh_head(path, cached[0].etag if cached else None)
+
+    def _refresh_head(self, path: str, previous_etag: str | None) -> ObjectInfo:
+        now = time.monotonic()
+        info = self.client.head(*self._split(path))
+        with self._head_lock:
+            self._heads[path] = (info, now)
+        if previous_etag is not None and previous_etag != info.etag:
+            logger.info("远程 Parquet 已更新: %s, etag %s → %s", path, previous_etag, info.etag)
+            self.cache.drop_other_etags(info.etag)
+        return info
+
+    def info(self, path, **kwargs):
+        obj = self.head(path)
+        return {
+            "name": self._strip_protocol(path), "size": obj.size,
+            "type": "file", "etag": obj.etag,
+        }
+
+    def modified(self, path):
+        # DuckDB 依据修改时间判断 Parquet 元数据缓存是否可用
+        return datetime.datetime.fromtimestamp(
+            self.head(path).last_modified, tz=datetime.timezone.utc
+        )
+
+    def ls(self, path, detail=True, **kwargs):
+        info = self.info(path)
+        return [info] if detail else [info["name"]]
+
+    def _open(self, path, mode="rb", block_size=None, autocommit=True, cache_options=None, **kwargs):
+        obj = self.head(path)
+        return CachedS3File(self, self._strip_protocol(path), size=obj.size, etag=obj.etag)
+
+    def read_range(self, path: str, etag: str, start: int, end: int) -> bytes:
+        """读取 [start, end)，按块对齐经缓存获取
+
+        对象已不是 etag 版本时立即重新 HEAD（丢弃缓存的元信息和旧块）并抛出 RemoteObjectChanged，
+        当前打开的文件作废，重新打开后读到的是新版本。
+        """
+        bucket, key = self._split(path)
+        block_size = self.cache.block_size
+        parts: list[bytes] = []
+        for index in range(start // block_size, (end - 1) // block_size + 1):
+            block_start = index * block_size
+
+            def fetch(block_start: int = block_start) -> bytes:
+                return self.client.get_range(
+                    bucket, key, block_start, block_start + block_size, etag
+                )
+
+            try:
+                block = self.cache.read_block(etag, index, fetch)
+            except RemoteObjectChanged:
+                self.version_changes += 1
+                self._refresh_head(path, etag)
+                raise
+            lo = max(start - block_start, 0)
+            hi = min(end - block_start, len(block))
+            parts.append(block[lo:hi])
+        return b"".join(parts)
+
+
+class CachedS3File(AbstractBufferedFile):
+    def __init__(self, fs: CachedS3FileSystem, path: str, *, size: int, etag: str):
+        self.etag = etag
+        super().__init__(fs, path, mode="rb", size=size, cache_type="none")
+
+    def _fetch_range(self, start, end):
+        end = min(end, self.size)
+        if start >= end:
+            return b""
+        return self.fs.read_range(self.path, self.etag, start, end)
+
+
+class FullDownloader:
+    """后台整文件下载：按块拉取到临时文件，校验大小后原子 rename 为 books-{etag}.parquet"""
+
+    def __init__(self, client: S3RangeClient, cache_dir: str, chunk_size: int):
+        self._client = client
+        self._dir = Path(cache_dir)
+        self._chunk_size = chunk_size
+        self._stop = threading.Event()
+        self.state = "idle"
+        self.bytes_downloaded = 0
+        self.total_bytes = 0
+        self.etag = ""
+
+    def local_path(self, etag: str) -> Path:
+        return self._dir / f"books-{etag}.parquet"
+
+    def download(self, bucket: str, key: str) -> Path | None:
+        """下载当前版本；已存在则直接返回，被取消或失败时返回 None"""
+        size, etag, _ = self._client.head(bucket, key)
+        target = self.local_path(etag)
+        self.total_bytes = size
+        self.etag = etag
+        if target.exists() and target.stat().st_size == size:
+            self.state = "done"
+            self.bytes_downloaded = size
+            return target
+
+        # 多 worker 时只由一个进程下载，其余进程等它完成后直接使用同一个文件
+        lock = FileLock(target.with_name(target.name + ".lock"))
+        while not lock.acquire(blocking=False):
+            self.state = "waiting"
+            if self._stop.wait(1.0):
+                self.state = "cancelled"
+                return None
+        try:
+            return self._download_locked(bucket, key, size, etag, target)
+        finally:
+            lock.release()
+
+    def _download_locked(
+        self, bucket: str, key: str, size: int, etag: str, target: Path
+    ) -> Path | None:
+        if target.exists() and target.stat().st_size == size:
+            self.state = "done"
+            self.bytes_downloaded = size
+            return target
+
+        self.state = "downloading"
+        self.bytes_downloaded = 0
+        tmp = target.with_name(target.name + ".tmp")
+        start_time = time.time()
+        try:
+            with tmp.open("wb") as f:
+                for start in range(0, size, self._chunk_size):
+                    if self._stop.is_set():
+                        self.state = "cancelled"
+                        return None
+                    end = min(start + self._chunk_size, size)
+                    f.write(self._client.get_range(bucket, key, start, end, etag))
+                    self.bytes_downloaded = end
+            if tmp.stat().st_size != size:
+                raise OSError(f"下载大小不一致: {tmp.stat().st_size} != {size}")
+            os.replace(tmp, target)
+        except Exception:
+            self.state = "failed"
+            tmp.unlink(missing_ok=True)
+            raise
+        finally:
+            if self.state == "cancelled":
+                tmp.unlink(missing_ok=True)
+
+        self.state = "done"
+        logger.info(
+            "远程 Parquet 整文件下载完成: %s (%.1f MB, 耗时 %.1f 秒)",
+            target, size / 1024 / 1024, time.time() - start_time,
+        )
+        return target
+
+    def remove_stale(self, etag: str) -> None:
+        """删除其它版本的整文件下载
+
+        调用方需确认已没有查询在读这些文件（见 SearchService._switch_source）；
+        其它 worker 读的是各自的硬链接，删除目录项不影响它们。
+        """
+        keep = self.local_path(etag)
+        for stale in self._dir.glob("books-*.parquet"):
+            if stale != keep:
+                stale.unlink(missing_ok=True)
+
+    def cancel(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "bytes_downloaded": self.bytes_downloaded,
+            "total_bytes": self.total_bytes,
+        }
@@ -0,0 +1,97 @@
+"""缓存的排序结果集：每个查询只跑一次 DuckDB，之后的翻页都在内存中切片
+
+结果集是 SearchService.search_ranked 的返回值：按 (rank, title_len, id) 排好序的前 N 本书、
+命中总数，以及 complete 标记（N 本书是否已是全部结果）。
+页码分页直接切片，游标分页对排序键二分定位；超出已缓存前缀的深翻页返回 None，
+由调用方回退到 DuckDB 分页查询。
+
+边输入边搜索时，新查询词往往是已缓存查询词的延长（"三" → "三体" → "三体 刘"）。
+匹配规则是对归一化列做子串包含，包含新词的书必然包含旧词，所以旧结果集完整时
+（complete 且带有 terms），新结果可由 refine 在内存中过滤、重排得到，不必再查 DuckDB。
+"""
+
+from bisect import bisect_right
+
+from app.services.search_cursor import SortKey
+
+Terms = tuple[str | None, str | None, str | None]
+
+
+def slice_page(
+    result_set: dict, page: int, page_size: int, after: SortKey | None = None
+) -> dict | None:
+    """从结果集中切出一页，格式与 SearchService.search 的返回值一致；前缀不足时返回 None"""
+    books: list[dict] = result_set["books"]
+    if after is not None:
+        # 共享缓存后端经 JSON 往返，排序键变为 list
+        start = bisect_right([tuple(book["key"]) for book in books], tuple(after))
+    else:
+        start = (page - 1) * page_size
+    end = start + page_size
+    if end > len(books) and not result_set["complete"]:
+        return None
+
+    page_books = books[start:end]
+    has_more = end < len(books) or not result_set["complete"]
+    return {
+        "books": page_books,
+        "next_key": tuple(page_books[-1]["key"]) if has_more and page_books else None,
+        "total_hits": result_set["total_hits"],
+        "total_books": result_set["total_books"],
+        "page": page,
+        "page_size": page_size,
+    }
+
+
+def can_refine(result_set: dict, terms: Terms) -> bool:
+    """result_set（或其 meta）是否包含 terms 的全部结果：完整、可细化，且每个查询词都是新词的子串"""
+    parent = result_set.get("terms")
+    if not result_set["complete"] or parent is None:
+        return False
+    parent_query, parent_title, parent_author = parent
+    query, title, author = terms
+    if parent_query or query:
+        # 旧版 q（title OR author）只与 q 互相细化
+        return bool(parent_query and query and parent_query in query)
+    return all(
+        not old or (new is not None and old in new)
+        for old, new in ((parent_title, title), (parent_author, author))
+    )
+
+
+def refine(result_set: dict, terms: Terms) -> dict:
+    """在内存中对完整结果集按新查询词过滤并重新排序，与 SearchService.search_ranked 的结果一致"""
+    query, title, author = terms
+    sort_term = title or query or ""
+    books: list[dict] = []
+    total_hits = 0
+    for book in result_set["books"]:
+        title_key, author_key = book["title_key"], book["author_key"]
+        if query:
+            matched = query in title_key or query in author_key
+        else:
+            matched = (not title or title in title_key) and (not author or author in author_key)
+        if not matched:
+            continue
+        if title_key == sort_term:
+            rank = 0
+        elif title_key.startswith(sort_term):
+            rank = 1
+        elif sort_term in title_key:
+            rank = 2
+        else:
+            rank = 3
+        _, title_len, book_id = book["key"]
+        books.append({**book, "key": (rank, title_len, book_id)})
+        total_hits += len(book["formats"])
+    books.sort(key=lambda book: book["key"])
+    return {
+        "books": books,
+        "next_key": None,
+        "total_hits": total_hits,
+        "total_books": len(books),
+        "page": 1,
+        "page_size": result_set["page_size"],
+        "complete": True,
+        "terms": terms,
+    }
@@ -0,0 +1,51 @@
+"""搜索结果 keyset 分页游标
+
+游标是对上一页最后一本书排序键 (rank, title_len, id) 的不透明编码，
+与 SearchService 的 ORDER BY rank, title_len, id 一一对应。
+游标内附带查询条件指纹，换了查询词的旧游标会被拒绝，而不是静默返回错位的结果。
+指纹区分旧版 q（title OR author）与分字段搜索，q=foo 的游标不能用于 title=foo。
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+
+# (相关性档位, 书名长度, 书籍 id)
+SortKey = tuple[int, int, str]
+
+
+def _fingerprint(query: str, title: str, author: str) -> str:
+    def norm(term: str) -> str:
+        return term.lower().strip()
+
+    if query:
+        raw = f"q:{norm(query)}"
+    else:
+        raw = f"t:{norm(title)}|a:{norm(author)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(key: SortKey, *, query: str = "", title: str = "", author: str = "") -> str:
+    payload = {"k": list(key), "f": _fingerprint(query, title, author)}
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(
+    cursor: str, *, query: str = "", title: str = "", author: str = ""
+) -> SortKey:
+    """解析游标，格式错误或与查询条件不匹配时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        rank, title_len, book_id = payload["k"]
+        fingerprint = payload["f"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+    if fingerprint != _fingerprint(query, title, author):
+        raise ValueError("cursor does not match query")
+    if not (isinstance(rank, int) and isinstance(title_len, int) and isinstance(book_id, str)):
+        raise ValueError("invalid cursor")
+    return rank, title_len, book_id
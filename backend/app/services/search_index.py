@@ -0,0 +1,83 @@
+"""N-gram 倒排索引：定义分词规则和候选集查询，供搜索服务和 ETL 构建脚本共用
+
+索引是一个独立的 DuckDB 文件，包含四张表：
+    docs(doc_id, md5, title, author, ...)   按 doc_id 排序的书目副本
+    postings(field, gram, doc_id)           按 (field, gram) 排序的倒排表
+    gram_stats(field, gram, df)             每个 gram 的文档频率，用于查询规划
+    meta(key, value)                        构建来源信息，用于判断索引是否过期
+
+分词采用字符二元组（bigram），作用于归一化后的 title_norm / author_norm 列，
+对中文无需分词器即可覆盖任意子串查询：
+长度 >= 2 的查询词取文档频率最低的若干个 bigram 求交得到候选集，再对候选行的
+title_norm / author_norm 做 contains() 精确校验；最稀有的 bigram 也覆盖了过多文档时，
+倒排求交不如直接扫描，由调用方回退到全表扫描。
+"""
+
+from app.services.dataset import is_derived_fresh
+
+INDEX_ALIAS = "search_index"
+INDEX_VERSION = "3"
+GRAM_SIZE = 2
+
+FIELD_TITLE = 0
+FIELD_AUTHOR = 1
+
+# 构建时的分词表达式，与 bigrams() 保持一致：对归一化列按字符切 bigram
+GRAMS_SQL = (
+    "list_distinct(list_transform(range(1, length({col})), "
+    "i -> substr({col}, i, 2)))"
+)
+
+
+def bigrams(text: str) -> list[str]:
+    """已归一化查询词的去重 bigram 列表（顺序稳定），长度不足时返回空列表"""
+    seen: dict[str, None] = {}
+    for i in range(len(text) - GRAM_SIZE + 1):
+        seen.setdefault(text[i:i + GRAM_SIZE], None)
+    return list(seen)
+
+
+def gram_df_sql(field: int, grams: list[str]) -> tuple[str, list[object]]:
+    """查询 grams 文档频率的 SQL"""
+    placeholders = ", ".join("?" for _ in grams)
+    sql = (
+        f"SELECT gram, df FROM {INDEX_ALIAS}.gram_stats "
+        f"WHERE field = ? AND gram IN ({placeholders})"
+    )
+    return sql, [field, *grams]
+
+
+def select_grams(
+    grams: list[str], df: dict[str, int], max_grams: int, max_df: int
+) -> list[str] | None:
+    """按文档频率挑选用于求交的 grams
+
+    返回空列表表示某个 gram 不存在（结果必为空）；返回 None 表示
+    最稀有的 gram 也超过 max_df，应回退到扫描。
+    """
+    if any(g not in df for g in grams):
+        return []
+    rarest = sorted(grams, key=lambda g: df[g])[:max_grams]
+    if df[rarest[0]] > max_df:
+        return None
+    return rarest
+
+
+def candidate_sql(field: int, grams: list[str]) -> tuple[str, list[object]]:
+    """包含全部 grams 的 doc_id 子查询（postings 按 gram 排序，只触及相关行组）"""
+    if not grams:
+        return "SELECT NULL :: INTEGER AS doc_id WHERE FALSE", []
+    placeholders = ", ".join("?" for _ in grams)
+    sql = (
+        f"SELECT doc_id FROM {INDEX_ALIAS}.postings "
+        f"WHERE field = ? AND gram IN ({placeholders}) "
+        "GROUP BY doc_id HAVING COUNT(*) = ?"
+    )
+    return sql, [field, *grams, len(grams)]
+
+
+def is_index_fresh(meta: dict[str, str], parquet_path: str, record_count: int) -> bool:
+    """索引与当前 Parquet 是否一致"""
+    return is_derived_fresh(
+        meta, parquet_path, record_count, version=INDEX_VERSION, label="搜索索引"
+    )
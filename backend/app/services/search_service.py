@@ -1,19 +1,135 @@
 import asyncio
+import contextvars
+import json
 import logging
+import os
+import threading
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
 from pathlib import Path
+from typing import Iterator, NamedTuple
 
 import duckdb
 
 from app.config import settings
+from app.core.file_lock import FileLock
+from app.core.timing import measure_stages, stage
+from app.core.worker import is_worker_alive, worker_id
+from app.services import dataset, search_index
+from app.services.duckdb_pool import DuckDBPool
+from app.services.metrics import metrics
+from app.services.query_executor import QueryCancelled, QueryGuard, query_executor
+from app.services.remote_cache import (
+    CACHE_PROTOCOL,
+    BlockCache,
+    CachedS3FileSystem,
+    FullDownloader,
+    S3RangeClient,
+)
+from app.services.search_cursor import SortKey
+from app.services.slow_query_log import SlowQueryLog, summarize_profile
+from app.services.text_normalize import (
+    AUTHOR_NORM,
+    TITLE_LEN,
+    TITLE_NORM,
+    has_normalized_columns,
+    normalize,
+)
 
 logger = logging.getLogger(__name__)
 
+# 搜索依赖的列，热重载时校验新文件
+REQUIRED_COLUMNS = ("md5", "title", "author", "extension", "filesize")
+
+# 描述当前数据集的属性，热重载时整体替换
+_DATASET_ATTRS = (
+    "parquet_path", "_pool", "_use_materialized", "_normalized_parquet", "materialized_meta",
+    "_use_index", "index_meta", "record_count", "_version", "_pinned_path", "loaded_at",
+)
+
+
+class DatasetReloadError(Exception):
+    """热重载被拒绝：新数据集校验失败、正在重载或当前模式不支持"""
+
+
+class _DatasetView(NamedTuple):
+    """一次查询使用的数据集快照，查询过程中发生热重载也始终读同一个版本"""
+
+    pool: DuckDBPool
+    parquet_path: str
+    use_materialized: bool
+    normalized_parquet: bool
+    use_index: bool
+    index_meta: dict[str, str]
+
+
+def _file_version(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def _pin_parquet(path: str, version: str) -> str:
+    """把要加载的 Parquet 硬链接为 {path}.{worker}.{version}.pinned，查询固定读这个链接
+
+    发布新版本时通常原地替换 books.parquet；链接指向加载时的 inode，热重载切换之前
+    的查询仍读旧版本，切换之后读新版本。顺带清理已退出 worker 留下的链接。
+    文件系统不支持硬链接时直接使用原路径。
+    """
+    source = Path(path)
+    for stale in source.parent.glob(f"{source.name}.*.pinned"):
+        wid = stale.name[len(source.name) + 1:].split(".")[0]
+        if not is_worker_alive(wid):
+            stale.unlink(missing_ok=True)
+    pinned = source.with_name(f"{source.name}.{worker_id()}.{version}.pinned")
+    try:
+        pinned.unlink(missing_ok=True)
+        os.link(source, pinned)
+    except OSError as e:
+        logger.warning("Parquet 硬链接失败，直接读取原文件（热重载期间可能读到新文件）: %s", e)
+        return path
+    return str(pinned)
+
+
+def _unpin_parquet(pinned: str) -> None:
+    if pinned.endswith(".pinned"):
+        try:
+            Path(pinned).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("删除 Parquet 硬链接失败: %s", e)
+
 
 class SearchService:
     def __init__(self):
         self.parquet_path: str = ""
         self._initialized: bool = False
         self._use_remote: bool = False
+        self._pool: DuckDBPool | None = None
+        self._use_materialized: bool = False
+        self._normalized_parquet: bool = False
+        self.materialized_meta: dict[str, str] = {}
+        self._use_index: bool = False
+        self.index_meta: dict[str, str] = {}
+        self.record_count: int = 0
+        self._version: str = ""
+        self._pinned_path: str = ""
+        self.loaded_at: float | None = None
+        self.last_reload: dict | None = None
+        # 查询取快照与热重载切换都在锁内进行，保证查询看到的是同一版本的全部属性
+        self._state_lock = threading.Lock()
+        self._reload_lock = asyncio.Lock()
+        self._watch_task: asyncio.Task | None = None
+        self.query_timeouts = 0
+        self.query_cancels = 0
+        self.slow_queries = SlowQueryLog(settings.SLOW_QUERY_LOG_SIZE)
+        self._profile_tasks: set[asyncio.Task] = set()
+        self._remote_fs: CachedS3FileSystem | None = None
+        self._downloader: FullDownloader | None = None
+        self._download_task: asyncio.Task | None = None
+        # 块缓存模式下的远程路径，及当前使用的整文件下载对应的 ETag（未切换到本地时为 None）
+        self._remote_path: str = ""
+        self._local_etag: str | None = None
+        # 挂载物化库 / 倒排索引时远程对象的 ETag（远程模式下派生文件只按行数校验，认不出内容变化）
+        self._derived_etag: str | None = None
 
     async def init(self):
         """初始化搜索服务：优先本地文件，否则尝试远程 S3 兼容存储"""
@@ -22,12 +138,15 @@ class SearchService:
 
         if local_path.exists():
             # 本地文件模式
-            count = await asyncio.to_thread(self._get_record_count)
+            await self._load_local(self.parquet_path)
             logger.info(
-                "DuckDB 搜索服务初始化成功（本地）: parquet=%s, records=%d",
-                self.parquet_path, count,
+                "DuckDB 搜索服务初始化成功（本地）: parquet=%s, records=%d, "
+                "materialized=%s, index=%s",
+                self.parquet_path, self.record_count, self._use_materialized, self._use_index,
             )
             self._initialized = True
+            if settings.DATASET_WATCH_INTERVAL > 0:
+                self._watch_task = asyncio.create_task(self._watch_dataset())
         elif settings.S3_ACCESS_KEY_ID and settings.S3_SECRET_ACCESS_KEY:
             # 远程 S3 兼容存储模式（Cloudflare R2 / 华为云 OBS 等）
             self._use_remote = True
@@ -35,39 +154,497 @@ class SearchService:
                 f"s3://{settings.S3_BUCKET}/{settings.S3_PARQUET_KEY}"
             )
             try:
+                if settings.REMOTE_CACHE_ENABLED:
+                    await asyncio.to_thread(self._setup_remote_cache)
+                self._pool = await asyncio.to_thread(self._create_pool)
+                if self._remote_fs is not None:
+                    self._pool.register_filesystem(self._remote_fs)
                 count = await asyncio.to_thread(self._get_record_count)
+                self.record_count = count
+                self.loaded_at = time.time()
+                await asyncio.to_thread(self._detect_normalized_columns)
+                await asyncio.to_thread(self._attach_materialized, count)
+                await asyncio.to_thread(self._attach_index, count)
                 logger.info(
-                    "DuckDB 搜索服务初始化成功（远程 S3）: parquet=%s, records=%d",
-                    self.parquet_path, count,
+                    "DuckDB 搜索服务初始化成功（远程 S3）: parquet=%s, records=%d, "
+                    "materialized=%s, index=%s",
+                    self.parquet_path, count, self._use_materialized, self._use_index,
                 )
                 self._initialized = True
             except Exception as e:
                 logger.error("远程 S3 Parquet 初始化失败: %s", e)
+            if self._initialized and self._use_remote and settings.REMOTE_CACHE_FULL_DOWNLOAD:
+                self._download_task = asyncio.create_task(self._run_full_download())
+            if (
+                self._initialized and self._remote_fs is not None
+                and settings.DATASET_WATCH_INTERVAL > 0
+            ):
+                self._watch_task = asyncio.create_task(self._watch_remote())
         else:
             logger.warning(
                 "Parquet 文件不存在且未配置 S3 凭证，搜索功能不可用"
             )
 
-    def _create_connection(self) -> duckdb.DuckDBPyConnection:
-        """创建 DuckDB 连接，远程模式下加载 httpfs 并配置 S3"""
-        conn = duckdb.connect(config={
-            "threads": str(settings.DUCKDB_THREADS),
-            "memory_limit": settings.DUCKDB_MEMORY_LIMIT,
-        })
-        if self._use_remote:
-            conn.install_extension("httpfs")
-            conn.load_extension("httpfs")
-            conn.execute(f"SET s3_endpoint='{settings.S3_ENDPOINT}'")
-            conn.execute(f"SET s3_access_key_id='{settings.S3_ACCESS_KEY_ID}'")
-            conn.execute(
-                f"SET s3_secret_access_key='{settings.S3_SECRET_ACCESS_KEY}'"
-            )
-            conn.execute(f"SET s3_url_style='{settings.S3_URL_STYLE}'")
-            conn.execute(f"SET s3_region='{settings.S3_REGION}'")
-        return conn
+    def _setup_remote_cache(self) -> None:
+        """远程模式启用本地块缓存：DuckDB 改经 s3cache:// 文件系统读取对象"""
+        client = S3RangeClient(
+            settings.S3_ENDPOINT,
+            settings.S3_ACCESS_KEY_ID,
+            settings.S3_SECRET_ACCESS_KEY,
+            settings.S3_REGION,
+            settings.S3_URL_STYLE,
+        )
+        cache = BlockCache(
+            settings.REMOTE_CACHE_DIR,
+            settings.REMOTE_CACHE_BLOCK_SIZE,
+            settings.REMOTE_CACHE_MAX_BYTES,
+        )
+        self._remote_fs = CachedS3FileSystem(client, cache, settings.REMOTE_CACHE_HEAD_TTL)
+        self._downloader = FullDownloader(
+            client, settings.REMOTE_CACHE_DIR, settings.REMOTE_CACHE_BLOCK_SIZE
+        )
+        self.parquet_path = f"{CACHE_PROTOCOL}://{settings.S3_BUCKET}/{settings.S3_PARQUET_KEY}"
+        self._remote_path = self.parquet_path
+
+        # 之前已完整下载过当前版本：直接切换到本地模式
+        obj = self._remote_fs.head(self.parquet_path)
+        self._derived_etag = obj.etag
+        local = self._downloader.local_path(obj.etag)
+        if local.exists() and local.stat().st_size == obj.size:
+            logger.info("远程 Parquet 已完整下载，使用本地文件: %s", local)
+            self._version = _file_version(str(local))
+            self._pinned_path = _pin_parquet(str(local), self._version)
+            self.parquet_path = self._pinned_path
+            self._use_remote = False
+            self._local_etag = obj.etag
+        self._downloader.remove_stale(obj.etag)
+
+    async def _run_full_download(self) -> None:
+        """后台下载完整 Parquet，完成后原子切换到本地模式"""
+        try:
+            path = await asyncio.to_thread(
+                self._downloader.download, settings.S3_BUCKET, settings.S3_PARQUET_KEY
+            )
+        except Exception:
+            logger.exception("远程 Parquet 整文件下载失败，继续使用块缓存")
+            return
+        if path is not None:
+            await self._switch_source(str(path), self._downloader.etag)
+
+    async def _switch_source(self, local: str | None, etag: str) -> None:
+        """切换到整文件下载（local）或回到块缓存模式（local 为 None），etag 为远程对象当前版本
+
+        与热重载相同：新建连接池后在锁内整体替换，进行中的查询继续在旧连接池上读旧文件
+        （固定为硬链接），旧连接池等它们跑完才关闭，之后再删除硬链接和其它版本的下载文件。
+        """
+        async with self._reload_lock:
+            self._drop_stale_derived(etag)
+            version = pinned = ""
+            if local is not None:
+                version = await asyncio.to_thread(_file_version, local)
+                pinned = await asyncio.to_thread(_pin_parquet, local, version)
+            pool = await asyncio.to_thread(self._create_pool)
+            await asyncio.to_thread(self._prepare_source_pool, pool)
+            path = pinned or self._remote_path
+            if local is not None:
+                logger.info("远程 Parquet 切换为本地文件: %s → %s", self.parquet_path, path)
+            else:
+                logger.info("本地文件已过期，回到块缓存模式: %s → %s", self.parquet_path, path)
+            with self._state_lock:
+                old_pool, old_pinned = self._pool, self._pinned_path
+                self._pool = pool
+                self.parquet_path = path
+                self._pinned_path = pinned
+                self._version = version
+                self._use_remote = local is None
+                self._local_etag = etag if local is not None else None
+
+            await asyncio.to_thread(old_pool.close, settings.DUCKDB_POOL_TIMEOUT)
+            await asyncio.to_thread(_unpin_parquet, old_pinned)
+            await asyncio.to_thread(self._downloader.remove_stale, etag)
+
+    def _prepare_source_pool(self, pool: DuckDBPool) -> None:
+        """新连接池注册块缓存文件系统，并重新挂载正在使用的物化库与倒排索引"""
+        pool.register_filesystem(self._remote_fs)
+        if self._use_materialized:
+            pool.attach(dataset.MATERIALIZED_ALIAS, settings.DUCKDB_DATABASE_PATH)
+        if self._use_index:
+            pool.attach(search_index.INDEX_ALIAS, settings.SEARCH_INDEX_PATH)
+
+    async def _watch_remote(self) -> None:
+        """轮询远程对象的 ETag：已切换到本地文件而对象被重新上传时，先回到块缓存模式
+        （每次读取都按 ETag 校验），开启 REMOTE_CACHE_FULL_DOWNLOAD 时再下载新版本并切换"""
+        while True:
+            await asyncio.sleep(settings.DATASET_WATCH_INTERVAL)
+            if self._local_etag is None:
+                continue
+            try:
+                info = await asyncio.to_thread(self._remote_fs.head, self._remote_path, fresh=True)
+            except Exception as e:
+                logger.warning("检查远程 Parquet 版本失败: %s", e)
+                continue
+            if info.etag == self._local_etag:
+                continue
+            await self._switch_source(None, info.etag)
+            if settings.REMOTE_CACHE_FULL_DOWNLOAD and (
+                self._download_task is None or self._download_task.done()
+            ):
+                self._download_task = asyncio.create_task(self._run_full_download())
+
+    def _drop_stale_derived(self, etag: str) -> None:
+        """远程对象已不是挂载派生文件时的版本：停用物化库与倒排索引，改为直接查询 Parquet
+
+        派生文件由旧版本构建，继续使用会返回旧数据；重新构建后重启服务即可恢复。
+        """
+        if self._derived_etag is None or etag == self._derived_etag:
+            return
+        if self._use_materialized or self._use_index:
+            logger.warning(
+                "远程 Parquet 版本已变化（%s → %s），停用物化数据库与搜索索引",
+                self._derived_etag, etag,
+            )
+        with self._state_lock:
+            self._use_materialized = False
+            self.materialized_meta = {}
+            self._use_index = False
+            self.index_meta = {}
+        self._derived_etag = None
+
+    async def _load_local(self, path: str) -> None:
+        """加载本地 Parquet：固定文件版本、建池、检测归一化列、挂载物化库与倒排索引
+
+        init 与热重载共用；热重载时在一个新的 SearchService 上执行，完成后整体替换过来。
+        """
+        self._version = _file_version(path)
+        self._pinned_path = await asyncio.to_thread(_pin_parquet, path, self._version)
+        self.parquet_path = self._pinned_path
+        self._pool = await asyncio.to_thread(self._create_pool)
+        self.record_count = await asyncio.to_thread(self._get_record_count)
+        self.loaded_at = time.time()
+        await asyncio.to_thread(self._detect_normalized_columns)
+        await asyncio.to_thread(self._attach_materialized, self.record_count)
+        await asyncio.to_thread(self._attach_index, self.record_count)
+
+    async def reload(self, *, force: bool = False) -> dict:
+        """热重载本地 Parquet：校验、预热新版本后原子切换
+
+        切换前开始的查询在旧连接池上跑完，切换后的查询使用新版本；结果缓存的 key 带数据集版本，
+        切换即失效。文件未变化时不做任何事；force 时跳过行数骤减的检查。
+        """
+        if not self._initialized or self._use_remote:
+            raise DatasetReloadError("只有本地文件模式支持热重载")
+        if self._reload_lock.locked():
+            raise DatasetReloadError("数据集正在重新加载")
+        async with self._reload_lock:
+            path = settings.DUCKDB_PARQUET_PATH
+            try:
+                version = _file_version(path)
+            except OSError as e:
+                raise DatasetReloadError(f"数据集文件不可读: {e}") from e
+            if version == self._version:
+                return {"changed": False, "version": self._version}
+
+            start = time.perf_counter()
+            staged = SearchService()
+            try:
+                await staged._load_local(path)
+                await asyncio.to_thread(staged._validate, self.record_count, force)
+                await asyncio.to_thread(staged._warm_up)
+            except Exception as e:
+                await staged.close()
+                if isinstance(e, DatasetReloadError):
+                    raise
+                raise DatasetReloadError(f"新数据集加载失败: {type(e).__name__}: {e}") from e
+            prepared = time.perf_counter()
+
+            old_version = self._version
+            with self._state_lock:
+                old_pool, old_pinned = self._pool, self._pinned_path
+                for name in _DATASET_ATTRS:
+                    setattr(self, name, getattr(staged, name))
+            swapped = time.perf_counter()
+
+            # 旧连接池等借出的连接归还（进行中的查询结束）后关闭
+            await asyncio.to_thread(old_pool.close, settings.DUCKDB_POOL_TIMEOUT)
+            await asyncio.to_thread(_unpin_parquet, old_pinned)
+            self.last_reload = {
+                "at": time.time(),
+                "from_version": old_version,
+                "version": self._version,
+                "records": self.record_count,
+                "prepare_ms": round((prepared - start) * 1000, 1),
+                "swap_ms": round((swapped - prepared) * 1000, 3),
+                "drain_ms": round((time.perf_counter() - swapped) * 1000, 1),
+            }
+            logger.info(
+                "数据集已热重载: %s → %s, records=%d, 准备 %.0fms, 切换 %.3fms",
+                old_version, self._version, self.record_count,
+                self.last_reload["prepare_ms"], self.last_reload["swap_ms"],
+            )
+            return {"changed": True, **self.last_reload}
+
+    def _validate(self, previous_count: int, force: bool) -> None:
+        """校验新数据集：必需列齐全、非空，且行数没有骤减（防止发布了截断的文件）"""
+        with self._connection() as conn:
+            columns = dataset.parquet_columns(conn, self.parquet_path)
+        missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+        if missing:
+            raise DatasetReloadError(f"新数据集缺少列: {', '.join(missing)}")
+        if self.record_count == 0:
+            raise DatasetReloadError("新数据集没有记录")
+        min_count = int(previous_count * settings.DATASET_RELOAD_MIN_ROW_RATIO)
+        if not force and self.record_count < min_count:
+            raise DatasetReloadError(
+                f"新数据集行数 {self.record_count} 低于当前的 "
+                f"{settings.DATASET_RELOAD_MIN_ROW_RATIO:.0%}（{previous_count}），"
+                "确认无误请使用 force"
+            )
+
+    def _warm_up(self) -> None:
+        """切换前执行一次真实搜索，预先读入文件元数据和常用页"""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT title FROM read_parquet(?) WHERE title IS NOT NULL LIMIT 1",
+                [self.parquet_path],
+            ).fetchone()
+        if row is not None:
+            self._sync_search(None, 1, 20, row[0][:2], None)
+
+    async def _watch_dataset(self) -> None:
+        """轮询 DUCKDB_PARQUET_PATH，文件变化且连续两次检查一致（写入完成）后自动热重载"""
+        pending: str | None = None
+        while True:
+            await asyncio.sleep(settings.DATASET_WATCH_INTERVAL)
+            try:
+                version = _file_version(settings.DUCKDB_PARQUET_PATH)
+            except OSError:
+                continue
+            if version == self._version:
+                pending = None
+                continue
+            if version != pending:
+                pending = version
+                continue
+            try:
+                await self.reload()
+            except DatasetReloadError as e:
+                logger.error("数据集自动热重载失败: %s", e)
+            except Exception:
+                logger.exception("数据集自动热重载失败")
+            pending = None
+
+    def _create_pool(self) -> DuckDBPool:
+        """创建 DuckDB 连接池，远程模式（未启用块缓存时）加载 httpfs 并配置 S3"""
+        s3_settings = None
+        if self._use_remote and self._remote_fs is None:
+            s3_settings = {
+                "s3_endpoint": settings.S3_ENDPOINT,
+                "s3_access_key_id": settings.S3_ACCESS_KEY_ID,
+                "s3_secret_access_key": settings.S3_SECRET_ACCESS_KEY,
+                "s3_url_style": settings.S3_URL_STYLE,
+                "s3_region": settings.S3_REGION,
+            }
+        return DuckDBPool(
+            settings.DUCKDB_POOL_SIZE,
+            threads=settings.duckdb_worker_threads,
+            memory_limit=settings.duckdb_worker_memory_limit,
+            acquire_timeout=settings.DUCKDB_POOL_TIMEOUT,
+            health_check_interval=settings.DUCKDB_POOL_HEALTH_CHECK_INTERVAL,
+            s3_settings=s3_settings,
+        )
+
+    def _detect_normalized_columns(self) -> None:
+        """检查 Parquet 是否带有 etl.export_parquet 写出的归一化预计算列"""
+        with self._connection() as conn:
+            columns = dataset.parquet_columns(conn, self.parquet_path)
+        self._normalized_parquet = has_normalized_columns(columns)
+        if not self._normalized_parquet:
+            logger.warning("Parquet 缺少归一化列，回退到 ILIKE 匹配，请重新运行 etl.export_parquet")
+
+    def _attach_materialized(self, record_count: int) -> None:
+        """挂载物化 DuckDB 数据库；缺失或过期时按配置在启动时重建，否则继续查询 Parquet"""
+        self._use_materialized = False
+        self.materialized_meta = {}
+        if not settings.DUCKDB_DATABASE_ENABLED:
+            return
+        db_path = settings.DUCKDB_DATABASE_PATH
+        meta = self._read_fresh_materialized_meta(db_path, record_count)
+        if not meta:
+            if not settings.DUCKDB_MATERIALIZE_ON_STARTUP or self._use_remote:
+                logger.info("物化数据库不可用，直接查询 Parquet: %s", db_path)
+                return
+            try:
+                # 多 worker 同时启动时只由一个进程重建，其余进程等待后直接使用它的结果
+                with FileLock(db_path + ".lock"):
+                    meta = self._read_fresh_materialized_meta(db_path, record_count)
+                    if not meta:
+                        dataset.materialize(self.parquet_path, db_path)
+                        meta = dataset.read_meta(db_path)
+            except Exception:
+                logger.exception("启动时物化 DuckDB 数据库失败，直接查询 Parquet")
+                return
+        try:
+            self._pool.attach(dataset.MATERIALIZED_ALIAS, db_path)
+        except Exception as e:
+            logger.error("物化数据库挂载失败，直接查询 Parquet: %s", e)
+            return
+        self.materialized_meta = meta
+        self._use_materialized = True
+
+    def _read_fresh_materialized_meta(self, db_path: str, record_count: int) -> dict[str, str]:
+        """读取物化数据库的元数据；文件缺失、损坏或已过期时返回空字典"""
+        if not Path(db_path).exists():
+            return {}
+        try:
+            meta = dataset.read_meta(db_path)
+        except Exception as e:
+            logger.error("物化数据库读取失败: %s", e)
+            return {}
+        fresh = bool(meta) and dataset.is_derived_fresh(
+            meta, self.parquet_path, record_count,
+            version=dataset.MATERIALIZED_VERSION, label="物化数据库",
+        )
+        return meta if fresh else {}
+
+    def _attach_index(self, record_count: int) -> None:
+        """挂载 N-gram 倒排索引；索引缺失、损坏或过期时保持 ILIKE 扫描模式"""
+        self._use_index = False
+        self.index_meta = {}
+        index_path = Path(settings.SEARCH_INDEX_PATH)
+        if not settings.SEARCH_INDEX_ENABLED:
+            return
+        if not index_path.exists():
+            logger.info("搜索索引不存在，使用 ILIKE 扫描: %s", index_path)
+            return
+        try:
+            self._pool.attach(search_index.INDEX_ALIAS, str(index_path))
+            with self._connection() as conn:
+                meta = dict(conn.execute(
+                    f"SELECT key, value FROM {search_index.INDEX_ALIAS}.meta"
+                ).fetchall())
+        except Exception as e:
+            logger.error("搜索索引挂载失败，使用 ILIKE 扫描: %s", e)
+            return
+        if not search_index.is_index_fresh(meta, self.parquet_path, record_count):
+            logger.warning("搜索索引已过期，使用 ILIKE 扫描，请重新运行 etl.build_search_index")
+            return
+        self.index_meta = meta
+        self._use_index = True
+
+    def _connection(self) -> AbstractContextManager[duckdb.DuckDBPyConnection]:
+        if self._pool is None:
+            raise RuntimeError("DuckDB connection pool not initialized")
+        return self._pool.connection()
+
+    def _view(self) -> _DatasetView:
+        with self._state_lock:
+            if self._pool is None:
+                raise RuntimeError("DuckDB connection pool not initialized")
+            return _DatasetView(
+                self._pool, self.parquet_path, self._use_materialized,
+                self._normalized_parquet, self._use_index, self.index_meta,
+            )
+
+    async def dataset_version(self) -> str:
+        """当前数据集版本：本地文件取加载时的 size + mtime，远程块缓存模式取 ETag
+
+        供结果缓存作为 key 的一部分，热重载切换到新文件后旧缓存自然失效。
+        直连 httpfs 的远程模式无法廉价获取版本，返回路径本身（依赖缓存 TTL 过期）。
+        """
+        if not self._use_remote:
+            return self._version
+        if self._remote_fs is not None:
+            # HEAD 结果在 REMOTE_CACHE_HEAD_TTL 内复用，过期时才有一次网络往返
+            try:
+                info = await asyncio.to_thread(self._remote_fs.head, self.parquet_path)
+            except Exception as e:
+                logger.warning("获取远程 Parquet ETag 失败: %s", e)
+                return self.parquet_path
+            self._drop_stale_derived(info.etag)
+            return info.etag
+        return self.parquet_path
+
+    def dataset_stats(self) -> dict:
+        """当前数据集版本与最近一次热重载的耗时"""
+        return {
+            "version": self._version if not self._use_remote else None,
+            "source_path": settings.DUCKDB_PARQUET_PATH,
+            "active_path": self.parquet_path,
+            "records": self.record_count,
+            "loaded_at": self.loaded_at,
+            "reloading": self._reload_lock.locked(),
+            "last_reload": self.last_reload,
+        }
+
+    def materialized_stats(self) -> dict:
+        """物化数据库状态"""
+        return {
+            "enabled": self._use_materialized,
+            "path": settings.DUCKDB_DATABASE_PATH,
+            "source_rows": self.materialized_meta.get("source_rows"),
+            "built_at": self.materialized_meta.get("built_at"),
+        }
+
+    def index_stats(self) -> dict:
+        """倒排索引状态"""
+        return {
+            "enabled": self._use_index,
+            "path": settings.SEARCH_INDEX_PATH,
+            "source_rows": self.index_meta.get("source_rows"),
+            "built_at": self.index_meta.get("built_at"),
+        }
+
+    def remote_cache_stats(self) -> dict | None:
+        """远程块缓存与整文件下载统计（未启用时返回 None）"""
+        if self._remote_fs is None:
+            return None
+        return {
+            "blocks": self._remote_fs.cache.stats(),
+            "full_download": self._downloader.stats(),
+        }
+
+    def pool_stats(self) -> dict | None:
+        """连接池统计（未初始化时返回 None）"""
+        return self._pool.stats() if self._pool else None
+
+    def executor_stats(self) -> dict:
+        """查询线程池排队与拒绝统计，及超时 / 取消而中断的查询数"""
+        return {
+            **query_executor.stats(),
+            "timeout": settings.SEARCH_QUERY_TIMEOUT,
+            "timeouts": self.query_timeouts,
+            "cancelled": self.query_cancels,
+        }
 
     async def close(self):
-        """无需清理（每次查询用独立连接）"""
+        """停止后台任务并关闭连接池"""
+        for task in list(self._profile_tasks):
+            task.cancel()
+        if self._profile_tasks:
+            await asyncio.gather(*self._profile_tasks, return_exceptions=True)
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        if self._download_task is not None:
+            self._downloader.cancel()
+            self._download_task.cancel()
+            try:
+                await self._download_task
+            except asyncio.CancelledError:
+                pass
+            self._download_task = None
+        if self._remote_fs is not None:
+            self._remote_fs.client.close()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.close)
+        if self._pinned_path:
+            await asyncio.to_thread(_unpin_parquet, self._pinned_path)
+            self._pinned_path = ""
         logger.info("DuckDB 搜索服务已关闭")
 
     async def search(
@@ -78,24 +655,214 @@ class SearchService:
         *,
         title: str | None = None,
         author: str | None = None,
+        after: SortKey | None = None,
     ) -> dict:
-        """搜索书籍，支持分字段搜索（title/author AND 关系）和旧版 q 参数"""
+        """搜索书籍，支持分字段搜索（title/author AND 关系）和旧版 q 参数
+
+        after 为上一页最后一本书的排序键（见 search_cursor），给出时忽略 page，
+        从该位置之后继续取 page_size 本（keyset 分页）。
+        """
         if not self._initialized:
             raise RuntimeError("SearchService not initialized, call init() first")
 
         logger.debug(
-            "搜索请求: query=%s, title=%s, author=%s, page=%d, page_size=%d",
-            query, title, author, page, page_size,
-        )
-        result = await asyncio.to_thread(
-            self._sync_search, query, page, page_size, title, author
+            "搜索请求: query=%s, title=%s, author=%s, page=%d, page_size=%d, after=%s",
+            query, title, author, page, page_size, after,
         )
+        # 专用有界线程池，过载时抛出 QueryOverloaded；超时或客户端断开时中断 DuckDB 查询
+        start = time.perf_counter()
+        try:
+            with self._query_guard() as guard, measure_stages() as stages:
+                result = await query_executor.run(
+                    self._sync_search, query, page, page_size, title, author, after, guard
+                )
+        except asyncio.CancelledError:
+            self.query_cancels += 1
+            logger.info(
+                "搜索已取消: query=%s, title=%s, author=%s, page=%d", query, title, author, page
+            )
+            raise
+        except QueryCancelled as e:
+            # 计数与慢查询记录的 timed_out 一致：只有超过时限才算超时，其余中断算取消
+            if e.reason == "timeout":
+                self.query_timeouts += 1
+                logger.warning(
+                    "搜索超时已中断: query=%s, title=%s, author=%s, page=%d, page_size=%d, "
+                    "after=%s, timeout=%.1fs",
+                    query, title, author, page, page_size, after, settings.SEARCH_QUERY_TIMEOUT,
+                )
+            else:
+                self.query_cancels += 1
+                logger.info(
+                    "搜索已中断: query=%s, title=%s, author=%s, page=%d, reason=%s",
+                    query, title, author, page, e.reason,
+                )
+            # 被中断的查询是最慢的那批，同样记入慢查询日志
+            if settings.SLOW_QUERY_THRESHOLD > 0:
+                params = self._slow_query_params(query, title, author, page, page_size, after)
+                self._record_slow_query(
+                    params, time.perf_counter() - start, stages, None,
+                    timed_out=e.reason == "timeout",
+                )
+            raise
+        elapsed = time.perf_counter() - start
         logger.info(
             "搜索完成: query=%s, title=%s, author=%s, total_hits=%d, page=%d",
             query, title, author, result["total_hits"], page,
         )
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        if threshold > 0 and elapsed >= threshold:
+            params = self._slow_query_params(query, title, author, page, page_size, after)
+            self._record_slow_query(params, elapsed, stages, result)
+        return result
+
+    @staticmethod
+    def _slow_query_params(
+        query: str | None,
+        title: str | None,
+        author: str | None,
+        page: int,
+        page_size: int,
+        after: SortKey | None,
+    ) -> dict:
+        """慢查询记录中的查询参数，与 profile_query 的参数一一对应"""
+        return {
+            "query": query, "title": title, "author": author,
+            "page": page, "page_size": page_size, "after": list(after) if after else None,
+        }
+
+    @contextmanager
+    def _query_guard(self) -> Iterator[QueryGuard]:
+        """查询中断器：超过 SEARCH_QUERY_TIMEOUT 或调用方被取消（客户端断开）时中断 DuckDB 查询"""
+        guard = QueryGuard()
+        timeout = settings.SEARCH_QUERY_TIMEOUT
+        timer = (
+            asyncio.get_running_loop().call_later(timeout, guard.cancel, "timeout")
+            if timeout > 0 else None
+        )
+        try:
+            yield guard
+        except asyncio.CancelledError:
+            guard.cancel("cancelled")
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _record_slow_query(
+        self,
+        params: dict,
+        elapsed: float,
+        stages: dict[str, float],
+        result: dict | None,
+        *,
+        timed_out: bool = False,
+    ) -> None:
+        """记录慢查询；开启 SLOW_QUERY_PROFILE 时在后台补上 EXPLAIN ANALYZE 概要
+
+        后台分析会重跑一次查询，同一时间只跑一个，其余慢查询标记为 skipped，
+        避免慢查询集中出现时分析本身再压垮查询线程池。
+        被中断的查询没有结果（result 为 None），重跑分析同样会超时，也标记为 skipped，可按需重新分析。
+        """
+        if not settings.SLOW_QUERY_PROFILE:
+            status = "disabled"
+        elif self._profile_tasks or result is None:
+            status = "skipped"
+        else:
+            status = "pending"
+        entry = self.slow_queries.add({
+            "params": params,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in stages.items()},
+            "timed_out": timed_out,
+            "total_hits": result["total_hits"] if result is not None else None,
+            "books": len(result["books"]) if result is not None else None,
+            "count_mode": settings.DUCKDB_COUNT_MODE,
+            "dataset_version": self._version,
+            "profile_status": status,
+            "profile": None,
+        })
+        logger.warning(
+            "慢查询: id=%d, elapsed=%.0fms, timed_out=%s, params=%s, stages=%s",
+            entry["id"], entry["elapsed_ms"], timed_out, params, entry["stages_ms"],
+        )
+        if status == "pending":
+            # 在空白上下文中运行，不计入发起请求的阶段计时
+            task = asyncio.create_task(
+                self._capture_profile(entry["id"], params), context=contextvars.Context()
+            )
+            self._profile_tasks.add(task)
+            task.add_done_callback(self._profile_tasks.discard)
+
+    async def _capture_profile(self, entry_id: int, params: dict) -> dict | None:
+        """重跑 EXPLAIN ANALYZE 并写回慢查询记录，返回更新后的记录（已被挤出缓冲时为 None）"""
+        try:
+            profile = await self.profile_query(**params)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("慢查询分析失败: id=%d, error=%s", entry_id, e)
+            return self.slow_queries.update(
+                entry_id, profile_status="failed", profile_error=str(e) or type(e).__name__
+            )
+        return self.slow_queries.update(
+            entry_id, profile_status="done", profile=profile, profiled_at=time.time()
+        )
+
+    async def reprofile_slow_query(self, entry_id: int) -> dict | None:
+        """按需重新分析一条慢查询记录；记录不存在时返回 None"""
+        entry = self.slow_queries.get(entry_id)
+        if entry is None:
+            return None
+        return await self._capture_profile(entry_id, entry["params"])
+
+    async def profile_query(
+        self,
+        query: str | None = None,
+        title: str | None = None,
+        author: str | None = None,
+        page: int = 1,
+        page_size: int = 20,
+        after: SortKey | None = None,
+    ) -> dict:
+        """用与 search 相同的 SQL 跑 EXPLAIN ANALYZE，返回各条 SQL 的执行计划概要（见 summarize_profile）
+
+        与普通查询一样经过查询线程池的准入控制和 SEARCH_QUERY_TIMEOUT。
+        """
+        if not self._initialized:
+            raise RuntimeError("SearchService not initialized, call init() first")
+        with self._query_guard() as guard:
+            return await query_executor.run(
+                self._sync_profile, query, page, page_size, title, author, after, guard
+            )
+
+    async def search_ranked(
+        self,
+        query: str | None = None,
+        *,
+        title: str | None = None,
+        author: str | None = None,
+        limit: int,
+    ) -> dict:
+        """取合并排序后的前 limit 本书（结果集缓存用），complete 表示已包含全部结果
+
+        terms 为归一化后的 (q, title, author)：结果按预计算列匹配时，合并键与查询词规则一致，
+        更长的查询词可直接在内存中过滤这份结果集；按原始列 ILIKE 时为 None，不可细化。
+        """
+        result = await self.search(query, 1, limit, title=title, author=author)
+        result["complete"] = result["next_key"] is None
+        result["terms"] = self.refinable_terms(query, title, author)
         return result
 
+    def refinable_terms(
+        self, query: str | None, title: str | None, author: str | None
+    ) -> tuple[str | None, str | None, str | None] | None:
+        """全表扫描也会按归一化列匹配时返回归一化后的查询词，否则返回 None（只用倒排索引时不算）"""
+        terms = self._normalize_terms(query, title, author)
+        if terms is None or not (self._use_materialized or self._normalized_parquet):
+            return None
+        return terms
+
     def _sync_search(
         self,
         query: str | None,
@@ -103,64 +870,410 @@ class SearchService:
         page_size: int,
         title: str | None,
         author: str | None,
+        after: SortKey | None = None,
+        guard: QueryGuard | None = None,
     ) -> dict:
-        """同步 DuckDB 查询（在线程中执行）"""
-        fetch_limit = max(page_size * 10, 200)
+        """同步 DuckDB 查询（在线程中执行）：合并多格式、相关性排序和分页都在 SQL 中完成
+
+        远程块缓存模式下对象在查询途中被重新上传时（见 RemoteObjectChanged），按新版本重试一次。
+        """
+        changes = self._remote_fs.version_changes if self._remote_fs is not None else 0
+        try:
+            return self._run_search(query, page, page_size, title, author, after, guard)
+        except duckdb.Error:
+            if self._remote_fs is None or self._remote_fs.version_changes == changes:
+                raise
+            logger.info("远程 Parquet 在查询途中更新，按新版本重试: query=%s", query)
+            self._drop_stale_derived(self._remote_fs.head(self._remote_path).etag)
+            return self._run_search(query, page, page_size, title, author, after, guard)
+
+    def _run_search(
+        self,
+        query: str | None,
+        page: int,
+        page_size: int,
+        title: str | None,
+        author: str | None,
+        after: SortKey | None,
+        guard: QueryGuard | None,
+    ) -> dict:
+        mode = settings.DUCKDB_COUNT_MODE
+        terms = self._normalize_terms(query, title, author)
+        view = self._view()
+        with view.pool.connection() as conn, guard.running(conn) if guard else nullcontext():
+            from_where, params, normalized, sort_term = self._plan_source(
+                view, conn, query, title, author, terms
+            )
+            with (
+                stage("duckdb_fetch"),
+                metrics.timer("easybook_duckdb_query_duration_seconds", "fetch"),
+            ):
+                books, next_key, total_books, total_hits = self._fetch_ranked_page(
+                    conn, from_where, params, sort_term, page, page_size, after,
+                    normalized=normalized,
+                )
+            metrics.observe("easybook_duckdb_rows_returned", len(books), "fetch")
+            if mode == "separate":
+                with (
+                    stage("duckdb_count"),
+                    metrics.timer("easybook_duckdb_query_duration_seconds", "count"),
+                ):
+                    total_hits = self._count_exact(conn, from_where, params)
+
+        return {
+            "books": books,
+            "next_key": next_key,
+            "total_hits": total_hits,
+            "total_books": total_books,
+            "page": page,
+            "page_size": page_size,
+        }
+
+    def _sync_profile(
+        self,
+        query: str | None,
+        page: int,
+        page_size: int,
+        title: str | None,
+        author: str | None,
+        after: SortKey | None = None,
+        guard: QueryGuard | None = None,
+    ) -> dict:
+        """同步执行 EXPLAIN ANALYZE（在线程中执行）：SQL 与 _sync_search 相同，只返回计划概要"""
+        mode = settings.DUCKDB_COUNT_MODE
+        terms = self._normalize_terms(query, title, author)
+        view = self._view()
+        with view.pool.connection() as conn, guard.running(conn) if guard else nullcontext():
+            from_where, params, normalized, sort_term = self._plan_source(
+                view, conn, query, title, author, terms
+            )
+            sql, sql_params = self._ranked_page_sql(
+                from_where, params, sort_term, page, page_size, after, normalized=normalized
+            )
+            profile = {"fetch": self._explain_analyze(conn, sql, sql_params)}
+            if mode == "separate":
+                profile["count"] = self._explain_analyze(conn, self._count_sql(from_where), params)
+        return profile
+
+    @staticmethod
+    def _explain_analyze(
+        conn: duckdb.DuckDBPyConnection, sql: str, params: list[object]
+    ) -> dict:
+        row = conn.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params).fetchone()
+        return summarize_profile(json.loads(row[1]))
+
+    def _plan_source(
+        self,
+        view: _DatasetView,
+        conn: duckdb.DuckDBPyConnection,
+        query: str | None,
+        title: str | None,
+        author: str | None,
+        terms: tuple[str | None, str | None, str | None] | None,
+    ) -> tuple[str, list[object], bool, str]:
+        """选择查询来源（倒排索引或全表扫描），terms 为 _normalize_terms 的结果
+
+        返回 (FROM ... WHERE ..., 参数, 是否按归一化列匹配, 排序用的查询词)。
+        """
+        with stage("duckdb_fetch"):
+            source = (
+                self._build_index_source(view, conn, *terms)
+                if view.use_index and terms is not None else None
+            )
+        normalized = source is not None or (
+            terms is not None and (view.use_materialized or view.normalized_parquet)
+        )
+        if normalized:
+            query, title, author = terms
+        if source is None:
+            source = self._build_scan_source(view, query, title, author, normalized=normalized)
+        from_where, params = source
+        return from_where, params, normalized, (title or query or "").strip()
 
-        # 动态构建 WHERE 子句
+    @staticmethod
+    def _normalize_terms(
+        query: str | None, title: str | None, author: str | None
+    ) -> tuple[str | None, str | None, str | None] | None:
+        """归一化查询词；某个词只含空白/标点、归一化后为空时返回 None，由调用方按原词 ILIKE"""
+        normalized: list[str | None] = []
+        for term in (query, title, author):
+            if not term:
+                normalized.append(None)
+                continue
+            norm = normalize(term)
+            if not norm:
+                return None
+            normalized.append(norm)
+        return normalized[0], normalized[1], normalized[2]
+
+    @staticmethod
+    def _build_scan_source(
+        view: _DatasetView,
+        query: str | None,
+        title: str | None,
+        author: str | None,
+        *,
+        normalized: bool = False,
+    ) -> tuple[str, list[object]]:
+        """全表扫描：优先物化数据库，否则直接读取 Parquet；normalized 时匹配预计算列"""
+        condition, params = SearchService._build_filter(
+            query, title, author, normalized=normalized
+        )
+        where_clause = f"WHERE {condition}" if condition else ""
+        if view.use_materialized:
+            return f"FROM {dataset.MATERIALIZED_ALIAS}.books {where_clause}", params
+        return f"FROM read_parquet(?) {where_clause}", [view.parquet_path, *params]
+
+    def _build_index_source(
+        self,
+        view: _DatasetView,
+        conn: duckdb.DuckDBPyConnection,
+        query: str | None,
+        title: str | None,
+        author: str | None,
+    ) -> tuple[str, list[object]] | None:
+        """倒排索引查询：稀有 bigram 候选集 + 归一化列校验；索引无法缩小范围时返回 None
+
+        查询词需已归一化（_normalize_terms）。
+        """
+        if title or author:
+            plans = [
+                (field, self._plan_grams(view, conn, field, term))
+                for field, term in (
+                    (search_index.FIELD_TITLE, title),
+                    (search_index.FIELD_AUTHOR, author),
+                )
+                if term
+            ]
+            # 过于常见的查询词不参与求交，交给 contains 校验
+            plans = [(field, grams) for field, grams in plans if grams is not None]
+            if not plans:
+                return None
+            candidates: list[str] = []
+            params: list[object] = []
+            for field, grams in plans:
+                sql, sql_params = search_index.candidate_sql(field, grams)
+                candidates.append(f"doc_id IN ({sql})")
+                params.extend(sql_params)
+        elif query:
+            title_grams = self._plan_grams(view, conn, search_index.FIELD_TITLE, query)
+            author_grams = self._plan_grams(view, conn, search_index.FIELD_AUTHOR, query)
+            if title_grams is None or author_grams is None:
+                return None
+            title_sql, title_params = search_index.candidate_sql(
+                search_index.FIELD_TITLE, title_grams
+            )
+            author_sql, author_params = search_index.candidate_sql(
+                search_index.FIELD_AUTHOR, author_grams
+            )
+            candidates = [f"doc_id IN ({title_sql} UNION {author_sql})"]
+            params = [*title_params, *author_params]
+        else:
+            return None
+
+        condition, filter_params = self._build_filter(query, title, author, normalized=True)
+        conditions = " AND ".join([*candidates, condition])
+        return (
+            f"FROM {search_index.INDEX_ALIAS}.docs WHERE {conditions}",
+            [*params, *filter_params],
+        )
+
+    @staticmethod
+    def _plan_grams(
+        view: _DatasetView, conn: duckdb.DuckDBPyConnection, field: int, term: str
+    ) -> list[str] | None:
+        """为单个查询词挑选求交用的 bigram；词太短或过于常见时返回 None"""
+        grams = search_index.bigrams(term)
+        if not grams:
+            return None
+        sql, params = search_index.gram_df_sql(field, grams)
+        df = dict(conn.execute(sql, params).fetchall())
+        max_df = int(
+            int(view.index_meta.get("source_rows", 0)) * settings.SEARCH_INDEX_MAX_DF_RATIO
+        )
+        return search_index.select_grams(grams, df, settings.SEARCH_INDEX_MAX_GRAMS, max_df)
+
+    @staticmethod
+    def _build_filter(
+        query: str | None,
+        title: str | None,
+        author: str | None,
+        *,
+        normalized: bool = False,
+    ) -> tuple[str, list[object]]:
+        """动态构建过滤条件（不含 WHERE 关键字）
+
+        normalized=True 时查询词已归一化，对预计算的 title_norm / author_norm 列做 contains，
+        省去逐行大小写折叠；否则对原始列 ILIKE。
+        """
+        if normalized:
+            title_match = f"contains({TITLE_NORM}, ?)"
+            author_match = f"contains({AUTHOR_NORM}, ?)"
+
+            def pattern(term: str) -> str:
+                return term
+        else:
+            title_match, author_match = "title ILIKE ?", "author ILIKE ?"
+
+            def pattern(term: str) -> str:
+                return f"%{term}%"
         conditions: list[str] = []
-        params: list[object] = [self.parquet_path]
+        params: list[object] = []
 
         if title and author:
-            conditions.append("title ILIKE ? AND author ILIKE ?")
-            params.extend([f"%{title}%", f"%{author}%"])
+            conditions.append(f"{title_match} AND {author_match}")
+            params.extend([pattern(title), pattern(author)])
         elif title:
-            conditions.append("title ILIKE ?")
-            params.append(f"%{title}%")
+            conditions.append(title_match)
+            params.append(pattern(title))
         elif author:
-            conditions.append("author ILIKE ?")
-            params.append(f"%{author}%")
+            conditions.append(author_match)
+            params.append(pattern(author))
         elif query:
             # 旧版 q 参数：title OR author
-            conditions.append("(title ILIKE ? OR author ILIKE ?)")
-            pattern = f"%{query}%"
-            params.extend([pattern, pattern])
-
-        where_clause = f"WHERE {conditions[0]}" if conditions else ""
-
-        with self._create_connection() as conn:
-            count_sql = f"""
-                SELECT COUNT(*) as cnt
-                FROM read_parquet(?)
-                {where_clause}
-            """
-            total_hits = conn.execute(count_sql, params).fetchone()[0]
-
-            search_sql = f"""
-                SELECT md5 as id, title, author, extension, filesize,
-                       language, year, publisher
-                FROM read_parquet(?)
-                {where_clause}
-                LIMIT ?
-            """
-            search_params = [*params, fetch_limit]
-            rows = conn.execute(search_sql, search_params).fetchall()
-            columns = [
-                "id", "title", "author", "extension", "filesize",
-                "language", "year", "publisher",
-            ]
-            hits = [dict(zip(columns, row)) for row in rows]
+            conditions.append(f"({title_match} OR {author_match})")
+            params.extend([pattern(query), pattern(query)])
 
-        return {
-            "hits": hits,
-            "total_hits": total_hits,
-            "page": page,
-            "page_size": page_size,
-        }
+        return (conditions[0] if conditions else ""), params
+
+    @staticmethod
+    def _count_exact(
+        conn: duckdb.DuckDBPyConnection, from_where: str, params: list[object]
+    ) -> int:
+        """精确计数：独立的一次全量扫描"""
+        return conn.execute(SearchService._count_sql(from_where), params).fetchone()[0]
+
+    @staticmethod
+    def _count_sql(from_where: str) -> str:
+        return f"""
+            SELECT COUNT(*) as cnt
+            {from_where}
+        """
+
+    @staticmethod
+    def _fetch_ranked_page(
+        conn: duckdb.DuckDBPyConnection,
+        from_where: str,
+        params: list[object],
+        sort_term: str,
+        page: int,
+        page_size: int,
+        after: SortKey | None = None,
+        *,
+        normalized: bool = False,
+    ) -> tuple[list[dict], SortKey | None, int, int]:
+        """按 (title, author) 合并多格式并排序分页（SQL 见 _ranked_page_sql）
+
+        返回 (当前页书籍, 下一页的 keyset 起点, 合并后书籍总数, 命中记录总数)，
+        没有下一页时起点为 None。每本书带有自身的排序键 key，供结果集缓存按游标切页，
+        以及合并键 title_key / author_key，供结果集在内存中按更长的查询词细化（见 result_set）。
+        """
+        sql, sql_params = SearchService._ranked_page_sql(
+            from_where, params, sort_term, page, page_size, after, normalized=normalized
+        )
+        rows = conn.execute(sql, sql_params).fetchall()
+        total_books, total_hits = rows[0][0], int(rows[0][1])
+        rows = [row for row in rows if row[2] is not None]
+
+        next_key: SortKey | None = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_key = (last[6], last[7], last[2])
+        books = [
+            {
+                "id": book_id, "title": title, "author": author or None, "formats": formats,
+                "key": (rank, title_len, book_id),
+                "title_key": title_key, "author_key": author_key,
+            }
+            for _, _, book_id, title, author, formats, rank, title_len, title_key, author_key
+            in rows
+        ]
+        return books, next_key, total_books, total_hits
+
+    @staticmethod
+    def _ranked_page_sql(
+        from_where: str,
+        params: list[object],
+        sort_term: str,
+        page: int,
+        page_size: int,
+        after: SortKey | None = None,
+        *,
+        normalized: bool = False,
+    ) -> tuple[str, list[object]]:
+        """合并多格式、排序分页的 SQL 与参数
+
+        排序：书名完全相同 > 前缀 > 包含，其次书名越短越靠前，最后按 id（组内最小 md5）稳定排序。
+        给出 after 时以 (rank, title_len, id) > after 定位，不再需要 OFFSET 跳过前面的书；
+        多取一行用于判断是否还有下一页。totals 与分页结果 LEFT JOIN，页码越界时仍能返回总数。
+        normalized 时合并键、排序键和书名长度直接读取预计算列。
+        """
+        if normalized:
+            title_key, author_key = TITLE_NORM, f"coalesce({AUTHOR_NORM}, '')"
+            title_len = TITLE_LEN
+        else:
+            title_key, author_key = "lower(trim(title))", "lower(trim(coalesce(author, '')))"
+            title_len = "length(lower(trim(title)))"
+        seek_clause = "WHERE (rank, title_len, id) > (?, ?, ?)" if after is not None else ""
+        sql = f"""
+            WITH matched AS (
+                SELECT md5, title, author, extension, filesize,
+                       {title_key} AS title_key, {author_key} AS author_key,
+                       {title_len} AS title_len
+                {from_where}
+            ),
+            grouped AS MATERIALIZED (
+                SELECT title_key, author_key,
+                       any_value(title_len) AS title_len,
+                       min(md5) AS id,
+                       arg_min(trim(title), md5) AS title,
+                       arg_min(trim(author), md5) AS author,
+                       list({{'extension': extension, 'filesize': filesize, 'md5': md5}}
+                            ORDER BY extension, md5) AS formats,
+                       COUNT(*) AS hit_count
+                FROM matched
+                GROUP BY title_key, author_key
+            ),
+            totals AS (
+                SELECT COUNT(*) AS total_books, COALESCE(SUM(hit_count), 0) AS total_hits
+                FROM grouped
+            ),
+            ranked AS (
+                SELECT id, title, author, formats, title_key, author_key,
+                       CASE
+                           WHEN title_key = lower(?) THEN 0
+                           WHEN starts_with(title_key, lower(?)) THEN 1
+                           WHEN contains(title_key, lower(?)) THEN 2
+                           ELSE 3
+                       END AS rank,
+                       title_len
+                FROM grouped
+            ),
+            page AS (
+                SELECT * FROM ranked
+                {seek_clause}
+                ORDER BY rank, title_len, id
+                LIMIT ? OFFSET ?
+            )
+            SELECT totals.total_books, totals.total_hits,
+                   page.id, page.title, page.author, page.formats,
+                   page.rank, page.title_len, page.title_key, page.author_key
+            FROM totals LEFT JOIN page ON TRUE
+            ORDER BY page.rank, page.title_len, page.id
+        """
+        sql_params = [
+            *params,
+            sort_term, sort_term, sort_term,
+            *(after if after is not None else []),
+            page_size + 1,
+            0 if after is not None else (page - 1) * page_size,
+        ]
+        return sql, sql_params
 
     def _get_record_count(self) -> int:
         """获取 Parquet 文件的总记录数"""
-        with self._create_connection() as conn:
+        with self._connection() as conn:
             result = conn.execute(
                 "SELECT COUNT(*) FROM read_parquet(?)", [self.parquet_path]
             ).fetchone()
@@ -0,0 +1,88 @@
+"""慢查询记录：超过 SLOW_QUERY_THRESHOLD 的搜索连同参数、分阶段耗时存入固定容量的环形缓冲，
+之后在后台补上 DuckDB EXPLAIN ANALYZE 的概要（见 SearchService._capture_profile）
+
+记录只保存在内存中，每个 worker 各有一份；管理接口看到的是处理该请求的 worker 的记录。
+"""
+
+import threading
+import time
+from collections import deque
+
+# EXPLAIN ANALYZE 概要中保留的算子附加信息（过滤条件下推到扫描即可按 zone map 跳过行组）
+_EXTRA_INFO_KEYS = (
+    "Function", "Table", "Filters", "Projections", "Estimated Cardinality",
+    "Total Files Read", "Join Type", "Conditions", "Aggregates", "Groups",
+)
+
+
+def summarize_profile(plan: dict) -> dict:
+    """提取 EXPLAIN (ANALYZE, FORMAT JSON) 的要点：总耗时、扫描行数、读取字节与逐算子耗时
+
+    算子按先序展开为列表，depth 为在计划树中的深度，rows 为算子输出行数，
+    rows_scanned 为扫描算子读取的行数。
+    """
+    operators: list[dict] = []
+
+    def walk(node: dict, depth: int) -> None:
+        for child in node.get("children", []):
+            name = (child.get("operator_name") or child.get("operator_type") or "").strip()
+            if name == "EXPLAIN_ANALYZE":
+                walk(child, depth)
+                continue
+            extra = child.get("extra_info") or {}
+            operators.append({
+                "operator": name,
+                "depth": depth,
+                "time_ms": round(child.get("operator_timing", 0.0) * 1000, 3),
+                "rows": child.get("operator_cardinality", 0),
+                "rows_scanned": child.get("operator_rows_scanned", 0),
+                "extra": {k: extra[k] for k in _EXTRA_INFO_KEYS if k in extra},
+            })
+            walk(child, depth + 1)
+
+    walk(plan, 0)
+    return {
+        "latency_ms": round(plan.get("latency", 0.0) * 1000, 1),
+        "rows_scanned": plan.get("cumulative_rows_scanned", 0),
+        "bytes_read": plan.get("total_bytes_read", 0),
+        "operators": operators,
+    }
+
+
+class SlowQueryLog:
+    """固定容量的慢查询环形缓冲，写满后丢弃最旧的记录"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: deque[dict] = deque(maxlen=capacity)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> dict:
+        """追加一条记录，分配自增 id 与记录时间"""
+        with self._lock:
+            entry = {"id": self._next_id, "recorded_at": time.time(), **entry}
+            self._next_id += 1
+            self._entries.append(entry)
+            return dict(entry)
+
+    def get(self, entry_id: int) -> dict | None:
+        with self._lock:
+            for entry in self._entries:
+                if entry["id"] == entry_id:
+                    return dict(entry)
+        return None
+
+    def update(self, entry_id: int, **fields) -> dict | None:
+        """更新记录的字段；记录已被挤出缓冲时返回 None"""
+        with self._lock:
+            for entry in self._entries:
+                if entry["id"] == entry_id:
+                    entry.update(fields)
+                    return dict(entry)
+        return None
+
+    def entries(self) -> list[dict]:
+        """全部记录，最新的在前"""
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._entries)]
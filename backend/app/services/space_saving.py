@@ -0,0 +1,107 @@
+"""Space-Saving 热门项统计：固定容量的流式 top-K，用于搜索词排行
+
+最多跟踪 capacity 个词，计数按 Stream-Summary 结构分桶，add 为 O(1)。容量满时新词替换当前
+计数最小的词并继承其计数（记为误差），因此长尾词后来变热门也能进入排行；计数是真实次数的
+上界，count - error 是下界。同容量的摘要可以合并（跨 worker / 跨时间窗口）。
+"""
+
+from collections import Counter
+
+
+class SpaceSaving:
+    __slots__ = ("capacity", "_counts", "_errors", "_buckets", "_min")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self._counts: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        # 计数 → 该计数下的词（dict 当作有序集合，淘汰时取最早进入的）
+        self._buckets: dict[int, dict[str, None]] = {}
+        self._min = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _place(self, item: str, count: int) -> None:
+        self._counts[item] = count
+        self._buckets.setdefault(count, {})[item] = None
+
+    def _unplace(self, item: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[count]
+
+    def add(self, item: str) -> None:
+        count = self._counts.get(item)
+        if count is not None:
+            self._unplace(item, count)
+            self._place(item, count + 1)
+            if count == self._min and count not in self._buckets:
+                self._min = count + 1
+            return
+        if len(self._counts) < self.capacity:
+            self._errors[item] = 0
+            self._place(item, 1)
+            self._min = 1
+            return
+        # 替换计数最小的词，新词继承其计数
+        floor = self._min
+        evicted = next(iter(self._buckets[floor]))
+        self._unplace(evicted, floor)
+        del self._counts[evicted], self._errors[evicted]
+        self._errors[item] = floor
+        self._place(item, floor + 1)
+        if floor not in self._buckets:
+            self._min = floor + 1
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        """计数最高的 n 个词及其（上界）计数"""
+        return Counter(self._counts).most_common(n)
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "items": [[item, count, self._errors[item]] for item, count in self._counts.items()],
+        }
+
+    @classmethod
+    def from_counts(
+        cls, capacity: int, counts: dict[str, int], errors: dict[str, int] | None = None
+    ) -> "SpaceSaving":
+        """由计数构建摘要，超出容量时保留计数最高的 capacity 个"""
+        summary = cls(capacity)
+        errors = errors or {}
+        for item, count in Counter(counts).most_common(capacity):
+            summary._errors[item] = errors.get(item, 0)
+            summary._place(item, count)
+        summary._min = min(summary._buckets, default=0)
+        return summary
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpaceSaving":
+        items = data.get("items", [])
+        return cls.from_counts(
+            data["capacity"],
+            {item: count for item, count, _ in items},
+            {item: error for item, _, error in items},
+        )
+
+    @classmethod
+    def merged(cls, summaries: "list[SpaceSaving]", capacity: int) -> "SpaceSaving":
+        """合并多个摘要：计数相加；某个已满的摘要里没有的词，按该摘要的最小计数补上界"""
+        counts: Counter = Counter()
+        errors: Counter = Counter()
+        for summary in summaries:
+            counts.update(summary._counts)
+            errors.update(summary._errors)
+        for summary in summaries:
+            if len(summary) < summary.capacity:
+                continue
+            for item in counts:
+                if item not in summary._counts:
+                    counts[item] += summary._min
+                    errors[item] += summary._min
+        return cls.from_counts(capacity, counts, errors)
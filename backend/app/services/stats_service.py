@@ -1,61 +1,289 @@
-"""统计收集与持久化服务"""
+"""统计收集与持久化服务
+
+多 worker 时每个进程只在内存中累计自己的增量，定期写出到 {STATS_FILE_PATH}.workers/ 下的快照文件；
+已退出进程的快照会被并入 STATS_FILE_PATH（历史基线）后删除。
+get_stats 汇总 基线 + 其他 worker 的快照 + 本进程的实时数据，单 worker 时同样适用。
+快照文件的读写与合并见 app.core.worker_snapshots，都有文件 IO，调用方放在线程中执行。
+"""
 
-import json
 import logging
-from collections import Counter, defaultdict
-from datetime import datetime, timezone
-from pathlib import Path
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
 from threading import Lock
+from typing import Callable, TypeVar
+
+from app.core.worker import worker_id
+from app.core.worker_snapshots import WorkerSnapshots
+from app.services.hyperloglog import HyperLogLog
+from app.services.latency_histogram import LatencyHistogram
+from app.services.space_saving import SpaceSaving
 
 logger = logging.getLogger(__name__)
 
-_MAX_RESPONSE_TIMES = 1000
-_MAX_SEARCH_TERMS = 100
+T = TypeVar("T")
+
 _MAX_HOURLY_DAYS = 7
+_TOP_TERMS = 20
+# 搜索词排行用 Space-Saving 摘要：累计跟踪 200 个词，按小时 / 按天的窗口各 100 个，
+# 窗口保留最近 24 小时和 7 天，合并后得到近期热门词
+_TERMS_CAPACITY = 200
+_TERMS_WINDOW_CAPACITY = 100
+# UV 用 HyperLogLog 估计：累计草图 4 KiB（误差约 1.6%），按小时 / 按天的窗口草图各 1 KiB（约 3.3%），
+# 保留最近 24 小时和 7 天，合并后得到窗口 UV；总内存固定在几十 KiB
+_UV_PRECISION = 12
+_UV_WINDOW_PRECISION = 10
+_WINDOW_HOURS = 24
+# 搜索延迟按阶段记录到直方图，标签为 "{阶段}|{hit/miss}|{local/remote}"；
+# 除累计直方图外按分钟分片保留最近 60 分钟，合并出滚动窗口的分位数
+_LATENCY_STAGES = ("total", "cache", "duckdb_fetch", "duckdb_count", "rank", "serialize")
+_LATENCY_MINUTES = 60
+_LATENCY_WINDOWS = {"5m": 5, "60m": 60}
+
+
+def _empty_snapshot() -> dict:
+    return {
+        "search_count": 0,
+        "terms": {"total": SpaceSaving(_TERMS_CAPACITY).to_dict(), "hourly": {}, "daily": {}},
+        "total_pv": 0,
+        "hourly_pv": {},
+        "daily_pv": {},
+        "uv": {"total": HyperLogLog(_UV_PRECISION).to_str(), "hourly": {}, "daily": {}},
+        "latency": {"all": {}, "minutes": {}},
+    }
+
+
+def _window(windows: dict[str, T], key: str, keep: int, factory: Callable[[], T]) -> T:
+    """取 key（小时或日期）对应的窗口摘要，新窗口开始时淘汰超出 keep 个的最旧窗口"""
+    sketch = windows.get(key)
+    if sketch is None:
+        sketch = windows[key] = factory()
+        for old in sorted(windows)[:-keep]:
+            del windows[old]
+    return sketch
+
+
+def _merge_windows(windows: dict[str, HyperLogLog], serialized: dict[str, str]) -> None:
+    for key, data in serialized.items():
+        sketch = HyperLogLog.from_str(data)
+        if key in windows:
+            windows[key].update(sketch)
+        else:
+            windows[key] = sketch
+
+
+def _serialize_windows(windows: dict[str, HyperLogLog], keep: int) -> dict[str, str]:
+    return {key: windows[key].to_str() for key in sorted(windows)[-keep:]}
+
+
+def _merge_histograms(target: dict[str, LatencyHistogram], serialized: dict[str, dict]) -> None:
+    for label, data in serialized.items():
+        histogram = LatencyHistogram.from_dict(data)
+        if label in target:
+            target[label].update(histogram)
+        else:
+            target[label] = histogram
+
+
+def _serialize_histograms(histograms: dict[str, LatencyHistogram]) -> dict[str, dict]:
+    return {label: histogram.to_dict() for label, histogram in histograms.items()}
+
+
+def _latency_rows(histograms: dict[str, LatencyHistogram]) -> list[dict]:
+    """各阶段延迟分位数（毫秒），按阶段顺序排列"""
+    rows = []
+    for label, histogram in histograms.items():
+        stage, cache, mode = label.split("|")
+        rows.append({
+            "stage": stage,
+            "cache": cache,
+            "mode": mode,
+            "count": histogram.count,
+            "avg_ms": round(histogram.mean() * 1000, 2),
+            "p50_ms": round(histogram.percentile(50) * 1000, 2),
+            "p95_ms": round(histogram.percentile(95) * 1000, 2),
+            "p99_ms": round(histogram.percentile(99) * 1000, 2),
+            "max_ms": round(histogram.max * 1000, 2),
+        })
+    order = {stage: i for i, stage in enumerate(_LATENCY_STAGES)}
+    return sorted(rows, key=lambda r: (order.get(r["stage"], len(order)), r["cache"], r["mode"]))
+
+
+def _merge_terms(summaries: dict[str, list[SpaceSaving]], keep: int) -> dict[str, dict]:
+    return {
+        key: SpaceSaving.merged(summaries[key], _TERMS_WINDOW_CAPACITY).to_dict()
+        for key in sorted(summaries)[-keep:]
+    }
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    """合并多份统计快照：计数相加，UV 草图、搜索词摘要与延迟直方图各自合并"""
+    merged = _empty_snapshot()
+    terms_total: list[SpaceSaving] = []
+    hourly_terms: dict[str, list[SpaceSaving]] = {}
+    daily_terms: dict[str, list[SpaceSaving]] = {}
+    hourly_pv: Counter = Counter()
+    daily_pv: Counter = Counter()
+    uv_total = HyperLogLog(_UV_PRECISION)
+    hourly_uv: dict[str, HyperLogLog] = {}
+    daily_uv: dict[str, HyperLogLog] = {}
+    latency_all: dict[str, LatencyHistogram] = {}
+    latency_minutes: dict[str, dict[str, LatencyHistogram]] = {}
+    for snapshot in snapshots:
+        merged["search_count"] += snapshot.get("search_count", 0)
+        merged["total_pv"] += snapshot.get("total_pv", 0)
+        terms = snapshot.get("terms", {})
+        if "total" in terms:
+            terms_total.append(SpaceSaving.from_dict(terms["total"]))
+        for windows, serialized in (
+            (hourly_terms, terms.get("hourly", {})),
+            (daily_terms, terms.get("daily", {})),
+        ):
+            for key, data in serialized.items():
+                windows.setdefault(key, []).append(SpaceSaving.from_dict(data))
+        # 旧版快照保存的是 {搜索词: 次数}
+        if snapshot.get("search_terms"):
+            terms_total.append(SpaceSaving.from_counts(_TERMS_CAPACITY, snapshot["search_terms"]))
+        hourly_pv.update(snapshot.get("hourly_pv", {}))
+        daily_pv.update(snapshot.get("daily_pv", {}))
+        uv = snapshot.get("uv", {})
+        if "total" in uv:
+            uv_total.update(HyperLogLog.from_str(uv["total"]))
+        _merge_windows(hourly_uv, uv.get("hourly", {}))
+        _merge_windows(daily_uv, uv.get("daily", {}))
+        # 旧版快照保存的是 IP 列表
+        for ip in snapshot.get("unique_ips", []):
+            uv_total.add(ip)
+        latency = snapshot.get("latency", {})
+        _merge_histograms(latency_all, latency.get("all", {}))
+        for minute, histograms in latency.get("minutes", {}).items():
+            _merge_histograms(latency_minutes.setdefault(minute, {}), histograms)
+    merged["terms"] = {
+        "total": SpaceSaving.merged(terms_total, _TERMS_CAPACITY).to_dict(),
+        "hourly": _merge_terms(hourly_terms, _WINDOW_HOURS),
+        "daily": _merge_terms(daily_terms, _MAX_HOURLY_DAYS),
+    }
+    merged["hourly_pv"] = dict(sorted(hourly_pv.items())[-_MAX_HOURLY_DAYS * 24:])
+    merged["daily_pv"] = dict(daily_pv)
+    merged["uv"] = {
+        "total": uv_total.to_str(),
+        "hourly": _serialize_windows(hourly_uv, _WINDOW_HOURS),
+        "daily": _serialize_windows(daily_uv, _MAX_HOURLY_DAYS),
+    }
+    merged["latency"] = {
+        "all": _serialize_histograms(latency_all),
+        "minutes": {
+            minute: _serialize_histograms(latency_minutes[minute])
+            for minute in sorted(latency_minutes)[-_LATENCY_MINUTES:]
+        },
+    }
+    return merged
 
 
 class StatsService:
-    """收集搜索统计、访问量统计，支持 JSON 文件持久化"""
+    """收集搜索统计、访问量统计，支持 JSON 文件持久化与跨 worker 汇总"""
 
     def __init__(self):
         self._lock = Lock()
+        self._worker_id = worker_id()
+        self._store: WorkerSnapshots | None = None
+        # 请求路径只向缓冲追加 (时间戳, IP)，不加锁（deque.append 是线程安全的），
+        # 由 flush_requests 定期按分钟聚合计入 PV / UV
+        self._pending_requests: deque[tuple[float, str]] = deque()
+        self._reset()
+
+    def _reset(self) -> None:
         self.search_count = 0
-        self.search_terms: Counter = Counter()
-        self.response_times: list[float] = []
+        self.search_terms = SpaceSaving(_TERMS_CAPACITY)
+        self.hourly_terms: dict[str, SpaceSaving] = {}
+        self.daily_terms: dict[str, SpaceSaving] = {}
+        self.latency: dict[str, LatencyHistogram] = {}
+        self.minute_latency: dict[str, dict[str, LatencyHistogram]] = {}
         self.hourly_pv: defaultdict[str, int] = defaultdict(int)
         self.daily_pv: defaultdict[str, int] = defaultdict(int)
-        self.unique_ips: set[str] = set()
+        self.uv = HyperLogLog(_UV_PRECISION)
+        self.hourly_uv: dict[str, HyperLogLog] = {}
+        self.daily_uv: dict[str, HyperLogLog] = {}
         self.total_pv = 0
 
-    def record_search(self, query: str, response_time: float, ip: str) -> None:
+    def record_search(
+        self,
+        query: str,
+        response_time: float,
+        ip: str,
+        *,
+        stages: dict[str, float] | None = None,
+        cache: str = "miss",
+        mode: str = "local",
+    ) -> None:
+        """记录一次搜索；stages 为各阶段耗时（见 app.core.timing），与总耗时一起计入延迟直方图"""
+        now = datetime.now(tz=timezone.utc)
+        hour_key = now.strftime("%Y-%m-%dT%H")
+        day_key = now.strftime("%Y-%m-%d")
+        minute_key = now.strftime("%Y-%m-%dT%H:%M")
+        term = query.lower().strip()
+        timings = {**(stages or {}), "total": response_time}
         with self._lock:
             self.search_count += 1
-            self.search_terms[query.lower().strip()] += 1
-            # 保留 top N
-            if len(self.search_terms) > _MAX_SEARCH_TERMS * 2:
-                self.search_terms = Counter(
-                    dict(self.search_terms.most_common(_MAX_SEARCH_TERMS))
-                )
-            # 环形缓冲
-            self.response_times.append(response_time)
-            if len(self.response_times) > _MAX_RESPONSE_TIMES:
-                self.response_times = self.response_times[-_MAX_RESPONSE_TIMES:]
-            self.unique_ips.add(ip)
+            self.search_terms.add(term)
+            for windows, key, keep in (
+                (self.hourly_terms, hour_key, _WINDOW_HOURS),
+                (self.daily_terms, day_key, _MAX_HOURLY_DAYS),
+            ):
+                _window(windows, key, keep, lambda: SpaceSaving(_TERMS_WINDOW_CAPACITY)).add(term)
+            minute = _window(self.minute_latency, minute_key, _LATENCY_MINUTES, dict)
+            for stage, seconds in timings.items():
+                label = f"{stage}|{cache}|{mode}"
+                for histograms in (self.latency, minute):
+                    histogram = histograms.get(label)
+                    if histogram is None:
+                        histogram = histograms[label] = LatencyHistogram()
+                    histogram.record(seconds)
+            self.uv.add(ip)
 
     def record_request(self, ip: str) -> None:
-        now = datetime.now(tz=timezone.utc)
-        hour_key = now.strftime("%Y-%m-%dT%H")
-        day_key = now.strftime("%Y-%m-%d")
+        """记录一次请求；只追加到缓冲，flush_requests 之后才计入统计"""
+        self._pending_requests.append((time.time(), ip))
+
+    def flush_requests(self) -> None:
+        """把缓冲中的请求计入 PV / UV（后台定期调用，取统计与写快照前也会调用）"""
         with self._lock:
-            self.total_pv += 1
-            self.hourly_pv[hour_key] += 1
-            self.daily_pv[day_key] += 1
-            self.unique_ips.add(ip)
-            self._cleanup_old_pv(now)
+            self._flush_requests()
 
-    def _cleanup_old_pv(self, now: datetime) -> None:
+    def _flush_requests(self) -> None:
+        """（需持有 self._lock）按分钟聚合缓冲中的请求：每分钟只格式化一次时间键，
+        同一分钟内重复的 IP 只计入一次 UV 草图"""
+        pending = self._pending_requests
+        counts: Counter[int] = Counter()
+        visitors: defaultdict[int, set[str]] = defaultdict(set)
+        # 只取调用时已有的条目，之后追加的留给下一次
+        for _ in range(len(pending)):
+            timestamp, ip = pending.popleft()
+            minute = int(timestamp // 60)
+            counts[minute] += 1
+            visitors[minute].add(ip)
+        if not counts:
+            return
+        for minute, count in sorted(counts.items()):
+            hour_key = datetime.fromtimestamp(minute * 60, tz=timezone.utc).strftime("%Y-%m-%dT%H")
+            day_key = hour_key[:10]
+            self.total_pv += count
+            self.hourly_pv[hour_key] += count
+            self.daily_pv[day_key] += count
+            for ip in visitors[minute]:
+                self._add_visitor(ip, hour_key, day_key)
+        self._cleanup_old_pv()
+
+    def _add_visitor(self, ip: str, hour_key: str, day_key: str) -> None:
+        self.uv.add(ip)
+        for windows, key, keep in (
+            (self.hourly_uv, hour_key, _WINDOW_HOURS),
+            (self.daily_uv, day_key, _MAX_HOURLY_DAYS),
+        ):
+            _window(windows, key, keep, lambda: HyperLogLog(_UV_WINDOW_PRECISION)).add(ip)
+
+    def _cleanup_old_pv(self) -> None:
         """清理超过 7 天的小时级 PV 数据"""
-        cutoff = now.strftime("%Y-%m-%d")
         # 简单策略：保留最近 7*24=168 个小时 key
         if len(self.hourly_pv) > _MAX_HOURLY_DAYS * 24:
             sorted_keys = sorted(self.hourly_pv.keys())
@@ -63,62 +291,134 @@ class StatsService:
             for k in sorted_keys[:excess]:
                 del self.hourly_pv[k]
 
-    def get_stats(self) -> dict:
+    def _snapshot(self) -> dict:
+        with self._lock:
+            self._flush_requests()
+            return self._snapshot_locked()
+
+    def _drain(self) -> dict:
+        """取出本进程的累计值并清零（进程退出前并入基线用）"""
         with self._lock:
-            avg_time = (
-                round(sum(self.response_times) / len(self.response_times), 2)
-                if self.response_times
-                else 0
-            )
-            top_terms = self.search_terms.most_common(20)
-            # 最近 24 小时 PV 趋势
-            sorted_hourly = sorted(self.hourly_pv.items())[-24:]
-            # 最近 7 天 PV 趋势
-            sorted_daily = sorted(self.daily_pv.items())[-7:]
-            return {
-                "search_count": self.search_count,
-                "top_search_terms": [
-                    {"term": t, "count": c} for t, c in top_terms
-                ],
-                "avg_response_time": avg_time,
-                "total_pv": self.total_pv,
-                "unique_visitors": len(self.unique_ips),
-                "hourly_pv": [{"hour": h, "count": c} for h, c in sorted_hourly],
-                "daily_pv": [{"date": d, "count": c} for d, c in sorted_daily],
-            }
-
-    def save_to_file(self, path: str) -> None:
-        data = {
+            self._flush_requests()
+            snapshot = self._snapshot_locked()
+            self._reset()
+        return snapshot
+
+    def _snapshot_locked(self) -> dict:
+        return {
             "search_count": self.search_count,
-            "search_terms": dict(self.search_terms.most_common(_MAX_SEARCH_TERMS)),
+            "terms": {
+                "total": self.search_terms.to_dict(),
+                "hourly": {k: v.to_dict() for k, v in self.hourly_terms.items()},
+                "daily": {k: v.to_dict() for k, v in self.daily_terms.items()},
+            },
             "total_pv": self.total_pv,
             "hourly_pv": dict(self.hourly_pv),
             "daily_pv": dict(self.daily_pv),
-            "unique_ips": list(self.unique_ips),
+            "uv": {
+                "total": self.uv.to_str(),
+                "hourly": _serialize_windows(self.hourly_uv, _WINDOW_HOURS),
+                "daily": _serialize_windows(self.daily_uv, _MAX_HOURLY_DAYS),
+            },
+            "latency": {
+                "all": _serialize_histograms(self.latency),
+                "minutes": {
+                    minute: _serialize_histograms(histograms)
+                    for minute, histograms in self.minute_latency.items()
+                },
+            },
+        }
+
+    def get_stats(self) -> dict:
+        snapshots = [self._snapshot()]
+        if self._store is not None:
+            with self._store.locked():
+                snapshots.extend(self._store.read())
+        merged = merge_snapshots(snapshots)
+        latency = self._latency_windows(merged["latency"])
+        # 平均响应时间取最近 60 分钟
+        recent = [h for label, h in latency["60m"].items() if label.startswith("total|")]
+        recent_count = sum(h.count for h in recent)
+        avg_time = round(sum(h.sum for h in recent) / recent_count, 2) if recent_count else 0
+        terms = merged["terms"]
+        top_terms = SpaceSaving.from_dict(terms["total"]).top(_TOP_TERMS)
+        # 最近 24 小时 PV 趋势
+        sorted_hourly = sorted(merged["hourly_pv"].items())[-24:]
+        # 最近 7 天 PV 趋势
+        sorted_daily = sorted(merged["daily_pv"].items())[-7:]
+        uv = merged["uv"]
+        hourly_uv = [HyperLogLog.from_str(data) for data in uv["hourly"].values()]
+        daily_uv = [HyperLogLog.from_str(data) for data in uv["daily"].values()]
+        return {
+            "search_count": merged["search_count"],
+            "top_search_terms": [
+                {"term": t, "count": c} for t, c in top_terms
+            ],
+            "top_search_terms_24h": self._window_top(terms["hourly"]),
+            "top_search_terms_7d": self._window_top(terms["daily"]),
+            "avg_response_time": avg_time,
+            "total_pv": merged["total_pv"],
+            "unique_visitors": HyperLogLog.from_str(uv["total"]).count(),
+            "unique_visitors_24h": HyperLogLog.merged(hourly_uv, _UV_WINDOW_PRECISION).count(),
+            "unique_visitors_7d": HyperLogLog.merged(daily_uv, _UV_WINDOW_PRECISION).count(),
+            "hourly_pv": [{"hour": h, "count": c} for h, c in sorted_hourly],
+            "daily_pv": [{"date": d, "count": c} for d, c in sorted_daily],
+            "latency": {name: _latency_rows(h) for name, h in latency.items()},
         }
+
+    @staticmethod
+    def _latency_windows(latency: dict) -> dict[str, dict[str, LatencyHistogram]]:
+        """合并出累计与最近 5 / 60 分钟的各标签直方图"""
+        now = datetime.now(tz=timezone.utc)
+        windows: dict[str, dict[str, LatencyHistogram]] = {}
+        for name, minutes in _LATENCY_WINDOWS.items():
+            since = (now - timedelta(minutes=minutes - 1)).strftime("%Y-%m-%dT%H:%M")
+            merged: dict[str, LatencyHistogram] = {}
+            for minute, histograms in latency["minutes"].items():
+                if minute >= since:
+                    _merge_histograms(merged, histograms)
+            windows[name] = merged
+        windows["all"] = {}
+        _merge_histograms(windows["all"], latency["all"])
+        return windows
+
+    @staticmethod
+    def _window_top(windows: dict[str, dict]) -> list[dict]:
+        """合并时间窗口内的搜索词摘要，得到近期热门词"""
+        summary = SpaceSaving.merged(
+            [SpaceSaving.from_dict(data) for data in windows.values()], _TERMS_WINDOW_CAPACITY
+        )
+        return [{"term": t, "count": c} for t, c in summary.top(_TOP_TERMS)]
+
+    def save_to_file(self, path: str, *, final: bool = False) -> None:
+        """写出本进程的统计快照并合并已退出 worker 的快照；final（进程退出前）时把本进程并入基线
+
+        有文件 IO，在线程中调用。
+        """
+        store = WorkerSnapshots(path, merge_snapshots, self._worker_id)
         try:
-            p = Path(path)
-            p.parent.mkdir(parents=True, exist_ok=True)
-            p.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            if final:
+                with store.locked():
+                    store.compact(self._drain())
+            else:
+                snapshot = self._snapshot()
+                with store.locked():
+                    store.write(snapshot)
+                    store.compact()
             logger.info("统计数据已保存: %s", path)
         except Exception:
             logger.exception("统计数据保存失败: path=%s", path)
 
     def load_from_file(self, path: str) -> None:
-        p = Path(path)
-        if not p.exists():
-            logger.info("统计数据文件不存在，跳过加载: %s", path)
-            return
+        """接管持久化文件：合并上次运行残留的 worker 快照，之后 get_stats 都会汇总该文件"""
+        self._store = WorkerSnapshots(path, merge_snapshots, self._worker_id)
         try:
-            data = json.loads(p.read_text(encoding="utf-8"))
-            with self._lock:
-                self.search_count = data.get("search_count", 0)
-                self.search_terms = Counter(data.get("search_terms", {}))
-                self.total_pv = data.get("total_pv", 0)
-                self.hourly_pv = defaultdict(int, data.get("hourly_pv", {}))
-                self.daily_pv = defaultdict(int, data.get("daily_pv", {}))
-                self.unique_ips = set(data.get("unique_ips", []))
-            logger.info("统计数据已加载: %s", path)
+            with self._store.locked():
+                self._store.compact()
+            if self._store.path.exists():
+                logger.info("统计数据已加载: %s", path)
+            else:
+                logger.info("统计数据文件不存在，从零开始统计: %s", path)
         except Exception:
             logger.exception("统计数据加载失败: path=%s", path)
 
@@ -0,0 +1,72 @@
+"""搜索用的文本归一化：ETL 导出时预计算到 Parquet 列，查询时对查询词做同样处理
+
+归一化规则：转小写，空白与标点（Unicode P*/Z* 类）连续出现时折叠为一个空格并去掉首尾空白。
+繁→简转换在导入（etl.import_annas）时已作用于 title/author，查询词在这里补做一次。
+SQL 与 Python 两侧的规则必须保持一致，否则预计算列与查询词对不上。
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import opencc
+
+# 预计算列：导出的 Parquet、物化库、倒排索引 docs 表共用
+TITLE_NORM = "title_norm"
+AUTHOR_NORM = "author_norm"
+TITLE_LEN = "title_len"
+NORMALIZED_COLUMNS = (TITLE_NORM, AUTHOR_NORM, TITLE_LEN)
+
+# RE2 的 \s 只含 ASCII 空白，全角空格等由 \p{Z} 覆盖
+NORM_SQL = r"trim(regexp_replace(lower({col}), '[\s\p{{P}}\p{{Z}}]+', ' ', 'g'))"
+
+# 从原始 title/author 计算全部预计算列的 SELECT 片段
+NORMALIZED_SELECT_SQL = (
+    f"{NORM_SQL.format(col='title')} AS {TITLE_NORM}, "
+    f"{NORM_SQL.format(col='author')} AS {AUTHOR_NORM}, "
+    f"length({NORM_SQL.format(col='title')}) :: INTEGER AS {TITLE_LEN}"
+)
+
+_ASCII_SPACE = frozenset("\t\n\f\r ")
+# 与 etl.import_annas.CJK_PATTERN 相同的范围
+_CJK_PATTERN = re.compile(
+    r"[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff"
+    r"\U00020000-\U0002a6df\U0002a700-\U0002ebef]"
+)
+
+
+@lru_cache(maxsize=1)
+def _t2s() -> opencc.OpenCC:
+    return opencc.OpenCC("t2s")
+
+
+def _is_separator(ch: str) -> bool:
+    return ch in _ASCII_SPACE or unicodedata.category(ch)[0] in ("P", "Z")
+
+
+def normalize(text: str) -> str:
+    """查询词归一化，与 NORM_SQL 规则一致（另加繁→简）"""
+    if _CJK_PATTERN.search(text):
+        text = _t2s().convert(text)
+    out: list[str] = []
+    pending_space = False
+    for ch in text.lower():
+        if _is_separator(ch):
+            pending_space = True
+            continue
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        out.append(ch)
+    return "".join(out)
+
+
+def has_normalized_columns(columns: list[str]) -> bool:
+    return all(col in columns for col in NORMALIZED_COLUMNS)
+
+
+def normalized_select_sql(columns: list[str]) -> str:
+    """派生表的预计算列 SELECT 片段：来源已有则直接读取，旧版 Parquet 则现场计算"""
+    if has_normalized_columns(columns):
+        return ", ".join(NORMALIZED_COLUMNS)
+    return NORMALIZED_SELECT_SQL
@@ -0,0 +1,179 @@
+"""Parquet 布局基准测试：排序/聚簇、行组大小、压缩算法对行组剪枝和查询延迟的影响
+
+用法:
+    cd backend
+    uv run python -m etl.benchmark_layout [--parquet ./data/books.parquet]
+                                          [--workdir ./data/layout_bench] [--rounds 10]
+
+从现有 Parquet 按每种布局（见 LAYOUTS）重写一份文件，对每份文件执行精确书名、书名前缀、
+书名包含、语言过滤四类查询，输出文件大小、读取的行组数、估算扫描字节数与 p50 / p99 延迟。
+扫描字节数由 parquet_metadata 中各行组的 min/max 统计估算：只计入统计范围可能命中的行组中
+被过滤列的压缩大小，与 DuckDB 实际跳过的行组一致。
+"""
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+import duckdb
+
+from app.config import settings
+from app.services.dataset import parquet_columns
+from app.services.text_normalize import TITLE_NORM, normalized_select_sql
+from etl.benchmark_search import _percentile
+from etl.export_parquet import ParquetLayout, copy_to_parquet
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = [
+    ParquetLayout((), 100000, "snappy"),  # 旧版导出：PG 顺序 + Snappy
+    ParquetLayout(("title",), 100000, "snappy"),
+    ParquetLayout(("title",), 122880, "zstd"),
+    ParquetLayout(("title",), 122880, "zstd", 9),
+    ParquetLayout(("language", "title"), 122880, "zstd"),
+]
+
+MIN_PREFIX_LENGTH = 4
+# 大于任何 Unicode 字符，用于构造前缀的上界
+_MAX_CHAR = "\U0010ffff"
+
+
+def _build_queries(conn: duckdb.DuckDBPyConnection, parquet_path: str) -> list[dict]:
+    """从数据中取一个书名作为样本（前半段作前缀、后半段作子串），构造各类查询及其行组命中判定"""
+    sample = conn.execute(f"""
+        SELECT {TITLE_NORM} FROM read_parquet(?)
+        WHERE length({TITLE_NORM}) >= {MIN_PREFIX_LENGTH * 2}
+        ORDER BY md5 LIMIT 1
+    """, [parquet_path]).fetchone()[0]
+    half = len(sample) // 2
+    prefix, middle = sample[:half], sample[half:]
+    # 取最少见的语言，聚簇布局下应只命中少数行组
+    language = conn.execute(
+        "SELECT language FROM read_parquet(?) WHERE language IS NOT NULL "
+        "GROUP BY language ORDER BY COUNT(*), language LIMIT 1",
+        [parquet_path],
+    ).fetchone()
+    queries = [
+        {
+            "kind": "exact",
+            "column": TITLE_NORM,
+            "where": f"{TITLE_NORM} = ?",
+            "params": [sample],
+            "may_match": lambda lo, hi: lo <= sample <= hi,
+        },
+        {
+            "kind": "prefix",
+            "column": TITLE_NORM,
+            # 区间形式与 LIKE 'x%' 等价，且不受模式串中 % / _ 的影响，同样可被行组统计剪枝
+            "where": f"{TITLE_NORM} >= ? AND {TITLE_NORM} < ?",
+            "params": [prefix, prefix + _MAX_CHAR],
+            "may_match": lambda lo, hi: hi >= prefix and lo <= prefix + _MAX_CHAR,
+        },
+        {
+            "kind": "contains",
+            "column": TITLE_NORM,
+            "where": f"contains({TITLE_NORM}, ?)",
+            "params": [middle],
+            "may_match": lambda lo, hi: True,
+        },
+    ]
+    if language is not None:
+        lang = language[0]
+        queries.append({
+            "kind": "language",
+            "column": "language",
+            "where": "language = ?",
+            "params": [lang],
+            "may_match": lambda lo, hi: lo <= lang <= hi,
+        })
+    return queries
+
+
+def _estimate_scan(
+    conn: duckdb.DuckDBPyConnection, parquet_path: str, query: dict
+) -> tuple[int, int, int]:
+    """按行组统计估算扫描量，返回 (读取行组数, 总行组数, 扫描字节数)"""
+    rows = conn.execute("""
+        SELECT stats_min_value, stats_max_value, total_compressed_size
+        FROM parquet_metadata(?)
+        WHERE path_in_schema = ?
+    """, [parquet_path, query["column"]]).fetchall()
+    read_groups, read_bytes = 0, 0
+    for lo, hi, size in rows:
+        if lo is None or hi is None or query["may_match"](lo, hi):
+            read_groups += 1
+            read_bytes += size
+    return read_groups, len(rows), read_bytes
+
+
+def run_benchmark(parquet_path: str, workdir: str, rounds: int) -> list[dict]:
+    out_dir = Path(workdir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rows: list[dict] = []
+    with duckdb.connect() as conn:
+        normalized = normalized_select_sql(parquet_columns(conn, parquet_path))
+        source_sql = f"""
+            SELECT md5, title, author, extension, filesize,
+                   language, year, publisher, {normalized}
+            FROM read_parquet(?)
+        """
+        for i, layout in enumerate(LAYOUTS):
+            path = str(out_dir / f"layout_{i}.parquet")
+            start = time.perf_counter()
+            copy_to_parquet(conn, source_sql, [parquet_path], path, layout)
+            logger.info("已写出布局 %s: %.1fs", layout.label, time.perf_counter() - start)
+            file_mb = Path(path).stat().st_size / 1024 / 1024
+
+            for query in _build_queries(conn, path):
+                sql = f"SELECT COUNT(*) FROM read_parquet(?) WHERE {query['where']}"
+                params = [path, *query["params"]]
+                conn.execute(sql, params).fetchone()  # 预热
+                timings: list[float] = []
+                for _ in range(rounds):
+                    t0 = time.perf_counter()
+                    conn.execute(sql, params).fetchone()
+                    timings.append((time.perf_counter() - t0) * 1000)
+                read_groups, total_groups, read_bytes = _estimate_scan(conn, path, query)
+                rows.append({
+                    "layout": layout.label,
+                    "file_mb": round(file_mb, 1),
+                    "query": query["kind"],
+                    "row_groups": f"{read_groups}/{total_groups}",
+                    "scan_mb": round(read_bytes / 1024 / 1024, 2),
+                    "p50_ms": round(_percentile(timings, 50), 2),
+                    "p99_ms": round(_percentile(timings, 99), 2),
+                })
+    return rows
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Parquet 布局基准测试")
+    parser.add_argument(
+        "--parquet", "-p",
+        default=settings.DUCKDB_PARQUET_PATH,
+        help=f"源 Parquet 文件路径 (默认: {settings.DUCKDB_PARQUET_PATH})",
+    )
+    parser.add_argument(
+        "--workdir", "-w",
+        default="./data/layout_bench",
+        help="各布局文件的输出目录 (默认: ./data/layout_bench)",
+    )
+    parser.add_argument("--rounds", "-n", type=int, default=10, help="每个查询的执行次数 (默认: 10)")
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.parquet, args.workdir, args.rounds)
+    header = ("layout", "file_mb", "query", "row_groups", "scan_mb", "p50_ms", "p99_ms")
+    widths = (30, 10, 10, 12, 10, 10, 10)
+    print("".join(f"{h:<{w}}" for h, w in zip(header, widths)))
+    for row in rows:
+        print("".join(f"{str(row[h]):<{w}}" for h, w in zip(header, widths)))
+
+
+if __name__ == "__main__":
+    main()
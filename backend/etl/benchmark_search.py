@@ -0,0 +1,91 @@
+"""搜索引擎基准测试：Parquet ILIKE 扫描 vs 物化 DuckDB 数据库 vs N-gram 倒排索引
+
+用法:
+    cd backend
+    uv run python -m etl.benchmark_search [--rounds 20] [--query 三体 --query python ...]
+
+对每个查询词分别用各引擎执行 SearchService._sync_search，输出 p50 / p99 延迟（毫秒）。
+物化数据库或索引文件不存在、已过期时跳过对应引擎。
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app.services.search_service import SearchService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = ["三体", "刘慈欣", "python", "红楼梦", "history of", "数据"]
+
+
+def _percentile(samples: list[float], pct: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def _measure(service: SearchService, query: str, rounds: int) -> list[float]:
+    timings: list[float] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        service._sync_search(query, 1, 20, None, None)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_benchmark(queries: list[str], rounds: int) -> list[dict]:
+    service = SearchService()
+    asyncio.run(service.init())
+    if not service._initialized:
+        raise SystemExit("SearchService 初始化失败，请检查 DUCKDB_PARQUET_PATH / S3 配置")
+
+    # 引擎名 → (_use_materialized, _use_index)
+    engines = {"scan": (False, False)}
+    if service._use_materialized:
+        engines["materialized"] = (True, False)
+    if service._use_index:
+        engines["index"] = (False, True)
+    rows: list[dict] = []
+    try:
+        for query in queries:
+            for engine, (use_materialized, use_index) in engines.items():
+                service._use_materialized = use_materialized
+                service._use_index = use_index
+                service._sync_search(query, 1, 20, None, None)  # 预热
+                timings = _measure(service, query, rounds)
+                rows.append({
+                    "query": query,
+                    "engine": engine,
+                    "p50_ms": round(_percentile(timings, 50), 2),
+                    "p99_ms": round(_percentile(timings, 99), 2),
+                })
+    finally:
+        asyncio.run(service.close())
+    return rows
+
+
+def main():
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="搜索引擎基准测试")
+    parser.add_argument("--rounds", "-n", type=int, default=20, help="每个查询的执行次数 (默认: 20)")
+    parser.add_argument(
+        "--query", "-q", action="append", dest="queries",
+        help="查询词，可重复指定 (默认: 内置查询集)",
+    )
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.queries or DEFAULT_QUERIES, args.rounds)
+    print(f"{'query':<16}{'engine':<14}{'p50_ms':>10}{'p99_ms':>10}")
+    for row in rows:
+        print(f"{row['query']:<16}{row['engine']:<14}{row['p50_ms']:>10}{row['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
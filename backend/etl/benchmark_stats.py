@@ -0,0 +1,96 @@
+"""请求统计微基准：改动前的 record_request（每次请求格式化时间键、加全局锁、更新 UV 草图）
+vs 追加到无锁缓冲、后台按分钟聚合
+
+用法:
+    cd backend
+    uv run python -m etl.benchmark_stats [--requests 200000] [--threads 1 --threads 4]
+
+输出每个请求的平均耗时（纳秒）；buffered 只计请求路径上的追加，
+buffered+flush 把后台聚合的耗时也摊到每个请求上。
+"""
+
+import argparse
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.services.stats_service import StatsService
+
+
+def _legacy_record_request(service: StatsService, ip: str) -> None:
+    """改动前的 record_request"""
+    now = datetime.now(tz=timezone.utc)
+    hour_key = now.strftime("%Y-%m-%dT%H")
+    day_key = now.strftime("%Y-%m-%d")
+    with service._lock:
+        service.total_pv += 1
+        service.hourly_pv[hour_key] += 1
+        service.daily_pv[day_key] += 1
+        service._add_visitor(ip, hour_key, day_key)
+        service._cleanup_old_pv()
+
+
+def _run(record, ips: list[str], threads: int) -> float:
+    """threads 个线程同时各记录 len(ips) / threads 次请求，返回总耗时（秒）"""
+    per_thread = len(ips) // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def work(chunk: list[str]) -> None:
+        barrier.wait()
+        for ip in chunk:
+            record(ip)
+
+    workers = [
+        threading.Thread(target=work, args=(ips[i * per_thread:(i + 1) * per_thread],))
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def run_benchmark(requests: int, threads_list: list[int], visitors: int) -> list[dict]:
+    pool = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(visitors)]
+    ips = random.choices(pool, k=requests)
+    rows: list[dict] = []
+    for threads in threads_list:
+        legacy = StatsService()
+        elapsed = _run(lambda ip: _legacy_record_request(legacy, ip), ips, threads)
+        rows.append({"mode": "legacy", "threads": threads, "seconds": elapsed})
+
+        buffered = StatsService()
+        elapsed = _run(buffered.record_request, ips, threads)
+        rows.append({"mode": "buffered", "threads": threads, "seconds": elapsed})
+        start = time.perf_counter()
+        buffered.flush_requests()
+        flush = time.perf_counter() - start
+        rows.append({"mode": "buffered+flush", "threads": threads, "seconds": elapsed + flush})
+        assert buffered.total_pv == legacy.total_pv
+    for row in rows:
+        row["ns_per_request"] = round(row.pop("seconds") / requests * 1e9)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="请求统计微基准")
+    parser.add_argument("--requests", "-n", type=int, default=200_000, help="请求数 (默认: 200000)")
+    parser.add_argument(
+        "--threads", "-t", type=int, action="append", dest="threads_list",
+        help="并发线程数，可重复指定 (默认: 1 和 4)",
+    )
+    parser.add_argument("--visitors", type=int, default=5000, help="不同 IP 数 (默认: 5000)")
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.requests, args.threads_list or [1, 4], args.visitors)
+    print(f"{'mode':<18}{'threads':>8}{'ns/req':>10}")
+    for row in rows:
+        print(f"{row['mode']:<18}{row['threads']:>8}{row['ns_per_request']:>10}")
+
+
+if __name__ == "__main__":
+    main()
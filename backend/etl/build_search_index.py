@@ -0,0 +1,122 @@
+"""Parquet → N-gram 倒排索引构建脚本
+
+用法:
+    cd backend
+    uv run python -m etl.build_search_index [--parquet ./data/books.parquet]
+                                           [--output ./data/books_index.duckdb]
+
+从导出的 Parquet 构建归一化 title/author 的 bigram 倒排索引（DuckDB 文件）。
+先写入临时文件，构建完成后原子替换，运行中的服务重启后即可使用新索引。
+"""
+
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+
+import duckdb
+
+from app.config import settings
+from app.services.dataset import parquet_columns, source_fingerprint
+from app.services.search_index import FIELD_AUTHOR, FIELD_TITLE, GRAMS_SQL, INDEX_VERSION
+from app.services.text_normalize import AUTHOR_NORM, TITLE_NORM, normalized_select_sql
+
+logger = logging.getLogger(__name__)
+
+
+def build_index(parquet_path: str, output_path: str) -> int:
+    """构建倒排索引，返回索引的文档数"""
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_output = output.with_name(output.name + ".tmp")
+    tmp_output.unlink(missing_ok=True)
+
+    start = time.time()
+    logger.info("开始构建搜索索引: %s → %s", parquet_path, output_path)
+
+    with duckdb.connect(str(tmp_output), config={
+        "threads": str(os.cpu_count() or 1),
+        "preserve_insertion_order": "false",
+    }) as conn:
+        normalized = normalized_select_sql(parquet_columns(conn, parquet_path))
+        conn.execute(f"""
+            CREATE TABLE docs AS
+            SELECT (row_number() OVER ()) :: INTEGER AS doc_id,
+                   md5, title, author, extension, filesize,
+                   language, year, publisher,
+                   {normalized}
+            FROM read_parquet(?)
+        """, [parquet_path])
+        doc_count = conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        logger.info("文档表已写入: %d 条", doc_count)
+
+        # 按 (field, gram) 排序写入，DuckDB 行组 min/max 统计即可按 gram 剪枝
+        conn.execute(f"""
+            CREATE TABLE postings AS
+            SELECT field :: TINYINT AS field, gram, doc_id
+            FROM (
+                SELECT {FIELD_TITLE} AS field, doc_id,
+                       unnest({GRAMS_SQL.format(col=TITLE_NORM)}) AS gram
+                FROM docs
+                UNION ALL
+                SELECT {FIELD_AUTHOR} AS field, doc_id,
+                       unnest({GRAMS_SQL.format(col=AUTHOR_NORM)}) AS gram
+                FROM docs
+                WHERE {AUTHOR_NORM} IS NOT NULL
+            )
+            ORDER BY field, gram, doc_id
+        """)
+        posting_count = conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        logger.info("倒排表已写入: %d 条 posting", posting_count)
+
+        conn.execute("""
+            CREATE TABLE gram_stats AS
+            SELECT field, gram, COUNT(*) :: INTEGER AS df
+            FROM postings
+            GROUP BY field, gram
+            ORDER BY field, gram
+        """)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "source_rows": str(doc_count),
+            "built_at": str(int(time.time())),
+            **source_fingerprint(parquet_path),
+        }
+        conn.execute("CREATE TABLE meta (key VARCHAR, value VARCHAR)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", list(meta.items()))
+        conn.execute("CHECKPOINT")
+
+    os.replace(tmp_output, output)
+    elapsed = time.time() - start
+    logger.info(
+        "搜索索引构建完成: %d 文档, %d posting, 耗时 %.1f 秒, 文件: %s",
+        doc_count, posting_count, elapsed, output_path,
+    )
+    return doc_count
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Parquet → N-gram 倒排索引")
+    parser.add_argument(
+        "--parquet", "-p",
+        default=settings.DUCKDB_PARQUET_PATH,
+        help=f"源 Parquet 文件路径 (默认: {settings.DUCKDB_PARQUET_PATH})",
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=settings.SEARCH_INDEX_PATH,
+        help=f"输出索引文件路径 (默认: {settings.SEARCH_INDEX_PATH})",
+    )
+    args = parser.parse_args()
+    build_index(args.parquet, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Parquet → 本地 DuckDB 数据库物化脚本
+
+用法:
+    cd backend
+    uv run python -m etl.materialize_duckdb [--parquet ./data/books.parquet]
+                                           [--output ./data/books.duckdb]
+
+将 Parquet 载入持久化 .duckdb 文件（含归一化的 title_norm / author_norm / title_len 列）。
+搜索服务启动时若发现该文件与 Parquet 一致，则以只读方式挂载并优先查询它。
+"""
+
+import argparse
+import logging
+
+from app.config import settings
+from app.services.dataset import materialize
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Parquet → DuckDB 物化")
+    parser.add_argument(
+        "--parquet", "-p",
+        default=settings.DUCKDB_PARQUET_PATH,
+        help=f"源 Parquet 文件路径 (默认: {settings.DUCKDB_PARQUET_PATH})",
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=settings.DUCKDB_DATABASE_PATH,
+        help=f"输出 DuckDB 文件路径 (默认: {settings.DUCKDB_DATABASE_PATH})",
+    )
+    args = parser.parse_args()
+    materialize(args.parquet, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -42,3 +42,57 @@ def sample_search_hits():
 @pytest.fixture
 def sample_meilisearch_hits(sample_search_hits):
     return sample_search_hits
+
+
+def write_books_parquet(path, rows, *, normalized: bool = True) -> str:
+    """按 etl.export_parquet 的列布局写出 Parquet；normalized=False 模拟缺少预计算列的旧文件"""
+    import duckdb
+
+    from app.services.text_normalize import NORMALIZED_SELECT_SQL
+
+    extra = f", {NORMALIZED_SELECT_SQL}" if normalized else ""
+    with duckdb.connect() as conn:
+        conn.execute(
+            "CREATE TABLE books (md5 VARCHAR, title VARCHAR, author VARCHAR, "
+            "\"extension\" VARCHAR, filesize BIGINT, language VARCHAR, "
+            "year VARCHAR, publisher VARCHAR)"
+        )
+        conn.executemany("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute(f"COPY (SELECT *{extra} FROM books) TO '{path}' (FORMAT PARQUET)")
+    return str(path)
+
+
+@pytest.fixture
+def books_rows(sample_search_hits):
+    """sample_search_hits 加 30 条 "Python Cookbook {i}" 填充记录"""
+    rows = [
+        (h["id"], h["title"], h["author"], h["extension"], h["filesize"],
+         h["language"], h["year"], h["publisher"])
+        for h in sample_search_hits
+    ]
+    rows += [
+        (f"fill{i:04d}", f"Python Cookbook {i}", "Alex", "pdf", 1000 + i, "en", "2020", "")
+        for i in range(30)
+    ]
+    return rows
+
+
+@pytest.fixture
+def books_parquet(tmp_path, books_rows):
+    """带归一化预计算列的临时 Parquet 文件"""
+    return write_books_parquet(tmp_path / "books.parquet", books_rows)
+
+
+@pytest.fixture
+async def local_search_service(books_parquet, monkeypatch):
+    """基于临时 Parquet 初始化的本地模式 SearchService"""
+    from app.config import settings
+    from app.services.search_service import SearchService
+
+    monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", books_parquet)
+    # 默认不挂载物化数据库，避免读到开发机 ./data 下的文件
+    monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", books_parquet + ".missing.duckdb")
+    service = SearchService()
+    await service.init()
+    yield service
+    await service.close()
@@ -0,0 +1,460 @@
+"""搜索结果缓存测试"""
+
+import asyncio
+
+import pytest
+
+from app.services import cache_backends
+from app.services.cache_service import SearchCache
+
+
+def _result(n: int, padding: int = 0, terms: list | None = None) -> dict:
+    return {"total": n, "results": [], "pad": "x" * padding, "complete": True, "terms": terms}
+
+
+class TestSearchCache:
+    def test_hit_and_miss(self):
+        cache = SearchCache()
+        assert cache.get("三体") is None
+        cache.put("三体", _result(1))
+        assert cache.get("三体") == _result(1)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+        assert stats["bytes"] > 0
+
+    def test_ttl_expiry(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(cache_backends.time, "monotonic", lambda: now[0])
+        cache = SearchCache(ttl=10)
+        cache.put("python", _result(1))
+        now[0] += 9
+        assert cache.get("python") is not None
+        now[0] += 2
+        assert cache.get("python") is None
+        stats = cache.stats()
+        assert stats["expired"] == 1
+        assert stats["size"] == 0
+        assert stats["bytes"] == 0
+
+    def test_byte_budget_evicts_lru(self):
+        cache = SearchCache(max_bytes=3000)
+        for i in range(3):
+            cache.put(f"q{i}", _result(i, padding=900))
+        assert cache.get("q0") is not None  # q0 变为最近使用
+        cache.put("q3", _result(3, padding=900))
+        assert cache.get("q1") is None
+        assert cache.get("q0") is not None
+        stats = cache.stats()
+        assert stats["bytes"] <= 3000
+        assert stats["evicted"] == 1
+
+    def test_oversized_result_not_cached(self):
+        cache = SearchCache(max_bytes=100)
+        cache.put("python", _result(1, padding=500))
+        assert cache.stats()["size"] == 0
+
+    def test_make_key(self):
+        make_key = SearchCache.make_key
+        # 数据集版本不同即为不同 key
+        assert make_key(version="v1", title="python") != make_key(version="v2", title="python")
+        # 归一化后相同的查询共用结果集
+        assert make_key(version="v1", title="Python-Programming") == make_key(
+            version="v1", title="python programming"
+        )
+        assert make_key(version="v1", title="三體") == make_key(version="v1", title="三体")
+        # 旧版 q 与分字段搜索语义不同
+        assert make_key(version="v1", query="python") != make_key(version="v1", title="python")
+        # 纯标点查询按原词区分
+        assert make_key(version="v1", title="!!") != make_key(version="v1", title="??")
+
+    async def test_find_scans_same_version_mru_first(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(cache_backends.time, "monotonic", lambda: now[0])
+        cache = SearchCache(ttl=10)
+        cache.put(SearchCache.make_key(version="v1", title="三"), _result(1, terms=["三"]))
+        now[0] += 5
+        cache.put(SearchCache.make_key(version="v1", title="三体"), _result(2, terms=["三体"]))
+        cache.put(SearchCache.make_key(version="v2", title="三体"), _result(3, terms=["三体"]))
+        assert (await cache.find("v1", lambda meta: True))["total"] == 2
+        assert (await cache.find("v1", lambda meta: meta["terms"] == ["三"]))["total"] == 1
+        assert await cache.find("v3", lambda meta: True) is None
+        now[0] += 6  # "三" 已过期
+        assert await cache.find("v1", lambda meta: meta["terms"] == ["三"]) is None
+        stats = cache.stats()
+        assert stats["refined"] == 2
+        assert (stats["hits"], stats["misses"]) == (0, 0)
+
+
+class FakeRedisServer:
+    """进程内的 RESP 服务，只实现 RedisBackend 用到的命令，代替真实 Redis"""
+
+    def __init__(self):
+        import socketserver
+        import threading
+
+        self.data: dict[bytes, object] = {}
+        self.expires: dict[bytes, float] = {}
+        self.commands: list[str] = []
+        self.calls: list[tuple[str, list[bytes]]] = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                    with server.lock:
+                        reply = server.execute(args[0].decode().upper(), args[1:])
+                    self.wfile.write(server.encode(reply))
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"redis://127.0.0.1:{self._server.server_address[1]}/0"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def encode(reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, str):
+            return f"+{reply}\r\n".encode()
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(FakeRedisServer.encode(r) for r in reply)
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    def _get(self, key):
+        import time
+
+        if key in self.expires and self.expires[key] <= time.time():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return self.data.get(key)
+
+    def execute(self, cmd: str, args: list[bytes]):
+        import time
+
+        self.commands.append(cmd)
+        self.calls.append((cmd, args))
+        if cmd == "GET":
+            return self._get(args[0])
+        if cmd == "SET":
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            if len(args) > 3 and args[2].upper() == b"PX":
+                self.expires[args[0]] = time.time() + int(args[3]) / 1000
+            return "OK"
+        if cmd == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if cmd in ("HSET", "HGET", "HDEL", "HMGET", "HGETALL", "HKEYS", "HEXISTS", "HINCRBY"):
+            h = self.data.setdefault(args[0], {})
+            if cmd == "HSET":
+                added = args[1] not in h
+                h[args[1]] = args[2]
+                return int(added)
+            if cmd == "HGET":
+                return h.get(args[1])
+            if cmd == "HEXISTS":
+                return int(args[1] in h)
+            if cmd == "HDEL":
+                return sum(h.pop(key, None) is not None for key in args[1:])
+            if cmd == "HMGET":
+                return [h.get(key) for key in args[1:]]
+            if cmd == "HGETALL":
+                return [x for kv in h.items() for x in kv]
+            if cmd == "HKEYS":
+                return list(h)
+            h[args[1]] = str(int(h.get(args[1], b"0")) + int(args[2])).encode()
+            return int(h[args[1]])
+        if cmd in ("ZADD", "ZREM", "ZRANGE", "ZREVRANGE", "ZRANGEBYSCORE"):
+            z = self.data.setdefault(args[0], {})
+            if cmd == "ZADD":
+                z[args[2]] = float(args[1])
+                return 1
+            if cmd == "ZREM":
+                return sum(z.pop(key, None) is not None for key in args[1:])
+            members = sorted(z, key=lambda m: (z[m], m), reverse=cmd == "ZREVRANGE")
+            if cmd == "ZRANGEBYSCORE":
+                low, high = float(args[1]), float(args[2])
+                return [m for m in members if low <= z[m] <= high]
+            start, stop = int(args[1]), int(args[2])
+            return members[start:None if stop == -1 else stop + 1]
+        raise NotImplementedError(cmd)
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_shared_cache(request, tmp_path):
+    """返回一个工厂，每次调用创建一个共享同一存储的 SearchCache（模拟不同 worker）"""
+    from app.services.cache_backends import RedisBackend, SqliteBackend
+
+    caches: list[SearchCache] = []
+    if request.param == "redis":
+        server = request.getfixturevalue("redis_server")
+
+    def make(max_size: int = 500, max_bytes: int = 64 * 1024 * 1024, ttl: float = 600.0):
+        if request.param == "sqlite":
+            backend = SqliteBackend(str(tmp_path / "cache.sqlite"), max_size, max_bytes, ttl)
+        else:
+            backend = RedisBackend(server.url, "test:", max_size, max_bytes, ttl)
+        cache = SearchCache(max_size, max_bytes, ttl, backend=backend)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+class TestSharedBackends:
+    """SQLite / Redis 后端：多个 SearchCache 实例（不同 worker）共享条目、统计与清空"""
+
+    def test_entries_shared_across_workers(self, make_shared_cache):
+        worker_a, worker_b = make_shared_cache(), make_shared_cache()
+        worker_a.put("三体", _result(1))
+        assert worker_b.get("三体") == _result(1)
+        assert worker_b.get("python") is None
+        for worker in (worker_a, worker_b):
+            stats = worker.stats()
+            assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+        worker_a.clear()
+        assert worker_b.stats()["size"] == 0
+        assert worker_b.get("三体") is None
+        assert worker_a.stats()["misses"] == 1
+
+    def test_lru_eviction_by_count_and_bytes(self, make_shared_cache):
+        cache = make_shared_cache(max_size=3)
+        for i in range(3):
+            cache.put(f"q{i}", _result(i))
+        assert cache.get("q0") is not None  # q0 变为最近使用
+        cache.put("q3", _result(3))
+        assert cache.get("q1") is None
+        assert cache.get("q0") is not None
+        assert cache.stats()["evicted"] == 1
+
+        cache = make_shared_cache(max_bytes=3000)
+        cache.clear()
+        for i in range(4):
+            cache.put(f"b{i}", _result(i, padding=900))
+        stats = cache.stats()
+        assert stats["bytes"] <= 3000
+        assert stats["evicted"] == 1
+
+    def test_ttl_expiry(self, make_shared_cache, monkeypatch):
+        now = [1_700_000_000.0]
+        monkeypatch.setattr(cache_backends.time, "time", lambda: now[0])
+        cache = make_shared_cache(ttl=10)
+        cache.put("python", _result(1))
+        now[0] += 9
+        assert cache.get("python") is not None
+        now[0] += 2
+        if isinstance(cache._backend, cache_backends.RedisBackend):
+            # 模拟 Redis 按 PX 删除了条目
+            cache._backend._client.execute("DEL", "test:e:python")
+        assert cache.get("python") is None
+        stats = cache.stats()
+        assert (stats["expired"], stats["size"]) == (1, 0)
+
+    def test_redis_put_reads_only_evicted_entries(self, redis_server):
+        import orjson
+
+        from app.services.cache_backends import RedisBackend
+
+        cache = SearchCache(50, 64 * 1024 * 1024, 600, backend=RedisBackend(
+            redis_server.url, "test:", 50, 64 * 1024 * 1024, 600
+        ))
+        for i in range(60):
+            cache.put(f"q{i:02d}", _result(i))
+        redis_server.commands.clear()
+        cache.put("q60", _result(60))
+        # 不读取整个索引，条目数与字节数来自 HINCRBY 计数
+        assert "HGETALL" not in redis_server.commands
+        assert "HKEYS" not in redis_server.commands
+        assert cache.get("q10") is None
+        assert cache.get("q11") is not None
+        stats = cache.stats()
+        assert (stats["size"], stats["evicted"]) == (50, 11)
+        assert stats["bytes"] == sum(
+            len(f"q{i:02d}") + len(orjson.dumps(_result(i))) for i in range(11, 61)
+        )
+        cache.close()
+
+    def test_redis_scan_reads_at_most_max_size_keys(self, redis_server):
+        from app.services.cache_backends import RedisBackend
+
+        backend = RedisBackend(redis_server.url, "test:", 3, 64 * 1024 * 1024, 600)
+        for i in range(3):
+            backend.put(f"v1:q{i}", _result(i), b"{}", {"complete": True})
+        # 其它 worker 刚写入、尚未淘汰的条目让 lru 暂时超过上限
+        redis_server.execute("ZADD", [b"test:lru", b"0", b"v1:old"])
+        redis_server.calls.clear()
+        assert [key for key, _ in backend.scan("v1:")] == ["v1:q2", "v1:q1", "v1:q0"]
+        assert ("ZREVRANGE", [b"test:lru", b"0", b"2"]) in redis_server.calls
+        backend.close()
+
+    def test_incomplete_backend_cannot_be_instantiated(self):
+        from app.services.cache_backends import CacheBackend
+
+        class GetOnly(CacheBackend):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            GetOnly()
+
+    async def test_result_set_round_trip(self, make_shared_cache, local_search_service):
+        from app.services.result_set import can_refine, slice_page
+
+        worker_a, worker_b = make_shared_cache(), make_shared_cache()
+        result_set = await local_search_service.search_ranked(title="python", limit=1000)
+        key = SearchCache.make_key(version="v1", title="python")
+
+        async def compute():
+            return result_set
+
+        assert (await worker_a.get_or_compute(key, compute))[1] == "miss"
+        cached, source = await worker_b.get_or_compute(key, compute)
+        assert source == "hit"
+        # 经 JSON 往返后游标切页仍与原结果一致
+        first = slice_page(cached, 1, 10)
+        second = slice_page(cached, 1, 10, first["next_key"])
+        assert second["books"][0]["id"] == result_set["books"][10]["id"]
+        assert second["next_key"] == tuple(result_set["books"][19]["key"])
+
+        terms = local_search_service.refinable_terms(None, "python cookbook", None)
+        parent = await worker_b.find("v1", lambda meta: can_refine(meta, terms))
+        assert parent is not None
+        assert worker_a.stats()["refined"] == 1
+
+
+class TestSingleFlight:
+    """相同 key 的并发未命中只计算一次"""
+
+    async def test_concurrent_misses_share_one_compute(self):
+        cache = SearchCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return _result(calls)
+
+        outcomes = await asyncio.gather(*[
+            cache.get_or_compute("三体", compute) for _ in range(10)
+        ])
+        assert calls == 1
+        assert {o[0]["total"] for o in outcomes} == {1}
+        assert sorted(o[1] for o in outcomes) == ["coalesced"] * 9 + ["miss"]
+        stats = cache.stats()
+        assert stats["coalesced"] == 9
+        assert stats["inflight"] == 0
+
+        result, source = await cache.get_or_compute("三体", compute)
+        assert source == "hit"
+        assert calls == 1
+
+    async def test_error_propagates_and_is_not_cached(self):
+        cache = SearchCache()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            *[cache.get_or_compute("q", failing) for _ in range(3)],
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.stats()["size"] == 0
+        assert cache.stats()["inflight"] == 0
+
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        cache = SearchCache()
+        started = asyncio.Event()
+
+        async def compute():
+            started.set()
+            await asyncio.sleep(0.05)
+            return _result(1)
+
+        leader = asyncio.create_task(cache.get_or_compute("q", compute))
+        await started.wait()
+        follower = asyncio.create_task(cache.get_or_compute("q", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == (_result(1), "coalesced")
+        assert cache.get("q") == _result(1)
+
+
+    async def test_compute_cancelled_when_all_waiters_leave(self):
+        cache = SearchCache()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def compute():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return _result(1)
+
+        waiters = [asyncio.create_task(cache.get_or_compute("q", compute)) for _ in range(2)]
+        await started.wait()
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set()
+        waiters[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert cache.stats()["inflight"] == 0
+        assert cache.get("q") is None
+
+
+class TestDatasetVersion:
+    async def test_version_changes_when_parquet_replaced(self, local_search_service):
+        import os
+
+        from app.config import settings
+
+        before = await local_search_service.dataset_version()
+        assert before
+        st = os.stat(settings.DUCKDB_PARQUET_PATH)
+        os.utime(settings.DUCKDB_PARQUET_PATH, (st.st_atime, st.st_mtime + 10))
+        # 版本随热重载切换，而不是文件一变就变
+        assert await local_search_service.dataset_version() == before
+        await local_search_service.reload()
+        assert await local_search_service.dataset_version() != before
+
+    async def test_remote_version_is_etag(self):
+        from app.services.remote_cache import ObjectInfo
+        from app.services.search_service import SearchService
+
+        class FakeFS:
+            def head(self, path):
+                return ObjectInfo(size=1, etag="etag-1", last_modified=0.0)
+
+        service = SearchService()
+        service._use_remote = True
+        service._remote_fs = FakeFS()
+        assert await service.dataset_version() == "etag-1"
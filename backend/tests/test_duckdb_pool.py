@@ -0,0 +1,80 @@
+"""DuckDB 连接池测试"""
+
+import pytest
+
+from app.services.duckdb_pool import DuckDBPool
+
+
+class TestDuckDBPool:
+    """连接复用、耗尽与探活"""
+
+    def test_reuses_connections(self):
+        pool = DuckDBPool(2, threads=1, memory_limit="64MB")
+        with pool.connection() as conn:
+            first = conn
+            assert conn.execute("SELECT 42").fetchone()[0] == 42
+        with pool.connection() as conn:
+            assert conn is first
+        stats = pool.stats()
+        assert stats["size"] == 2
+        assert stats["available"] == 2
+        assert stats["acquired"] == 2
+        pool.close()
+
+    def test_exhausted_pool_raises_runtime_error(self):
+        pool = DuckDBPool(1, threads=1, memory_limit="64MB", acquire_timeout=0.05)
+        with pool.connection():
+            with pytest.raises(RuntimeError, match="exhausted"):
+                with pool.connection():
+                    pass
+        stats = pool.stats()
+        assert stats["waits"] == 1
+        assert stats["timeouts"] == 1
+        pool.close()
+
+    def test_broken_connection_is_replaced(self):
+        pool = DuckDBPool(1, threads=1, memory_limit="64MB")
+        with pytest.raises(Exception):
+            with pool.connection() as conn:
+                broken = conn
+                conn.close()
+                conn.execute("SELECT 1")
+        with pool.connection() as conn:
+            assert conn is not broken
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+        assert pool.stats()["recycled"] == 1
+        pool.close()
+
+    def test_closed_pool_rejects_acquire(self):
+        pool = DuckDBPool(1, threads=1, memory_limit="64MB")
+        pool.close()
+        with pytest.raises(RuntimeError, match="closed"):
+            with pool.connection():
+                pass
+
+
+class TestWorkerBudget:
+    def test_duckdb_budget_split_across_workers(self):
+        from app.config import Settings
+
+        single = Settings(WORKERS=1, DUCKDB_THREADS=2, DUCKDB_MEMORY_LIMIT="256MB")
+        assert (single.duckdb_worker_threads, single.duckdb_worker_memory_limit) == (2, "256MB")
+        multi = Settings(WORKERS=4, DUCKDB_THREADS=2, DUCKDB_MEMORY_LIMIT="1GiB")
+        assert multi.duckdb_worker_threads == 1
+        assert multi.duckdb_worker_memory_limit == "262144KiB"
+
+    def test_launcher_uses_configured_workers(self, monkeypatch):
+        uvicorn = pytest.importorskip("uvicorn")
+
+        from app import __main__ as launcher
+        from app.config import settings
+
+        calls = []
+        monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: calls.append((app, kwargs)))
+        monkeypatch.setattr(settings, "WORKERS", 3)
+        launcher.main()
+        # 启动的 worker 数与平分 DuckDB 预算用的是同一个 settings.WORKERS
+        assert calls == [("app.main:app", {
+            "host": settings.HOST, "port": settings.PORT, "workers": 3,
+            "log_level": settings.LOG_LEVEL.lower(),
+        })]
@@ -117,3 +117,37 @@ class TestETLCleansing:
         result = parse_record(record, converter)
         assert result is not None
         assert "电脑" in result["title"]  # 繁体 → 简体
+
+
+class TestParquetLayout:
+    """Parquet 导出布局：排序键、行组与压缩"""
+
+    def test_parse_sort_by(self):
+        import argparse
+
+        from etl.export_parquet import parse_sort_by
+
+        assert parse_sort_by("title") == ("title",)
+        assert parse_sort_by("language, title") == ("language", "title")
+        assert parse_sort_by("none") == ()
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_sort_by("publisher")
+
+    def test_copy_applies_sort_and_compression(self, tmp_path, books_parquet):
+        import duckdb
+
+        from etl.export_parquet import ParquetLayout, copy_to_parquet
+
+        path = str(tmp_path / "sorted.parquet")
+        layout = ParquetLayout(("title",), 2048, "zstd", 3)
+        with duckdb.connect() as conn:
+            copy_to_parquet(conn, "SELECT * FROM read_parquet(?)", [books_parquet], path, layout)
+            titles = [r[0] for r in conn.execute(
+                "SELECT title_norm FROM read_parquet(?)", [path]
+            ).fetchall()]
+            compression = conn.execute(
+                "SELECT DISTINCT compression FROM parquet_metadata(?)", [path]
+            ).fetchall()
+        assert titles == sorted(titles)
+        assert compression == [("ZSTD",)]
+        assert layout.label == "title/zstd-3/rg2048"
@@ -0,0 +1,191 @@
+"""Prometheus 指标测试：文本格式、多 worker 汇总与计数器单调"""
+
+from app.core import worker_snapshots
+from app.services.metrics import Metrics
+
+
+def _worker(worker_id: str) -> Metrics:
+    registry = Metrics()
+    registry._worker_id = worker_id
+    registry._gauges.clear()
+    return registry
+
+
+def _samples(text: str) -> dict[str, float]:
+    """解析文本格式为 {指标名+标签: 值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+
+class TestExposition:
+    def test_counters_and_histograms(self):
+        registry = _worker("1-1")
+        registry.inc("easybook_http_requests_total", "GET", "/api/v1/search", "200")
+        registry.inc("easybook_http_requests_total", "GET", "/api/v1/search", "200")
+        registry.inc("easybook_remote_bytes_read_total", amount=4096)
+        registry.observe("easybook_duckdb_rows_returned", 20, "fetch")
+        registry.observe("easybook_duckdb_rows_returned", 0, "fetch")
+        text = registry.collect()
+
+        assert "# TYPE easybook_http_requests_total counter" in text
+        assert "# TYPE easybook_duckdb_rows_returned histogram" in text
+        samples = _samples(text)
+        key = 'easybook_http_requests_total{method="GET",route="/api/v1/search",status="200"}'
+        assert samples[key] == 2
+        assert samples["easybook_remote_bytes_read_total"] == 4096
+        # 桶是累计的，le 为上界（含）
+        assert samples['easybook_duckdb_rows_returned_bucket{query="fetch",le="0"}'] == 1
+        assert samples['easybook_duckdb_rows_returned_bucket{query="fetch",le="10"}'] == 1
+        assert samples['easybook_duckdb_rows_returned_bucket{query="fetch",le="20"}'] == 2
+        assert samples['easybook_duckdb_rows_returned_bucket{query="fetch",le="+Inf"}'] == 2
+        assert samples['easybook_duckdb_rows_returned_sum{query="fetch"}'] == 20
+        assert samples['easybook_duckdb_rows_returned_count{query="fetch"}'] == 2
+
+    def test_label_values_are_escaped(self):
+        registry = _worker("1-1")
+        registry.inc("easybook_search_cache_events_total", 'a"b\\c\nd')
+        assert 'event="a\\"b\\\\c\\nd"' in registry.collect()
+
+    def test_timer_records_on_exception(self):
+        registry = _worker("1-1")
+        try:
+            with registry.timer("easybook_duckdb_query_duration_seconds", "count"):
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        samples = _samples(registry.collect())
+        assert samples['easybook_duckdb_query_duration_seconds_count{query="count"}'] == 1
+
+    def test_gauges_carry_worker_label(self):
+        registry = _worker("4321-1")
+        registry.gauge("easybook_query_executor_queued", lambda: 3)
+        registry.gauge("easybook_query_executor_running", lambda: 1 / 0)
+        samples = _samples(registry.collect())
+        assert samples['easybook_query_executor_queued{worker="4321"}'] == 3
+        # 采集失败的 gauge 被跳过，不影响其他指标
+        assert not any(k.startswith("easybook_query_executor_running{") for k in samples)
+
+
+class TestMultiWorkerMetrics:
+    _KEY = 'easybook_http_requests_total{method="GET",route="/api/health",status="200"}'
+
+    def test_scrape_aggregates_and_never_goes_backwards(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = str(tmp_path / "metrics.json")
+        worker_a, worker_b = _worker("1-1"), _worker("2-1")
+        worker_a.inc("easybook_http_requests_total", "GET", "/api/health", "200")
+        worker_b.inc("easybook_http_requests_total", "GET", "/api/health", "200", amount=2)
+        worker_b.gauge("easybook_query_executor_queued", lambda: 5)
+        worker_b.save_to_file(path)
+        assert _samples(worker_a.collect(path))[self._KEY] == 3
+
+        # B 抓取时写出自己的最新值，之后落到 A 的抓取也不会比它小
+        worker_b.inc("easybook_http_requests_total", "GET", "/api/health", "200")
+        assert _samples(worker_b.collect(path))[self._KEY] == 4
+        samples = _samples(worker_a.collect(path))
+        assert samples[self._KEY] == 4
+        assert samples['easybook_query_executor_queued{worker="2"}'] == 5
+
+    def test_exited_worker_counts_fold_into_baseline(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = tmp_path / "metrics.json"
+        crashed = _worker("999999-1")
+        crashed.inc("easybook_http_requests_total", "GET", "/api/health", "200", amount=2)
+        crashed.gauge("easybook_query_executor_queued", lambda: 7)
+        crashed.save_to_file(str(path))
+        monkeypatch.setattr(
+            worker_snapshots, "is_worker_alive", lambda worker_id: worker_id != "999999-1"
+        )
+
+        survivor = _worker("1-1")
+        survivor.inc("easybook_http_requests_total", "GET", "/api/health", "200")
+        samples = _samples(survivor.collect(str(path)))
+        assert samples[self._KEY] == 3
+        # 已退出 worker 的 gauge 不再输出
+        assert not any(k.startswith("easybook_query_executor_queued{") for k in samples)
+        assert [f.stem for f in (tmp_path / "metrics.json.workers").glob("*.json")] == ["1-1"]
+
+        # 正常退出时本进程并入基线，重启后继续累计
+        survivor.save_to_file(str(path), final=True)
+        restarted = _worker("1-2")
+        assert _samples(restarted.collect(str(path)))[self._KEY] == 3
+
+
+class TestMetricsEndpoint:
+    async def test_route_template_and_search_instrumentation(
+        self, tmp_path, monkeypatch, books_parquet
+    ):
+        import httpx
+        from fastapi import FastAPI, Request
+
+        from app.api.v1 import metrics as metrics_api
+        from app.api.v1 import search as search_api
+        from app.config import settings
+        from app.services.metrics import metrics, route_template
+        from app.services.search_service import SearchService
+
+        service = SearchService()
+        monkeypatch.setattr(search_api, "search_service", service)
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", books_parquet)
+        monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", str(tmp_path / "none.duckdb"))
+        monkeypatch.setattr(settings, "DATASET_WATCH_INTERVAL", 0)
+        monkeypatch.setattr(settings, "METRICS_FILE_PATH", str(tmp_path / "metrics.json"))
+        await service.init()
+
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def record(request: Request, call_next):
+            response = await call_next(request)
+            metrics.inc(
+                "easybook_http_requests_total", request.method,
+                route_template(request.scope), str(response.status_code),
+            )
+            return response
+
+        app.include_router(search_api.router, prefix="/api/v1")
+        app.include_router(metrics_api.router)
+        before = _samples(metrics.collect())
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+                response = await client.get("/api/v1/search", params={"q": "python"})
+                assert response.status_code == 200
+                assert (await client.get("/no-such-page")).status_code == 404
+                response = await client.get("/metrics")
+        finally:
+            await service.close()
+
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        after = _samples(response.text)
+
+        def delta(key: str) -> float:
+            return after.get(key, 0) - before.get(key, 0)
+
+        key = 'easybook_http_requests_total{method="GET",route="/api/v1/search",status="200"}'
+        assert delta(key) == 1
+        assert delta(
+            'easybook_http_requests_total{method="GET",route="<unmatched>",status="404"}'
+        ) == 1
+        assert delta('easybook_duckdb_query_duration_seconds_count{query="fetch"}') == 1
+        assert delta('easybook_duckdb_rows_returned_count{query="fetch"}') == 1
+        assert delta('easybook_search_cache_events_total{event="misses"}') == 1
+        assert any(k.startswith("process_resident_memory_bytes{") for k in after)
+
+    async def test_disabled(self, monkeypatch):
+        import httpx
+        from fastapi import FastAPI
+
+        from app.api.v1 import metrics as metrics_api
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+        app = FastAPI()
+        app.include_router(metrics_api.router)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            assert (await client.get("/metrics")).status_code == 404
@@ -0,0 +1,124 @@
+"""查询线程池准入控制与查询中断测试"""
+
+import asyncio
+import threading
+
+import duckdb
+import pytest
+
+from app.services.query_executor import QueryCancelled, QueryExecutor, QueryGuard, QueryOverloaded
+
+
+async def _fill(executor: QueryExecutor, release: threading.Event, count: int) -> list[asyncio.Task]:
+    """提交 count 个阻塞到 release 的查询，等它们全部进入线程池或队列"""
+    tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(count)]
+    await asyncio.sleep(0.05)
+    return tasks
+
+
+class TestQueryExecutor:
+    async def test_rejects_when_queue_full(self):
+        executor = QueryExecutor(workers=1, max_queue=2, max_wait=60.0)
+        release = threading.Event()
+        try:
+            tasks = await _fill(executor, release, 3)
+            stats = executor.stats()
+            assert stats["running"] == 1
+            assert stats["queued"] == 2
+            with pytest.raises(QueryOverloaded) as exc_info:
+                await executor.run(lambda: None)
+            assert exc_info.value.retry_after >= 1
+            release.set()
+            assert await asyncio.gather(*tasks) == [True] * 3
+            stats = executor.stats()
+            assert stats["submitted"] == 3
+            assert stats["rejected"] == 1
+            assert stats["queued"] == stats["running"] == 0
+        finally:
+            release.set()
+            executor.shutdown()
+
+    async def test_rejects_on_estimated_wait(self):
+        executor = QueryExecutor(workers=1, max_queue=100, max_wait=0.5)
+        release = threading.Event()
+        try:
+            # 近期平均执行时间 1s，已有 1 个排队时预计等待超过 0.5s
+            executor._service_time = 1.0
+            tasks = await _fill(executor, release, 2)
+            with pytest.raises(QueryOverloaded, match="预计排队"):
+                await executor.run(lambda: None)
+            release.set()
+            await asyncio.gather(*tasks)
+        finally:
+            release.set()
+            executor.shutdown()
+
+    async def test_sheds_queries_that_waited_too_long(self):
+        executor = QueryExecutor(workers=1, max_queue=10, max_wait=0.05)
+        release = threading.Event()
+        try:
+            blocker = asyncio.create_task(executor.run(release.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(executor.run(lambda: "late"))
+            await asyncio.sleep(0.1)
+            release.set()
+            await blocker
+            with pytest.raises(QueryOverloaded, match="排队"):
+                await queued
+            stats = executor.stats()
+            assert stats["shed"] == 1
+            assert stats["wait_ms"]["max"] >= 50
+        finally:
+            release.set()
+            executor.shutdown()
+
+    async def test_exceptions_propagate(self):
+        executor = QueryExecutor(workers=2, max_queue=10, max_wait=5.0)
+        try:
+            with pytest.raises(RuntimeError, match="boom"):
+                await executor.run(lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+            assert await executor.run(sum, [1, 2, 3]) == 6
+            assert executor.stats()["running"] == 0
+        finally:
+            executor.shutdown()
+
+    async def test_cancel_while_queued_frees_slot(self):
+        executor = QueryExecutor(workers=1, max_queue=1, max_wait=60.0)
+        release = threading.Event()
+        try:
+            blocker = asyncio.create_task(executor.run(release.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(executor.run(lambda: "never"))
+            await asyncio.sleep(0.01)
+            assert executor.stats()["queued"] == 1
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            assert executor.stats()["queued"] == 0
+            release.set()
+            await blocker
+        finally:
+            release.set()
+            executor.shutdown()
+
+
+class TestQueryGuard:
+    _SLOW_SQL = "SELECT COUNT(*) FROM range(10000000000) t WHERE hash(t.range) % 7 = 3"
+
+    def test_cancel_interrupts_running_query(self):
+        guard = QueryGuard()
+        with duckdb.connect() as conn:
+            threading.Timer(0.1, guard.cancel, ["timeout"]).start()
+            with pytest.raises(QueryCancelled) as exc_info:
+                with guard.running(conn):
+                    conn.execute(self._SLOW_SQL).fetchone()
+            assert exc_info.value.reason == "timeout"
+            # 被中断的连接可以继续使用
+            assert conn.execute("SELECT 1").fetchone() == (1,)
+
+    def test_cancelled_before_start(self):
+        guard = QueryGuard()
+        guard.cancel("cancelled")
+        with duckdb.connect() as conn, pytest.raises(QueryCancelled, match="cancelled"):
+            with guard.running(conn):
+                pytest.fail("已取消的查询不应开始执行")
@@ -0,0 +1,368 @@
+"""远程 Parquet 块缓存测试（本地文件模拟 S3 对象）"""
+
+import os
+
+import duckdb
+import httpx
+import pytest
+
+from app.services.remote_cache import (
+    BlockCache,
+    CachedS3FileSystem,
+    FullDownloader,
+    ObjectInfo,
+    RemoteObjectChanged,
+    S3RangeClient,
+)
+
+
+class FakeS3Client:
+    """以本地文件充当 S3 对象，记录 Range 请求次数"""
+
+    def __init__(self, path: str, etag: str = "v1"):
+        self.path = path
+        self.etag = etag
+        self.range_requests = 0
+        # 第 n 次 Range 请求前对象被重新上传（ETag 变为 etag + "-new"）
+        self.reupload_at: int | None = None
+
+    def head(self, bucket: str, key: str) -> ObjectInfo:
+        return ObjectInfo(os.path.getsize(self.path), self.etag, os.path.getmtime(self.path))
+
+    def get_range(
+        self, bucket: str, key: str, start: int, end: int, etag: str | None = None
+    ) -> bytes:
+        self.range_requests += 1
+        if self.range_requests == self.reupload_at:
+            self.etag += "-new"
+        if etag is not None and etag != self.etag:
+            raise RemoteObjectChanged(f"{bucket}/{key} 已不是版本 {etag}")
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def close(self) -> None:
+        pass
+
+
+class TestBlockCache:
+    def test_lru_eviction_by_bytes(self, tmp_path):
+        cache = BlockCache(str(tmp_path), block_size=10, max_bytes=25)
+        for i in range(3):
+            cache.read_block("v1", i, lambda: b"x" * 10)
+        stats = cache.stats()
+        assert stats["blocks"] == 2
+        assert stats["bytes_cached"] == 20
+        assert stats["evictions"] == 1
+        assert not (tmp_path / "blocks" / "v1" / "0").exists()
+
+    def test_hit_does_not_refetch(self, tmp_path):
+        cache = BlockCache(str(tmp_path), block_size=10, max_bytes=100)
+        calls = []
+        for _ in range(2):
+            cache.read_block("v1", 0, lambda: calls.append(1) or b"y" * 10)
+        assert len(calls) == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["bytes_fetched"] == 10
+
+    def test_restores_existing_blocks(self, tmp_path):
+        BlockCache(str(tmp_path), 10, 100).read_block("v1", 3, lambda: b"z" * 10)
+        cache = BlockCache(str(tmp_path), 10, 100)
+        assert cache.stats()["blocks"] == 1
+        assert cache.read_block("v1", 3, lambda: b"") == b"z" * 10
+
+
+class TestCachedS3FileSystem:
+    def test_duckdb_reads_through_cache(self, books_parquet, tmp_path):
+        client = FakeS3Client(books_parquet)
+        fs = CachedS3FileSystem(client, BlockCache(str(tmp_path), 1024, 1024 * 1024))
+        with duckdb.connect() as conn:
+            conn.register_filesystem(fs)
+            count = conn.execute(
+                "SELECT COUNT(*) FROM read_parquet('s3cache://bucket/books.parquet') "
+                "WHERE title ILIKE '%python%'"
+            ).fetchone()[0]
+        assert count == 32
+        stats = fs.cache.stats()
+        assert stats["misses"] == client.range_requests > 0
+        assert stats["bytes_fetched"] == os.path.getsize(books_parquet)
+
+    def test_etag_change_drops_old_blocks(self, books_parquet, tmp_path):
+        client = FakeS3Client(books_parquet)
+        fs = CachedS3FileSystem(client, BlockCache(str(tmp_path), 1024, 1024 * 1024), head_ttl=0)
+        with fs.open("s3cache://bucket/books.parquet") as f:
+            f.read(100)
+        assert fs.cache.stats()["blocks"] == 1
+
+        client.etag = "v2"
+        with fs.open("s3cache://bucket/books.parquet") as f:
+            f.read(100)
+        assert not (tmp_path / "blocks" / "v1").exists()
+        assert fs.cache.stats()["blocks"] == 1
+        assert client.range_requests == 2
+
+    def test_reupload_during_read_is_detected(self, books_parquet, tmp_path):
+        client = FakeS3Client(books_parquet)
+        fs = CachedS3FileSystem(client, BlockCache(str(tmp_path), 1024, 1024 * 1024))
+        with fs.open("s3cache://bucket/books.parquet") as f:
+            f.read(100)
+            client.etag = "v2"
+            # 旧版本的文件句柄不会读到新版本的字节
+            with pytest.raises(RemoteObjectChanged):
+                f.read(2000)
+        assert fs.version_changes == 1
+        # 不等 HEAD 缓存过期，立即切换到新版本并丢弃旧块
+        assert fs.head("s3cache://bucket/books.parquet").etag == "v2"
+        assert not (tmp_path / "blocks" / "v1").exists()
+        with fs.open("s3cache://bucket/books.parquet") as f:
+            assert len(f.read(2000)) == 2000
+
+
+class TestS3RangeClient:
+    @staticmethod
+    def _client(handler) -> S3RangeClient:
+        client = S3RangeClient("https://s3.example.com", "ak", "sk", "auto")
+        client._client = httpx.Client(transport=httpx.MockTransport(handler))
+        return client
+
+    def test_range_request_is_conditional_on_etag(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.headers["range"] == "bytes=0-9"
+            if request.headers.get("if-match") != '"v2"':
+                return httpx.Response(412)
+            return httpx.Response(206, content=b"x" * 10, headers={"etag": '"v2"'})
+
+        client = self._client(handler)
+        assert client.get_range("bucket", "books.parquet", 0, 10, "v2") == b"x" * 10
+        with pytest.raises(RemoteObjectChanged):
+            client.get_range("bucket", "books.parquet", 0, 10, "v1")
+
+    def test_plain_http_endpoint_keeps_scheme(self):
+        urls = []
+
+        def handler(request):
+            urls.append(str(request.url))
+            return httpx.Response(200, headers={"content-length": "10", "etag": '"v1"'})
+
+        client = S3RangeClient("http://minio.local:9000/", "ak", "sk", "auto")
+        client._client = httpx.Client(transport=httpx.MockTransport(handler))
+        assert client.head("bucket", "books.parquet").etag == "v1"
+        assert urls == ["http://minio.local:9000/bucket/books.parquet"]
+
+    def test_mismatched_response_etag_is_rejected(self):
+        # 忽略 If-Match 的兼容存储直接返回新版本
+        client = self._client(
+            lambda request: httpx.Response(206, content=b"x", headers={"etag": '"v2"'})
+        )
+        with pytest.raises(RemoteObjectChanged):
+            client.get_range("bucket", "books.parquet", 0, 1, "v1")
+
+
+class TestFullDownloader:
+    def test_download_is_atomic_and_reused(self, books_parquet, tmp_path):
+        cache_dir = tmp_path / "cache"
+        client = FakeS3Client(books_parquet)
+        downloader = FullDownloader(client, str(cache_dir), chunk_size=1000)
+        path = downloader.download("bucket", "books.parquet")
+        assert path == cache_dir / "books-v1.parquet"
+        assert path.read_bytes() == open(books_parquet, "rb").read()
+        assert downloader.stats()["state"] == "done"
+        assert not list(cache_dir.glob("*.tmp"))
+
+        requests = client.range_requests
+        assert downloader.download("bucket", "books.parquet") == path
+        assert client.range_requests == requests
+
+    def test_cancelled_download_leaves_no_file(self, books_parquet, tmp_path):
+        cache_dir = tmp_path / "cache"
+        downloader = FullDownloader(FakeS3Client(books_parquet), str(cache_dir), chunk_size=1000)
+        downloader.cancel()
+        assert downloader.download("bucket", "books.parquet") is None
+        assert downloader.stats()["state"] == "cancelled"
+        # 只留下跨进程下载锁文件
+        assert [p.suffix for p in cache_dir.iterdir()] == [".lock"]
+
+    def test_waits_for_download_in_other_process(self, books_parquet, tmp_path):
+        import threading
+
+        from app.core.file_lock import FileLock
+
+        cache_dir = tmp_path / "cache"
+        client = FakeS3Client(books_parquet)
+        downloader = FullDownloader(client, str(cache_dir), chunk_size=1000)
+        etag = client.head("bucket", "books.parquet").etag
+        target = downloader.local_path(etag)
+        lock = FileLock(target.with_name(target.name + ".lock"))
+        lock.acquire()
+        result: list = []
+        thread = threading.Thread(
+            target=lambda: result.append(downloader.download("bucket", "books.parquet"))
+        )
+        thread.start()
+        thread.join(0.3)
+        assert thread.is_alive()
+        assert downloader.stats()["state"] == "waiting"
+        lock.release()
+        thread.join(5)
+        assert result == [target]
+        assert target.read_bytes() == open(books_parquet, "rb").read()
+
+
+class TestRemoteModeSearch:
+    @staticmethod
+    def _configure(monkeypatch, tmp_path, client: FakeS3Client, **overrides) -> None:
+        from app.config import settings
+        from app.services import search_service as search_module
+
+        monkeypatch.setattr(search_module, "S3RangeClient", lambda *args, **kwargs: client)
+        for key, value in {
+            "DUCKDB_PARQUET_PATH": str(tmp_path / "absent.parquet"),
+            "S3_ACCESS_KEY_ID": "ak",
+            "S3_SECRET_ACCESS_KEY": "sk",
+            "REMOTE_CACHE_ENABLED": True,
+            "REMOTE_CACHE_DIR": str(tmp_path / "cache"),
+            "REMOTE_CACHE_BLOCK_SIZE": 1024,
+            **overrides,
+        }.items():
+            monkeypatch.setattr(settings, key, value)
+
+    async def test_search_via_cache_then_switch_to_local(self, books_parquet, tmp_path, monkeypatch):
+        from app.services.search_service import SearchService
+
+        self._configure(
+            monkeypatch, tmp_path, FakeS3Client(books_parquet), REMOTE_CACHE_FULL_DOWNLOAD=True
+        )
+        service = SearchService()
+        await service.init()
+        try:
+            assert service._initialized is True
+            assert (await service.search("python"))["total_hits"] == 32
+            assert service.remote_cache_stats()["blocks"]["misses"] > 0
+
+            await service._download_task
+            assert service._use_remote is False
+            assert service._local_etag == "v1"
+            # 查询读的是下载文件的硬链接
+            assert service.parquet_path.startswith(str(tmp_path / "cache" / "books-v1.parquet."))
+            assert service.parquet_path.endswith(".pinned")
+            assert (await service.search("python"))["total_hits"] == 32
+        finally:
+            await service.close()
+
+    async def test_reupload_after_switch_to_local_is_downloaded(
+        self, books_parquet, tmp_path, monkeypatch
+    ):
+        import asyncio
+
+        from app.services.search_service import SearchService
+
+        client = FakeS3Client(books_parquet)
+        self._configure(
+            monkeypatch, tmp_path, client,
+            REMOTE_CACHE_FULL_DOWNLOAD=True, DATASET_WATCH_INTERVAL=0.01,
+        )
+        service = SearchService()
+        await service.init()
+        try:
+            await service._download_task
+            assert service._local_etag == "v1"
+
+            # 重新上传：回到块缓存模式，下载完新版本后再切换到本地
+            client.etag = "v2"
+            for _ in range(500):
+                if service._local_etag == "v2":
+                    break
+                await asyncio.sleep(0.01)
+            assert service._local_etag == "v2"
+            assert service._use_remote is False
+            assert service.parquet_path.startswith(str(tmp_path / "cache" / "books-v2.parquet."))
+            assert not (tmp_path / "cache" / "books-v1.parquet").exists()
+            assert not list((tmp_path / "cache").glob("books-v1.parquet.*.pinned"))
+            assert (await service.search("python"))["total_hits"] == 32
+        finally:
+            await service.close()
+
+    async def test_old_download_kept_until_running_queries_finish(
+        self, books_parquet, tmp_path, monkeypatch
+    ):
+        import asyncio
+
+        from app.services.search_service import SearchService
+
+        client = FakeS3Client(books_parquet)
+        self._configure(monkeypatch, tmp_path, client, REMOTE_CACHE_FULL_DOWNLOAD=True)
+        service = SearchService()
+        await service.init()
+        try:
+            await service._download_task
+            # 模拟切换前开始、尚未结束的查询：借出旧连接池的连接
+            view = service._view()
+            conn_cm = view.pool.connection()
+            conn = conn_cm.__enter__()
+
+            client.etag = "v2"
+            switch = asyncio.create_task(service._switch_source(None, "v2"))
+            for _ in range(500):
+                if service._use_remote:
+                    break
+                await asyncio.sleep(0.01)
+            assert service._use_remote is True
+            await asyncio.sleep(0.1)
+            assert not switch.done()
+            assert (tmp_path / "cache" / "books-v1.parquet").exists()
+            sql = f"SELECT count(*) FROM read_parquet('{view.parquet_path}')"
+            assert conn.execute(sql).fetchone()[0] > 0
+
+            conn_cm.__exit__(None, None, None)
+            await switch
+            assert not os.path.exists(view.parquet_path)
+            assert not (tmp_path / "cache" / "books-v1.parquet").exists()
+        finally:
+            await service.close()
+
+    async def test_search_retries_after_reupload_mid_query(
+        self, books_parquet, tmp_path, monkeypatch
+    ):
+        from app.services.search_service import SearchService
+
+        client = FakeS3Client(books_parquet)
+        self._configure(monkeypatch, tmp_path, client)
+        service = SearchService()
+        await service.init()
+        try:
+            # 清空块缓存，查询读第一个块时对象已被重新上传
+            service._remote_fs.cache.drop_other_etags("")
+            client.reupload_at = client.range_requests + 1
+            assert (await service.search("python"))["total_hits"] == 32
+            assert service._remote_fs.version_changes == 1
+            assert service._remote_fs.head(service.parquet_path).etag == "v1-new"
+        finally:
+            await service.close()
+
+    async def test_reupload_stops_using_stale_materialized_db(
+        self, books_parquet, tmp_path, monkeypatch
+    ):
+        from app.services import dataset
+        from app.services.search_service import SearchService
+
+        db_path = str(tmp_path / "books.duckdb")
+        dataset.materialize(books_parquet, db_path)
+        client = FakeS3Client(books_parquet)
+        self._configure(
+            monkeypatch, tmp_path, client, DUCKDB_DATABASE_PATH=db_path, REMOTE_CACHE_HEAD_TTL=0
+        )
+        service = SearchService()
+        await service.init()
+        try:
+            assert service._use_materialized is True
+            assert await service.dataset_version() == "v1"
+            assert service._use_materialized is True
+
+            # 行数不变，但物化库是旧版本构建的，不能再用
+            client.etag = "v2"
+            assert await service.dataset_version() == "v2"
+            assert service._use_materialized is False
+            assert service.materialized_stats()["enabled"] is False
+            assert (await service.search("python"))["total_hits"] == 32
+        finally:
+            await service.close()
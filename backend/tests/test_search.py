@@ -1,6 +1,6 @@
 """搜索服务和多格式合并逻辑测试"""
 
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 import pytest
 
@@ -98,7 +98,8 @@ class TestSearchService:
         service.parquet_path = "dummy.parquet"
 
         mock_result = {
-            "hits": [],
+            "books": [],
+            "next_key": None,
             "total_hits": 0,
             "page": 3,
             "page_size": 10,
@@ -107,7 +108,7 @@ class TestSearchService:
         with patch.object(service, "_sync_search", return_value=mock_result) as mock_sync:
             result = await service.search("python", page=3, page_size=10)
 
-        mock_sync.assert_called_once_with("python", 3, 10, None, None)
+        mock_sync.assert_called_once_with("python", 3, 10, None, None, None, ANY)
         assert result["page"] == 3
         assert result["page_size"] == 10
 
@@ -119,3 +120,714 @@ class TestSearchService:
         service = SearchService()
         with pytest.raises(RuntimeError, match="not initialized"):
             await service.search("test")
+
+
+class TestCountModes:
+    """总数统计模式：exact / separate"""
+
+    @pytest.mark.parametrize("mode", ["exact", "separate"])
+    async def test_exact_modes_agree(self, local_search_service, monkeypatch, mode):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "DUCKDB_COUNT_MODE", mode)
+        result = await local_search_service.search("python")
+        assert result["total_hits"] == 32
+        assert result["total_books"] == 31
+        assert len(result["books"]) == 20
+
+    async def test_default_counts_in_single_pass(self, local_search_service):
+        from app.config import Settings
+
+        assert Settings().DUCKDB_COUNT_MODE == "exact"
+        with patch.object(local_search_service, "_count_exact", side_effect=AssertionError):
+            result = await local_search_service.search("python")
+        assert result["total_hits"] == 32
+
+    @pytest.mark.parametrize("mode", ["exact", "separate"])
+    async def test_no_hits(self, local_search_service, monkeypatch, mode):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "DUCKDB_COUNT_MODE", mode)
+        result = await local_search_service.search("不存在的书")
+        assert result["total_hits"] == 0
+        assert result["total_books"] == 0
+        assert result["books"] == []
+
+
+class TestRankedPagination:
+    """SQL 内合并多格式、相关性排序与分页"""
+
+    async def test_best_match_ranked_first_wherever_it_is_stored(
+        self, tmp_path, books_rows, monkeypatch
+    ):
+        from app.config import settings
+        from app.services.search_service import SearchService
+
+        from tests.conftest import write_books_parquet
+
+        # 完全匹配的书排在文件末尾，排序仍基于全部命中
+        rows = books_rows + [("zzzz", "Python", "Guido", "epub", 1, "en", "1991", "")]
+        path = write_books_parquet(tmp_path / "late.parquet", rows)
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", path)
+        monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", path + ".missing.duckdb")
+        service = SearchService()
+        await service.init()
+        try:
+            result = await service.search("python", page_size=3)
+        finally:
+            await service.close()
+        assert result["books"][0]["title"] == "Python"
+        assert result["total_hits"] == 33
+
+    async def test_formats_merged_in_sql(self, local_search_service):
+        result = await local_search_service.search(title="python programming")
+        assert result["total_hits"] == 2
+        assert result["total_books"] == 1
+        book = result["books"][0]
+        assert book["title"] == "Python Programming"
+        assert book["author"] == "John Doe"
+        assert [f["extension"] for f in book["formats"]] == ["epub", "pdf"]
+        assert book["id"] == min(f["md5"] for f in book["formats"])
+
+    async def test_relevance_order(self, local_search_service):
+        result = await local_search_service.search("python", page_size=3)
+        titles = [b["title"] for b in result["books"]]
+        # 前缀匹配中书名最短的排最前
+        assert titles == ["Python Cookbook 0", "Python Cookbook 1", "Python Cookbook 2"]
+
+    async def test_deep_pages_cover_all_books(self, local_search_service):
+        seen: list[str] = []
+        for page in range(1, 5):
+            result = await local_search_service.search("python", page=page, page_size=10)
+            assert result["total_books"] == 31
+            seen.extend(b["id"] for b in result["books"])
+        assert len(seen) == len(set(seen)) == 31
+
+    async def test_page_past_end_keeps_totals(self, local_search_service):
+        result = await local_search_service.search("python", page=99, page_size=10)
+        assert result["books"] == []
+        assert result["total_books"] == 31
+        assert result["total_hits"] == 32
+
+
+class TestKeysetPagination:
+    """游标（keyset）分页"""
+
+    async def test_cursor_walk_matches_offset_pages(self, local_search_service):
+        offset_ids: list[str] = []
+        for page in range(1, 5):
+            result = await local_search_service.search("python", page=page, page_size=10)
+            offset_ids.extend(b["id"] for b in result["books"])
+
+        cursor_ids: list[str] = []
+        after = None
+        while True:
+            result = await local_search_service.search("python", page_size=10, after=after)
+            assert result["total_books"] == 31
+            cursor_ids.extend(b["id"] for b in result["books"])
+            after = result["next_key"]
+            if after is None:
+                break
+        assert cursor_ids == offset_ids
+
+    async def test_last_page_has_no_next_key(self, local_search_service):
+        result = await local_search_service.search(title="三体")
+        assert len(result["books"]) == 1
+        assert result["next_key"] is None
+
+    def test_cursor_round_trip(self):
+        from app.services.search_cursor import decode_cursor, encode_cursor
+
+        cursor = encode_cursor((1, 17, "abc"), title="Python")
+        assert decode_cursor(cursor, title="  python ") == (1, 17, "abc")
+
+    @pytest.mark.parametrize("cursor", ["", "not-base64!", "e30", "W10"])
+    def test_malformed_cursor_rejected(self, cursor):
+        from app.services.search_cursor import decode_cursor
+
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, title="python")
+
+    def test_cursor_bound_to_query(self):
+        from app.services.search_cursor import decode_cursor, encode_cursor
+
+        cursor = encode_cursor((1, 17, "abc"), title="python")
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, title="三体")
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, author="python")
+
+    def test_cursor_bound_to_search_mode(self):
+        from app.services.search_cursor import decode_cursor, encode_cursor
+
+        # 旧版 q 匹配书名或作者，与只搜书名的结果顺序不同
+        cursor = encode_cursor((1, 17, "abc"), query="python")
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, title="python")
+        assert decode_cursor(cursor, query="Python") == (1, 17, "abc")
+
+
+class TestResultSetCache:
+    """缓存的排序结果集在内存中切页，结果与 DuckDB 分页查询一致"""
+
+    @pytest.mark.parametrize("page,page_size", [(1, 20), (2, 20), (3, 7), (5, 7), (9, 10)])
+    async def test_slices_match_duckdb_pages(self, local_search_service, page, page_size):
+        from app.services.result_set import slice_page
+
+        result_set = await local_search_service.search_ranked("python", limit=1000)
+        assert result_set["complete"] is True
+        sliced = slice_page(result_set, page, page_size)
+        queried = await local_search_service.search("python", page=page, page_size=page_size)
+        assert sliced == queried
+
+    async def test_cursor_slices_match_duckdb(self, local_search_service):
+        from app.services.result_set import slice_page
+
+        result_set = await local_search_service.search_ranked("python", limit=1000)
+        after = None
+        while True:
+            sliced = slice_page(result_set, 1, 10, after)
+            queried = await local_search_service.search("python", page_size=10, after=after)
+            assert sliced["books"] == queried["books"]
+            assert sliced["next_key"] == queried["next_key"]
+            after = sliced["next_key"]
+            if after is None:
+                break
+
+    async def test_truncated_set_defers_deep_pages(self, local_search_service):
+        from app.services.result_set import slice_page
+
+        result_set = await local_search_service.search_ranked("python", limit=15)
+        assert result_set["complete"] is False
+        assert len(result_set["books"]) == 15
+        assert result_set["total_books"] == 31
+        first = slice_page(result_set, 1, 10)
+        assert first["next_key"] == first["books"][-1]["key"]
+        # 前缀恰好用尽时仍提示还有下一页
+        assert slice_page(result_set, 1, 15)["next_key"] is not None
+        assert slice_page(result_set, 2, 10) is None
+
+
+class TestResultSetRefinement:
+    """查询词延长时，在内存中过滤旧结果集与直接查询 DuckDB 结果一致"""
+
+    @pytest.mark.parametrize("parent,child", [
+        ({"query": "p"}, {"query": "python"}),
+        ({"query": "python"}, {"query": "python cookbook 1"}),
+        ({"title": "python"}, {"title": "python programming"}),
+        ({"title": "三"}, {"title": "三體"}),
+        ({"title": "python"}, {"title": "python", "author": "alex"}),
+        ({"author": "a"}, {"author": "alex", "title": "cookbook 2"}),
+    ])
+    async def test_refine_matches_duckdb(self, local_search_service, parent, child):
+        from app.services.result_set import can_refine, refine
+
+        parent_set = await local_search_service.search_ranked(**parent, limit=1000)
+        terms = local_search_service.refinable_terms(
+            child.get("query"), child.get("title"), child.get("author")
+        )
+        assert can_refine(parent_set, terms)
+        expected = await local_search_service.search_ranked(**child, limit=1000)
+        assert refine(parent_set, terms) == expected
+
+    async def test_cannot_refine(self, local_search_service):
+        from app.services.result_set import can_refine
+
+        def terms(query=None, title=None, author=None):
+            return local_search_service.refinable_terms(query, title, author)
+
+        python = await local_search_service.search_ranked(title="python", limit=1000)
+        # 查询词不是延长、字段不同、或新查询去掉了某个条件
+        assert not can_refine(python, terms(title="java"))
+        assert not can_refine(python, terms(query="python"))
+        assert not can_refine(python, terms(author="python"))
+        both = await local_search_service.search_ranked(title="python", author="alex", limit=1000)
+        assert not can_refine(both, terms(title="python"))
+        # 被截断的结果集不完整
+        truncated = await local_search_service.search_ranked(title="python", limit=5)
+        assert not can_refine(truncated, terms(title="python cookbook"))
+
+    async def test_legacy_parquet_not_refinable(self, tmp_path, books_rows, monkeypatch):
+        from app.config import settings
+        from app.services.search_service import SearchService
+        from tests.conftest import write_books_parquet
+
+        path = write_books_parquet(tmp_path / "legacy.parquet", books_rows, normalized=False)
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", path)
+        monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", path + ".missing.duckdb")
+        service = SearchService()
+        await service.init()
+        try:
+            result_set = await service.search_ranked(title="python", limit=1000)
+            assert result_set["terms"] is None
+        finally:
+            await service.close()
+
+
+class TestNormalizedColumns:
+    """归一化预计算列：查询词折叠大小写、标点与繁体"""
+
+    @pytest.mark.parametrize("text,expected", [
+        ("Python Programming", "python programming"),
+        ("  三體：黑暗森林 ", "三体 黑暗森林"),
+        ("Harry Potter -- and the  Stone!", "harry potter and the stone"),
+        ("a\u3000b", "a b"),
+        ("C++ Primer", "c++ primer"),
+        ("...", ""),
+    ])
+    def test_normalize_matches_sql(self, text, expected):
+        import duckdb
+
+        from app.services.text_normalize import NORM_SQL, normalize
+
+        assert normalize(text) == expected
+        if "三" not in text:
+            sql = f"SELECT {NORM_SQL.format(col='?')}"
+            assert duckdb.execute(sql, [text]).fetchone()[0] == expected
+
+    async def test_query_folds_punctuation_and_traditional(self, local_search_service):
+        assert local_search_service._normalized_parquet is True
+        result = await local_search_service.search(title="python-programming")
+        assert result["total_hits"] == 2
+        result = await local_search_service.search(title="三體")
+        assert [b["title"] for b in result["books"]] == ["三体"]
+
+    async def test_legacy_parquet_falls_back_to_ilike(
+        self, tmp_path, books_rows, monkeypatch
+    ):
+        from app.config import settings
+        from app.services.search_service import SearchService
+        from tests.conftest import write_books_parquet
+
+        path = write_books_parquet(tmp_path / "legacy.parquet", books_rows, normalized=False)
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", path)
+        monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", path + ".missing.duckdb")
+        service = SearchService()
+        await service.init()
+        try:
+            assert service._normalized_parquet is False
+            result = await service.search("python")
+            assert result["total_hits"] == 32
+            assert result["total_books"] == 31
+            assert result["books"][0]["title"] == "Python Cookbook 0"
+        finally:
+            await service.close()
+
+    async def test_punctuation_only_query(self, local_search_service):
+        result = await local_search_service.search(title="!!!")
+        assert result["total_hits"] == 0
+
+
+class TestMaterializedDatabase:
+    """物化 DuckDB 数据库：与 Parquet 结果一致，过期时按配置重建或回退"""
+
+    async def _init_service(self, books_parquet, db_path, monkeypatch, **overrides):
+        from app.config import settings
+        from app.services.search_service import SearchService
+
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", books_parquet)
+        monkeypatch.setattr(settings, "DUCKDB_DATABASE_PATH", db_path)
+        for key, value in overrides.items():
+            monkeypatch.setattr(settings, key, value)
+        service = SearchService()
+        await service.init()
+        return service
+
+    async def test_materialized_matches_parquet(self, books_parquet, tmp_path, monkeypatch):
+        from app.services.dataset import materialize
+
+        db_path = str(tmp_path / "books.duckdb")
+        assert materialize(books_parquet, db_path) == 33
+        service = await self._init_service(books_parquet, db_path, monkeypatch)
+        try:
+            assert service._use_materialized is True
+            for args in [("PYTHON", 1, 20, None, None), (None, 1, 20, "三体", "刘慈欣")]:
+                materialized = service._sync_search(*args)
+                service._use_materialized = False
+                scanned = service._sync_search(*args)
+                service._use_materialized = True
+                assert materialized["total_hits"] == scanned["total_hits"]
+                assert materialized["books"] == scanned["books"]
+        finally:
+            await service.close()
+
+    async def test_missing_database_falls_back_to_parquet(self, books_parquet, tmp_path, monkeypatch):
+        db_path = str(tmp_path / "missing.duckdb")
+        service = await self._init_service(books_parquet, db_path, monkeypatch)
+        try:
+            assert service._use_materialized is False
+            assert (await service.search("python"))["total_hits"] == 32
+        finally:
+            await service.close()
+
+    async def test_materialize_on_startup(self, books_parquet, tmp_path, monkeypatch):
+        from pathlib import Path
+
+        db_path = str(tmp_path / "books.duckdb")
+        service = await self._init_service(
+            books_parquet, db_path, monkeypatch, DUCKDB_MATERIALIZE_ON_STARTUP=True
+        )
+        try:
+            assert Path(db_path).exists()
+            assert service._use_materialized is True
+            assert service.materialized_stats()["source_rows"] == "33"
+        finally:
+            await service.close()
+
+
+class TestQueryTimeout:
+    async def test_timeout_is_counted(self, local_search_service, monkeypatch):
+        import time
+
+        from app.config import settings
+        from app.services.query_executor import QueryCancelled
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SEARCH_QUERY_TIMEOUT", 0.05)
+        normalize = service._normalize_terms
+        monkeypatch.setattr(
+            service, "_normalize_terms", lambda *args: time.sleep(0.2) or normalize(*args)
+        )
+        with pytest.raises(QueryCancelled):
+            await service.search("python")
+        assert service.executor_stats()["timeouts"] == 1
+
+        monkeypatch.setattr(service, "_normalize_terms", normalize)
+        monkeypatch.setattr(settings, "SEARCH_QUERY_TIMEOUT", 10.0)
+        assert (await service.search("python"))["total_hits"] == 32
+
+    @staticmethod
+    def slow_fetch(service, monkeypatch) -> None:
+        """取页前先在同一连接上跑一个不会自行结束的扫描，模拟执行中的长查询"""
+        fetch = service._fetch_ranked_page
+
+        def slow(conn, *args, **kwargs):
+            conn.execute("SELECT SUM(hash(range)) FROM range(1000000000000)").fetchone()
+            return fetch(conn, *args, **kwargs)
+
+        monkeypatch.setattr(service, "_fetch_ranked_page", slow)
+
+    async def test_timeout_interrupts_running_scan(self, local_search_service, monkeypatch):
+        import time
+
+        from app.config import settings
+        from app.services.query_executor import QueryCancelled
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SEARCH_QUERY_TIMEOUT", 0.2)
+        self.slow_fetch(service, monkeypatch)
+        start = time.perf_counter()
+        with pytest.raises(QueryCancelled):
+            await service.search("python")
+        # DuckDB 扫描被 interrupt() 中途打断，而不是跑完才返回
+        assert time.perf_counter() - start < 5
+        assert service.executor_stats()["timeouts"] == 1
+        assert service.executor_stats()["running"] == 0
+        assert service.pool_stats()["in_use"] == 0
+
+
+class TestSlowQueryLog:
+    async def test_slow_query_recorded_with_profile(self, local_search_service, monkeypatch):
+        import asyncio
+
+        from app.config import settings
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 1e-9)
+        await service.search(title="python", page_size=5)
+        entry = service.slow_queries.entries()[0]
+        assert entry["params"] == {
+            "query": None, "title": "python", "author": None,
+            "page": 1, "page_size": 5, "after": None,
+        }
+        assert entry["total_hits"] == 32
+        assert entry["books"] == 5
+        assert entry["timed_out"] is False
+        assert "duckdb_fetch" in entry["stages_ms"]
+        assert entry["profile_status"] == "pending"
+
+        await asyncio.gather(*service._profile_tasks)
+        entry = service.slow_queries.get(entry["id"])
+        assert entry["profile_status"] == "done"
+        fetch = entry["profile"]["fetch"]
+        assert fetch["rows_scanned"] > 0
+        scans = [op for op in fetch["operators"] if op["rows_scanned"]]
+        assert scans and "Filters" in scans[0]["extra"]
+        if settings.DUCKDB_COUNT_MODE == "separate":
+            assert "count" in entry["profile"]
+
+    async def test_timed_out_query_recorded(self, local_search_service, monkeypatch):
+        from app.config import settings
+        from app.services.query_executor import QueryCancelled
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 60.0)
+        monkeypatch.setattr(settings, "SEARCH_QUERY_TIMEOUT", 0.2)
+        TestQueryTimeout.slow_fetch(service, monkeypatch)
+        with pytest.raises(QueryCancelled):
+            await service.search("python")
+        # 未达到阈值也记录：超时本身说明查询足够慢
+        entry = service.slow_queries.entries()[0]
+        assert entry["timed_out"] is True
+        assert entry["params"]["query"] == "python"
+        assert entry["elapsed_ms"] >= 200
+        assert entry["stages_ms"]["duckdb_fetch"] >= 100
+        assert (entry["total_hits"], entry["books"]) == (None, None)
+        assert entry["profile_status"] == "skipped"
+        assert not service._profile_tasks
+
+    async def test_cancelled_query_not_counted_as_timeout(
+        self, local_search_service, monkeypatch
+    ):
+        from app.config import settings
+        from app.services.query_executor import QueryCancelled
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 60.0)
+
+        def cancelled(*args):
+            raise QueryCancelled("cancelled")
+
+        monkeypatch.setattr(service, "_normalize_terms", cancelled)
+        with pytest.raises(QueryCancelled):
+            await service.search("python")
+        stats = service.executor_stats()
+        assert (stats["timeouts"], stats["cancelled"]) == (0, 1)
+        assert service.slow_queries.entries()[0]["timed_out"] is False
+
+    async def test_fast_queries_not_recorded(self, local_search_service, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 60.0)
+        await local_search_service.search("python")
+        assert local_search_service.slow_queries.entries() == []
+
+    async def test_concurrent_profiles_are_skipped(self, local_search_service, monkeypatch):
+        import asyncio
+
+        from app.config import settings
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 1e-9)
+        # 第一条的后台分析卡住，期间的慢查询不再排队分析
+        release = asyncio.Event()
+        profile_query = service.profile_query
+
+        async def gated(**params):
+            await release.wait()
+            return await profile_query(**params)
+
+        monkeypatch.setattr(service, "profile_query", gated)
+        await service.search("python")
+        await service.search("三体")
+        statuses = [e["profile_status"] for e in service.slow_queries.entries()]
+        assert statuses == ["skipped", "pending"]
+        release.set()
+        await asyncio.gather(*service._profile_tasks)
+
+        # 按需重新分析被跳过的记录
+        skipped = service.slow_queries.entries()[0]
+        entry = await service.reprofile_slow_query(skipped["id"])
+        assert entry["profile_status"] == "done"
+        assert entry["profile"]["fetch"]["operators"]
+        assert await service.reprofile_slow_query(10**6) is None
+
+    def test_ring_keeps_latest_entries(self):
+        from app.services.slow_query_log import SlowQueryLog
+
+        log = SlowQueryLog(capacity=2)
+        first = log.add({"elapsed_ms": 1})
+        log.add({"elapsed_ms": 2})
+        log.add({"elapsed_ms": 3})
+        assert [e["elapsed_ms"] for e in log.entries()] == [3, 2]
+        assert log.get(first["id"]) is None
+        assert log.update(first["id"], profile_status="done") is None
+
+    def test_summarize_profile(self):
+        import json
+
+        import duckdb
+
+        from app.services.slow_query_log import summarize_profile
+
+        with duckdb.connect() as conn:
+            row = conn.execute(
+                "EXPLAIN (ANALYZE, FORMAT JSON) "
+                "SELECT count(*) FROM range(1000) t WHERE t.range % 7 = 0"
+            ).fetchone()
+        summary = summarize_profile(json.loads(row[1]))
+        assert summary["rows_scanned"] == 1000
+        assert summary["operators"][0]["depth"] == 0
+        assert all(op["operator"] != "EXPLAIN_ANALYZE" for op in summary["operators"])
+        assert sum(op["rows_scanned"] for op in summary["operators"]) == 1000
+
+
+class TestHotReload:
+    """数据集热重载：校验、预热后原子切换，进行中的查询在旧版本上完成"""
+
+    @staticmethod
+    def _publish(tmp_path, target, rows, **kwargs):
+        """模拟发布新版本：写到临时文件后原地替换"""
+        import os
+
+        from tests.conftest import write_books_parquet
+
+        staged = write_books_parquet(tmp_path / "staged.parquet", rows, **kwargs)
+        os.replace(staged, target)
+
+    async def test_reload_switches_to_new_file(
+        self, local_search_service, books_parquet, books_rows, tmp_path
+    ):
+        from pathlib import Path
+
+        service = local_search_service
+        before = await service.dataset_version()
+        old_pinned = service.parquet_path
+        extra = [
+            (f"new{i:04d}", f"Python Extra {i}", "Bo", "epub", 10, "en", "2024", "")
+            for i in range(5)
+        ]
+        self._publish(tmp_path, books_parquet, books_rows + extra)
+
+        # 重载之前仍读加载时的文件
+        assert (await service.search("python"))["total_hits"] == 32
+        result = await service.reload()
+        assert result["changed"] is True
+        assert result["records"] == 38
+        assert (await service.search("python"))["total_hits"] == 37
+        assert await service.dataset_version() != before
+        assert not Path(old_pinned).exists()
+        dataset = service.dataset_stats()
+        assert dataset["records"] == 38
+        assert dataset["last_reload"]["swap_ms"] >= 0
+
+        assert (await service.reload())["changed"] is False
+
+    async def test_in_flight_query_finishes_on_old_version(
+        self, local_search_service, books_parquet, books_rows, tmp_path
+    ):
+        import asyncio
+
+        service = local_search_service
+        old_view = service._view()
+        self._publish(tmp_path, books_parquet, books_rows[:20])
+        with old_view.pool.connection() as conn:
+            reload_task = asyncio.create_task(service.reload())
+            while service.record_count != 20:
+                await asyncio.sleep(0.01)
+            # 新查询已切到新版本，借出中的旧连接仍可读旧版本
+            assert (await service.search("python"))["total_hits"] == 19
+            sql = "SELECT COUNT(*) FROM read_parquet(?)"
+            assert conn.execute(sql, [old_view.parquet_path]).fetchone()[0] == 33
+            assert not reload_task.done()
+        await reload_task
+        assert old_view.pool.stats()["available"] == 0
+
+    async def test_invalid_dataset_rejected(self, local_search_service, books_parquet, tmp_path):
+        import os
+
+        import duckdb
+
+        from app.services.search_service import DatasetReloadError
+
+        service = local_search_service
+        before = await service.dataset_version()
+        with duckdb.connect() as conn:
+            conn.execute(
+                f"COPY (SELECT 'x' AS md5, 'title' AS title) TO '{tmp_path / 'bad.parquet'}' "
+                "(FORMAT PARQUET)"
+            )
+        os.replace(tmp_path / "bad.parquet", books_parquet)
+        with pytest.raises(DatasetReloadError, match="缺少列"):
+            await service.reload()
+        assert await service.dataset_version() == before
+        assert (await service.search("python"))["total_hits"] == 32
+
+    async def test_row_count_drop_requires_force(
+        self, local_search_service, books_parquet, books_rows, tmp_path
+    ):
+        from app.services.search_service import DatasetReloadError
+
+        service = local_search_service
+        self._publish(tmp_path, books_parquet, books_rows[:5])
+        with pytest.raises(DatasetReloadError, match="force"):
+            await service.reload()
+        assert service.record_count == 33
+        await service.reload(force=True)
+        assert service.record_count == 5
+
+
+class TestSearchRoute:
+    """/api/v1/search 路由：只挂载搜索路由的最小应用"""
+
+    @staticmethod
+    def _client(service, monkeypatch):
+        import httpx
+        from fastapi import FastAPI
+
+        from app.api.v1 import search as search_api
+
+        monkeypatch.setattr(search_api, "search_service", service)
+        app = FastAPI()
+        app.include_router(search_api.router, prefix="/api/v1")
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+    async def test_q_cursor_rejected_for_title_query(self, local_search_service, monkeypatch):
+        async with self._client(local_search_service, monkeypatch) as client:
+            params = {"q": "python", "page_size": 5}
+            cursor = (await client.get("/api/v1/search", params=params)).json()["next_cursor"]
+            assert cursor
+
+            response = await client.get(
+                "/api/v1/search", params={"title": "python", "page_size": 5, "cursor": cursor}
+            )
+            assert response.status_code == 400
+            response = await client.get("/api/v1/search", params={**params, "cursor": cursor})
+            assert response.status_code == 200
+
+    async def test_disconnect_cancels_query(self, local_search_service, monkeypatch):
+        import asyncio
+
+        from fastapi import FastAPI
+
+        from app.api.v1 import search as search_api
+        from app.config import settings
+        from app.services.cache_service import SearchCache
+
+        service = local_search_service
+        monkeypatch.setattr(settings, "SEARCH_QUERY_TIMEOUT", 0)
+        monkeypatch.setattr(search_api, "search_service", service)
+        monkeypatch.setattr(search_api, "search_cache", SearchCache())
+        monkeypatch.setattr(search_api, "_DISCONNECT_POLL_INTERVAL", 0.05)
+        TestQueryTimeout.slow_fetch(service, monkeypatch)
+        app = FastAPI()
+        app.include_router(search_api.router, prefix="/api/v1")
+
+        # 请求发出后客户端立即断开：之后每次 receive 都返回 http.disconnect
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent: list[dict] = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "root_path": "",
+            "path": "/api/v1/search", "raw_path": b"/api/v1/search",
+            "query_string": b"q=python", "headers": [(b"host", b"t")],
+            "client": ("127.0.0.1", 1), "server": ("t", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 5)
+        assert sent[0]["status"] == 499
+
+        # 查询被中断，执行线程与连接都已释放
+        for _ in range(500):
+            if service.executor_stats()["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        stats = service.executor_stats()
+        assert (stats["running"], stats["cancelled"], stats["timeouts"]) == (0, 1, 0)
+        assert service.pool_stats()["in_use"] == 0
@@ -0,0 +1,73 @@
+"""N-gram 倒排索引测试"""
+
+import pytest
+
+from app.services import search_index
+
+
+class TestBigrams:
+    def test_bigrams_dedupe(self):
+        assert search_index.bigrams("abab") == ["ab", "ba"]
+        assert search_index.bigrams("三体 刘") == ["三体", "体 ", " 刘"]
+        assert search_index.bigrams("三") == []
+
+    def test_select_grams_prefers_rarest(self):
+        df = {"ab": 100, "bc": 3, "cd": 50}
+        assert search_index.select_grams(["ab", "bc", "cd"], df, 2, 1000) == ["bc", "cd"]
+        # 缺失的 gram 意味着结果必为空
+        assert search_index.select_grams(["ab", "xy"], df, 2, 1000) == []
+        # 最稀有的 gram 也太常见时回退扫描
+        assert search_index.select_grams(["ab", "cd"], df, 2, 10) is None
+
+
+class TestIndexedSearch:
+    """索引查询与 ILIKE 扫描结果一致，索引过期时自动回退"""
+
+    @pytest.fixture
+    def index_path(self, books_parquet, tmp_path, monkeypatch):
+        from app.config import settings
+        from etl.build_search_index import build_index
+
+        path = str(tmp_path / "books_index.duckdb")
+        build_index(books_parquet, path)
+        monkeypatch.setattr(settings, "SEARCH_INDEX_PATH", path)
+        monkeypatch.setattr(settings, "SEARCH_INDEX_MAX_DF_RATIO", 1.0)
+        return path
+
+    @pytest.mark.parametrize("kwargs", [
+        {"query": "python"},
+        {"query": "刘慈"},
+        {"title": "三体"},
+        {"title": "cookbook 1", "author": "alex"},
+        {"title": "p", "author": "john"},
+        {"query": "不存在"},
+    ])
+    async def test_index_matches_scan(self, index_path, local_search_service, kwargs):
+        assert local_search_service._use_index is True
+        query = kwargs.get("query")
+        args = (query, 1, 20, kwargs.get("title"), kwargs.get("author"))
+
+        indexed = local_search_service._sync_search(*args)
+        local_search_service._use_index = False
+        scanned = local_search_service._sync_search(*args)
+
+        assert indexed["total_hits"] == scanned["total_hits"]
+        assert indexed["books"] == scanned["books"]
+
+    async def test_stale_index_falls_back_to_scan(self, index_path, books_parquet, monkeypatch):
+        import os
+
+        from app.config import settings
+        from app.services.search_service import SearchService
+
+        st = os.stat(books_parquet)
+        os.utime(books_parquet, (st.st_atime, st.st_mtime + 10))
+        monkeypatch.setattr(settings, "DUCKDB_PARQUET_PATH", books_parquet)
+        service = SearchService()
+        await service.init()
+        try:
+            assert service._initialized is True
+            assert service._use_index is False
+            assert (await service.search("python"))["total_hits"] == 32
+        finally:
+            await service.close()
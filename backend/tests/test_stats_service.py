@@ -0,0 +1,292 @@
+"""统计服务测试：多 worker 快照汇总与持久化"""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+from app.core import worker_snapshots
+from app.services.stats_service import StatsService
+
+
+def _worker(path: str, worker_id: str) -> StatsService:
+    service = StatsService()
+    service._worker_id = worker_id
+    service.load_from_file(path)
+    return service
+
+
+class TestMultiWorkerStats:
+    def test_stats_aggregate_across_workers(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = str(tmp_path / "stats.json")
+        worker_a, worker_b = _worker(path, "1-1"), _worker(path, "2-1")
+        worker_a.record_search("三体", 0.1, "1.1.1.1")
+        worker_a.record_request("1.1.1.1")
+        worker_b.record_search("三体", 0.3, "2.2.2.2")
+        worker_b.record_search("python", 0.2, "2.2.2.2")
+        worker_b.record_request("2.2.2.2")
+
+        # 快照写出前，其他 worker 的数据不可见
+        assert worker_a.get_stats()["search_count"] == 1
+        worker_a.save_to_file(path)
+        worker_b.save_to_file(path)
+        for worker in (worker_a, worker_b):
+            stats = worker.get_stats()
+            assert stats["search_count"] == 3
+            assert stats["total_pv"] == 2
+            assert stats["unique_visitors"] == 2
+            assert stats["top_search_terms"][0] == {"term": "三体", "count": 2}
+            assert stats["avg_response_time"] == 0.2
+
+    def test_final_save_folds_into_baseline(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = tmp_path / "stats.json"
+        worker = _worker(str(path), "1-1")
+        worker.record_search("三体", 0.1, "1.1.1.1")
+        worker.save_to_file(str(path))
+        worker.save_to_file(str(path), final=True)
+        assert json.loads(path.read_text(encoding="utf-8"))["search_count"] == 1
+        assert not list((tmp_path / "stats.json.workers").glob("*.json"))
+
+        # 重启后从基线继续累计
+        restarted = _worker(str(path), "1-2")
+        restarted.record_search("三体", 0.1, "1.1.1.1")
+        assert restarted.get_stats()["search_count"] == 2
+
+    def test_dead_worker_snapshot_is_compacted(self, tmp_path, monkeypatch):
+        path = tmp_path / "stats.json"
+        crashed = _worker(str(path), "999999-1")
+        crashed.record_search("python", 0.1, "1.1.1.1")
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        crashed.save_to_file(str(path))
+        monkeypatch.setattr(
+            worker_snapshots, "is_worker_alive", lambda worker_id: worker_id != "999999-1"
+        )
+
+        survivor = _worker(str(path), "1-1")
+        assert not list((tmp_path / "stats.json.workers").glob("*.json"))
+        assert json.loads(path.read_text(encoding="utf-8"))["search_count"] == 1
+        assert survivor.get_stats()["search_count"] == 1
+
+    def test_compaction_survives_crash_before_unlink(self, tmp_path, monkeypatch):
+        path = tmp_path / "stats.json"
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        crashed = _worker(str(path), "999999-1")
+        crashed.record_search("python", 0.1, "1.1.1.1")
+        crashed.save_to_file(str(path))
+        monkeypatch.setattr(
+            worker_snapshots, "is_worker_alive", lambda worker_id: worker_id != "999999-1"
+        )
+
+        # 基线已写入、删除快照前进程退出
+        def crash(self, missing_ok=False):
+            raise OSError("killed")
+
+        with monkeypatch.context() as m:
+            m.setattr(Path, "unlink", crash)
+            _worker(str(path), "1-1")
+        assert len(list((tmp_path / "stats.json.workers").glob("*.json"))) == 1
+
+        # 重启后删除已并入的快照，不重复计入
+        survivor = _worker(str(path), "1-2")
+        assert not list((tmp_path / "stats.json.workers").glob("*.json"))
+        assert survivor.get_stats()["search_count"] == 1
+        survivor.record_search("python", 0.1, "1.1.1.1")
+        survivor.save_to_file(str(path), final=True)
+        assert json.loads(path.read_text(encoding="utf-8"))["search_count"] == 2
+
+    def test_corrupt_baseline_is_set_aside(self, tmp_path):
+        path = tmp_path / "stats.json"
+        path.write_text('{"search_count": 5, "terms"', encoding="utf-8")
+        worker = _worker(str(path), "1-1")
+        worker.record_search("python", 0.1, "1.1.1.1")
+        worker.save_to_file(str(path), final=True)
+        assert json.loads(path.read_text(encoding="utf-8"))["search_count"] == 1
+        [broken] = tmp_path.glob("stats.json.corrupt-*")
+        assert broken.read_text(encoding="utf-8") == '{"search_count": 5, "terms"'
+
+    def test_worker_id_detects_pid_reuse(self):
+        from app.core.worker import is_worker_alive, worker_id
+
+        own = worker_id()
+        assert is_worker_alive(own)
+        pid = own.partition("-")[0]
+        assert not is_worker_alive(f"{pid}-1")
+
+
+class TestUniqueVisitors:
+    def test_hyperloglog_estimate_and_merge(self):
+        from app.services.hyperloglog import HyperLogLog
+
+        a, b = HyperLogLog(12), HyperLogLog(12)
+        for i in range(20000):
+            a.add(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+        for i in range(10000, 30000):
+            b.add(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+        assert abs(a.count() - 20000) < 20000 * 0.05
+        restored = HyperLogLog.from_str(a.to_str())
+        assert restored.count() == a.count()
+        restored.update(b)
+        assert abs(restored.count() - 30000) < 30000 * 0.05
+        assert len(a.to_str()) < 6000
+
+    def test_small_counts_are_exact(self):
+        from app.services.hyperloglog import HyperLogLog
+
+        sketch = HyperLogLog(10)
+        for ip in ["1.1.1.1", "2.2.2.2", "1.1.1.1"]:
+            sketch.add(ip)
+        assert sketch.count() == 2
+
+    def test_windowed_uv_and_bounded_windows(self):
+        service = StatsService()
+        for i in range(50):
+            service.record_request(f"1.1.1.{i}")
+        stats = service.get_stats()
+        for key in ("unique_visitors", "unique_visitors_24h", "unique_visitors_7d"):
+            assert abs(stats[key] - 50) <= 3
+
+        for hour in range(30):
+            service._add_visitor("9.9.9.9", f"2026-01-01T{hour:02d}", f"2026-01-{hour % 10 + 1:02d}")
+        assert len(service.hourly_uv) == 24
+        assert len(service.daily_uv) == 7
+
+    def test_legacy_ip_list_is_migrated(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = tmp_path / "stats.json"
+        path.write_text(json.dumps({"total_pv": 3, "unique_ips": ["1.1.1.1", "2.2.2.2"]}))
+        worker = _worker(str(path), "1-1")
+        worker.record_request("3.3.3.3")
+        worker.save_to_file(str(path), final=True)
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+        assert "unique_ips" not in baseline
+        assert _worker(str(path), "1-2").get_stats()["unique_visitors"] == 3
+
+
+class TestRequestAccounting:
+    def test_requests_are_buffered_until_flush(self, monkeypatch):
+        service = StatsService()
+        base = 1767225600.0  # 2026-01-01T00:00:00Z
+        clock = iter([base + 3599, base + 3599.5, base + 3600, base + 86400])
+        monkeypatch.setattr(time, "time", lambda: next(clock))
+        for ip in ["1.1.1.1", "1.1.1.1", "2.2.2.2", "1.1.1.1"]:
+            service.record_request(ip)
+        assert service.total_pv == 0
+
+        service.flush_requests()
+        assert service.total_pv == 4
+        assert dict(service.hourly_pv) == {
+            "2026-01-01T00": 2, "2026-01-01T01": 1, "2026-01-02T00": 1,
+        }
+        assert dict(service.daily_pv) == {"2026-01-01": 3, "2026-01-02": 1}
+        assert service.uv.count() == 2
+        assert sorted(service.hourly_uv) == ["2026-01-01T00", "2026-01-01T01", "2026-01-02T00"]
+
+    def test_concurrent_requests_are_not_lost(self):
+        service = StatsService()
+
+        def work():
+            for i in range(5000):
+                service.record_request(f"1.1.{i % 7}.1")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(20):
+            service.flush_requests()
+        for thread in threads:
+            thread.join()
+        stats = service.get_stats()
+        assert stats["total_pv"] == 20000
+        assert stats["unique_visitors"] == 7
+
+
+class TestSearchTerms:
+    def test_space_saving_bounds(self):
+        import random
+        from collections import Counter
+
+        from app.services.space_saving import SpaceSaving
+
+        rng = random.Random(7)
+        stream = [f"term{int(rng.paretovariate(1.2))}" for _ in range(20000)]
+        summary = SpaceSaving(50)
+        for term in stream:
+            summary.add(term)
+        true_counts = Counter(stream)
+        assert len(summary) == 50
+        assert [t for t, _ in summary.top(5)] == [t for t, _ in true_counts.most_common(5)]
+        for term, count, error in summary.to_dict()["items"]:
+            assert count - error <= true_counts[term] <= count
+
+    def test_late_popular_term_enters_ranking(self):
+        from app.services.space_saving import SpaceSaving
+
+        summary = SpaceSaving(10)
+        for i in range(1000):
+            summary.add(f"tail{i}")
+        for _ in range(5):
+            summary.add("新热门")
+        assert summary.top(1)[0][0] == "新热门"
+
+    def test_window_and_worker_merge(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = str(tmp_path / "stats.json")
+        worker_a, worker_b = _worker(path, "1-1"), _worker(path, "2-1")
+        for _ in range(3):
+            worker_a.record_search("三体", 0.1, "1.1.1.1")
+        worker_b.record_search("三体", 0.1, "2.2.2.2")
+        worker_b.record_search("Python ", 0.1, "2.2.2.2")
+        worker_b.save_to_file(path)
+        stats = worker_a.get_stats()
+        expected = [{"term": "三体", "count": 4}, {"term": "python", "count": 1}]
+        assert stats["top_search_terms"] == expected
+        assert stats["top_search_terms_24h"] == expected
+        assert stats["top_search_terms_7d"] == expected
+
+    def test_legacy_term_counts_are_migrated(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(worker_snapshots, "is_worker_alive", lambda worker_id: True)
+        path = tmp_path / "stats.json"
+        path.write_text(json.dumps({"search_count": 2, "search_terms": {"三体": 2}}))
+        worker = _worker(str(path), "1-1")
+        worker.record_search("三体", 0.1, "1.1.1.1")
+        assert worker.get_stats()["top_search_terms"] == [{"term": "三体", "count": 3}]
+
+
+class TestLatencyHistograms:
+    def test_histogram_percentiles(self):
+        from app.services.latency_histogram import LatencyHistogram
+
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        # 对数分桶，相对误差约 9%
+        for q, expected in ((50, 0.5), (95, 0.95), (99, 0.99)):
+            assert expected <= histogram.percentile(q) <= expected * 1.1
+        assert histogram.percentile(100) == histogram.max == 1.0
+        restored = LatencyHistogram.from_dict(histogram.to_dict())
+        restored.update(histogram)
+        assert restored.count == 2000
+        assert restored.percentile(50) == histogram.percentile(50)
+
+    def test_stages_split_by_cache_and_mode(self):
+        service = StatsService()
+        for _ in range(10):
+            service.record_search("三体", 0.2, "1.1.1.1", stages={"cache": 0.001, "duckdb_fetch": 0.15})
+        service.record_search("三体", 0.002, "1.1.1.1", stages={"cache": 0.001}, cache="hit")
+        stats = service.get_stats()
+        rows = {(r["stage"], r["cache"], r["mode"]): r for r in stats["latency"]["5m"]}
+        assert rows[("duckdb_fetch", "miss", "local")]["count"] == 10
+        assert rows[("total", "hit", "local")]["count"] == 1
+        assert rows[("total", "miss", "local")]["p95_ms"] >= 200
+        assert [r["stage"] for r in stats["latency"]["all"]][:2] == ["total", "total"]
+        assert stats["avg_response_time"] == round((0.2 * 10 + 0.002) / 11, 2)
+
+    def test_rolling_window_excludes_old_minutes(self):
+        service = StatsService()
+        service.record_search("三体", 0.1, "1.1.1.1")
+        service.minute_latency = {"2020-01-01T00:00": service.minute_latency.popitem()[1]}
+        stats = service.get_stats()
+        assert stats["latency"]["5m"] == stats["latency"]["60m"] == []
+        assert stats["latency"]["all"][0]["count"] == 1
@@ -19,30 +19,144 @@ export interface DailyPV {
   count: number
 }
 
+export interface LatencyRow {
+  stage: string
+  cache: 'hit' | 'miss'
+  mode: 'local' | 'remote'
+  count: number
+  avg_ms: number
+  p50_ms: number
+  p95_ms: number
+  p99_ms: number
+  max_ms: number
+}
+
+export type LatencyWindow = '5m' | '60m' | 'all'
+
 export interface StatsResponse {
   search_count: number
   top_search_terms: SearchTermItem[]
+  top_search_terms_24h: SearchTermItem[]
+  top_search_terms_7d: SearchTermItem[]
   avg_response_time: number
   total_pv: number
   unique_visitors: number
+  unique_visitors_24h: number
+  unique_visitors_7d: number
   hourly_pv: HourlyPV[]
   daily_pv: DailyPV[]
+  latency: Record<LatencyWindow, LatencyRow[]>
 }
 
 export interface CacheStats {
+  backend: 'memory' | 'sqlite' | 'redis'
   size: number
   max_size: number
+  bytes: number
+  max_bytes: number
+  ttl: number
   hits: number
   misses: number
+  expired: number
+  evicted: number
+  inflight: number
+  coalesced: number
+  refined: number
   hit_rate: number
 }
 
+export interface PoolStats {
+  size: number
+  available: number
+  in_use: number
+  acquired: number
+  waits: number
+  timeouts: number
+  recycled: number
+}
+
+export interface ExecutorStats {
+  workers: number
+  running: number
+  queued: number
+  max_queue: number
+  max_wait: number
+  submitted: number
+  rejected: number
+  shed: number
+  avg_service_ms: number
+  timeout: number
+  timeouts: number
+  cancelled: number
+  wait_ms: {
+    p50: number
+    p95: number
+    max: number
+  }
+}
+
+export interface DerivedFileStatus {
+  enabled: boolean
+  path: string
+  source_rows: string | null
+  built_at: string | null
+}
+
+export interface RemoteCacheStats {
+  blocks: {
+    blocks: number
+    block_size: number
+    bytes_cached: number
+    max_bytes: number
+    hits: number
+    misses: number
+    hit_rate: number
+    bytes_fetched: number
+    evictions: number
+  }
+  full_download: {
+    state: string
+    bytes_downloaded: number
+    total_bytes: number
+  }
+}
+
+export interface DatasetReload {
+  at: number
+  from_version: string
+  version: string
+  records: number
+  prepare_ms: number
+  swap_ms: number
+  drain_ms: number
+}
+
+export interface DatasetStatus {
+  version: string | null
+  source_path: string
+  active_path: string
+  records: number
+  loaded_at: number | null
+  reloading: boolean
+  last_reload: DatasetReload | null
+}
+
+export type DatasetReloadResponse =
+  | { changed: false; version: string }
+  | ({ changed: true } & DatasetReload)
+
 export interface SystemResponse {
   duckdb: {
     initialized: boolean
     mode: string
     parquet_path: string
+    pool: PoolStats | null
+    executor: ExecutorStats
+    materialized: DerivedFileStatus
+    index: DerivedFileStatus
+    remote_cache: RemoteCacheStats | null
   }
+  dataset: DatasetStatus
   cache: CacheStats
   memory: {
     rss_mb: number
@@ -50,6 +164,53 @@ export interface SystemResponse {
   }
 }
 
+export interface ProfileOperator {
+  operator: string
+  depth: number
+  time_ms: number
+  rows: number
+  rows_scanned: number
+  extra: Record<string, string | string[]>
+}
+
+export interface QueryProfile {
+  latency_ms: number
+  rows_scanned: number
+  bytes_read: number
+  operators: ProfileOperator[]
+}
+
+export interface SlowQuery {
+  id: number
+  recorded_at: number
+  params: {
+    query: string | null
+    title: string | null
+    author: string | null
+    page: number
+    page_size: number
+    after: [number, number, string] | null
+  }
+  elapsed_ms: number
+  stages_ms: Record<string, number>
+  timed_out: boolean
+  total_hits: number | null
+  books: number | null
+  count_mode: string
+  dataset_version: string
+  profile_status: 'pending' | 'skipped' | 'disabled' | 'done' | 'failed'
+  profile: { fetch: QueryProfile; count?: QueryProfile } | null
+  profile_error?: string
+  profiled_at?: number
+}
+
+export interface SlowQueriesResponse {
+  threshold: number
+  capacity: number
+  profile: boolean
+  entries: SlowQuery[]
+}
+
 function authHeader(token: string) {
   return { headers: { Authorization: `Bearer ${token}` } }
 }
@@ -73,3 +234,15 @@ export function getCacheStats(token: string): Promise<CacheStats> {
 export function clearCache(token: string): Promise<{ message: string }> {
   return http.delete('/admin/cache', authHeader(token))
 }
+
+export function reloadDataset(token: string, force = false): Promise<DatasetReloadResponse> {
+  return http.post('/admin/dataset/reload', null, { ...authHeader(token), params: { force } })
+}
+
+export function getSlowQueries(token: string): Promise<SlowQueriesResponse> {
+  return http.get('/admin/slow-queries', authHeader(token))
+}
+
+export function reprofileSlowQuery(token: string, id: number): Promise<SlowQuery> {
+  return http.post(`/admin/slow-queries/${id}/profile`, null, authHeader(token))
+}
@@ -7,6 +7,7 @@ export function searchBooks(params: {
   author?: string
   page?: number
   page_size?: number
+  cursor?: string
 }) {
   return http.get<unknown, SearchResponse>('/search', { params })
 }
@@ -26,6 +26,5 @@ declare module 'vue' {
     RouterLink: typeof import('vue-router')['RouterLink']
     RouterView: typeof import('vue-router')['RouterView']
     SearchBox: typeof import('./components/SearchBox.vue')['default']
-    SearchPagination: typeof import('./components/SearchPagination.vue')['default']
   }
 }
@@ -32,7 +32,9 @@ export function useSearch() {
   const author = ref('')
   const results = ref<BookResult[]>([])
   const total = ref(0)
-  const page = ref(1)
+  const totalBooks = ref(0)
+  const nextCursor = ref<string | null>(null)
+  const loadingMore = ref(false)
   const pageSize = ref(20)
   const loading = ref(false)
   const error = ref<string | null>(null)
@@ -169,18 +171,21 @@ export function useSearch() {
       const data = await searchBooks({
         title: title.value.trim() || undefined,
         author: author.value.trim() || undefined,
-        page: page.value,
         page_size: pageSize.value,
       })
       stopProgress(true)
       results.value = data.results ?? []
       total.value = data.total ?? 0
+      totalBooks.value = data.total_books ?? 0
+      nextCursor.value = data.next_cursor ?? null
       hasSearched.value = true
     } catch (e: unknown) {
       stopProgress(false)
       error.value = friendlyErrorMessage(e)
       results.value = []
       total.value = 0
+      totalBooks.value = 0
+      nextCursor.value = null
       hasSearched.value = true
       console.error('[Search] 搜索失败:', e)
     } finally {
@@ -188,9 +193,31 @@ export function useSearch() {
     }
   }
 
-  const changePage = (newPage: number) => {
-    page.value = newPage
-    search()
+  // 无限滚动：用上一页返回的游标继续取，后端按 keyset 定位，深翻页代价恒定
+  const loadMore = async () => {
+    if (!nextCursor.value || loading.value || loadingMore.value) {
+      return
+    }
+
+    loadingMore.value = true
+    const cursor = nextCursor.value
+    try {
+      const data = await searchBooks({
+        title: title.value.trim() || undefined,
+        author: author.value.trim() || undefined,
+        page_size: pageSize.value,
+        cursor,
+      })
+      // 加载期间发起了新搜索，丢弃旧结果
+      if (cursor !== nextCursor.value) return
+      results.value = [...results.value, ...(data.results ?? [])]
+      nextCursor.value = data.next_cursor ?? null
+    } catch (e: unknown) {
+      error.value = friendlyErrorMessage(e)
+      console.error('[Search] 加载更多失败:', e)
+    } finally {
+      loadingMore.value = false
+    }
   }
 
   return {
@@ -198,7 +225,9 @@ export function useSearch() {
     author,
     results,
     total,
-    page,
+    totalBooks,
+    nextCursor,
+    loadingMore,
     pageSize,
     loading,
     error,
@@ -206,6 +235,6 @@ export function useSearch() {
     stages,
     totalElapsed,
     search,
-    changePage,
+    loadMore,
   }
 }
@@ -18,4 +18,5 @@ export interface SearchResponse {
   page_size: number
   results: BookResult[]
   total_books: number
+  next_cursor?: string | null
 }